@@ -0,0 +1,245 @@
+"""
+Deterministic generator of large synthetic phenopacket and experiment datasets, built from the test fixtures in
+`tests/data`.
+
+Each record is assembled from the fixtures' parts: its lists (phenotypic features, biosamples, measurements, ...)
+are sampled with varying lengths, and its extra properties are nested to a varying depth, so that record sizes and
+shapes vary like in production data. Record `i` only depends on the seed and `i`, the same seed always produces the
+same dataset, whatever its size or format.
+
+    python -m benchmarks.datagen --count 1000000 --format parquet --output phenopackets-1M.parquet
+    python -m benchmarks.datagen --data-type experiments --count 100000 --output experiments-100K.json
+"""
+
+import argparse
+import copy
+import gzip
+import json
+import os
+import random
+from typing import Iterator
+
+import polars as pl
+
+__all__ = ["DATA_TYPES", "FORMATS", "FIXTURES_DIR", "DatasetGenerator"]
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+
+DATA_TYPES = ("phenopackets", "experiments")
+FORMATS = ("json", "jsonl", "jsonl.gz", "parquet")
+
+# Phenopacket lists sampled from the fixtures, with their min number of items
+PHENOPACKET_LISTS = {
+    "phenotypic_features": 0,
+    "biosamples": 1,
+    "measurements": 0,
+    "medical_actions": 0,
+    "interpretations": 0,
+    "diseases": 0,
+}
+
+
+def _pool(records: list[dict], field: str) -> list:
+    return [item for record in records for item in record.get(field, [])]
+
+
+class DatasetGenerator:
+    """
+    - `max_items`: max number of items of each list of a record, lengths are skewed towards short lists
+    - `max_depth`: max nesting depth of the extra properties of a record
+    - `experiments_per_phenopacket`: experiments reference the biosamples of the phenopacket with the same
+      `index // experiments_per_phenopacket`, so that both datasets can be loaded into the same dataset
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        max_items: int = 8,
+        max_depth: int = 4,
+        experiments_per_phenopacket: int = 2,
+        fixtures_dir: str = FIXTURES_DIR,
+    ):
+        if max_items < 1 or max_depth < 0 or experiments_per_phenopacket < 1:
+            raise ValueError(
+                "max_items and experiments_per_phenopacket must be positive, max_depth must not be negative"
+            )
+        self.seed = seed
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.experiments_per_phenopacket = experiments_per_phenopacket
+
+        with open(os.path.join(fixtures_dir, "synthetic_phenopackets_v2.json")) as f:
+            self._phenopackets = json.load(f)
+        with open(os.path.join(fixtures_dir, "synthetic_experiments.json")) as f:
+            experiments = json.load(f)
+        self._experiments = experiments["experiments"]
+        self.resources = experiments["resources"]
+
+        self._pools = {
+            field: _pool(self._phenopackets, field) for field in PHENOPACKET_LISTS
+        }
+        self._experiment_results = _pool(self._experiments, "experiment_results")
+        self._extra_properties = [
+            (key, value)
+            for record in self._phenopackets
+            for key, value in record["subject"].get("extra_properties", {}).items()
+        ]
+
+    def _random(self, data_type: str, index: int) -> random.Random:
+        # Seeded per record, so that any slice of a dataset can be generated on its own
+        return random.Random(f"{self.seed}:{data_type}:{index}")
+
+    def _length(self, rng: random.Random, minimum: int = 0) -> int:
+        # Most lists are short, a few are up to max_items long
+        return min(self.max_items, minimum + int(rng.expovariate(0.5)))
+
+    def _sample(self, rng: random.Random, pool: list, minimum: int = 0) -> list:
+        if not pool:
+            return []
+        return [
+            copy.deepcopy(rng.choice(pool)) for _ in range(self._length(rng, minimum))
+        ]
+
+    def _extra_properties_tree(self, rng: random.Random, depth: int) -> dict:
+        properties = dict(
+            rng.sample(self._extra_properties, k=min(3, len(self._extra_properties)))
+        )
+        if depth > 0:
+            # Always nested under the same key, the records' shapes only differ by their depth
+            properties["details"] = self._extra_properties_tree(rng, depth - 1)
+        return properties
+
+    def phenopacket(self, index: int) -> dict:
+        rng = self._random("phenopackets", index)
+        template = self._phenopackets[index % len(self._phenopackets)]
+        subject_id = f"{template['subject']['id']}-{index}"
+
+        record = {
+            "id": f"{template['id']}-{index}",
+            "subject": copy.deepcopy(template["subject"]),
+            "meta_data": copy.deepcopy(template["meta_data"]),
+        }
+        record["subject"]["id"] = subject_id
+        record["subject"]["extra_properties"] = self._extra_properties_tree(
+            rng, rng.randint(0, self.max_depth)
+        )
+
+        for field, minimum in PHENOPACKET_LISTS.items():
+            items = self._sample(rng, self._pools[field], minimum)
+            if items:
+                record[field] = items
+
+        for position, biosample in enumerate(record["biosamples"]):
+            biosample["id"] = f"{subject_id}-{position}"
+            if "individual_id" in biosample:
+                biosample["individual_id"] = subject_id
+        for position, interpretation in enumerate(record.get("interpretations", [])):
+            interpretation["id"] = f"{subject_id}-interpretation-{position:03}"
+        return record
+
+    def experiment(self, index: int) -> dict:
+        rng = self._random("experiments", index)
+        record = copy.deepcopy(self._experiments[index % len(self._experiments)])
+        record["id"] = f"{record['id']}-{index}"
+
+        phenopacket = self.phenopacket(index // self.experiments_per_phenopacket)
+        record["biosample"] = rng.choice(phenopacket["biosamples"])["id"]
+
+        results = self._sample(rng, self._experiment_results)
+        for position, result in enumerate(results):
+            result["identifier"] = f"{record['id']}-{position:02}"
+        if results:
+            record["experiment_results"] = results
+        else:
+            record.pop("experiment_results", None)
+        return record
+
+    def records(self, data_type: str, count: int, start: int = 0) -> Iterator[dict]:
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"Unsupported data type {data_type}")
+        generate = self.phenopacket if data_type == "phenopackets" else self.experiment
+        return (generate(index) for index in range(start, start + count))
+
+    def write(
+        self,
+        path: str,
+        count: int,
+        data_type: str = "phenopackets",
+        file_format: str = "",
+    ) -> str:
+        """
+        Writes `count` records to `path`, in the format of its extension unless `file_format` is given.
+        Records are streamed to disk, not built in memory.
+
+        JSON experiments are written as an object with the experiments and their resources, like Katsu ingests
+        them. JSONL and Parquet datasets have a record per line/row.
+        """
+        file_format = file_format or next(
+            (
+                f
+                for f in sorted(FORMATS, key=len, reverse=True)
+                if path.endswith(f".{f}")
+            ),
+            "",
+        )
+        if file_format not in FORMATS:
+            raise ValueError(f"Unsupported dataset format {file_format or path}")
+
+        records = self.records(data_type, count)
+        tmp_path = f"{path}.tmp"
+        if file_format == "json":
+            with open(tmp_path, "w") as f:
+                f.write('{"experiments":[' if data_type == "experiments" else "[")
+                for index, record in enumerate(records):
+                    f.write(("," if index else "") + json.dumps(record))
+                if data_type == "experiments":
+                    f.write(f'],"resources":{json.dumps(self.resources)}}}')
+                else:
+                    f.write("]")
+        elif file_format in ("jsonl", "jsonl.gz"):
+            opener = gzip.open if file_format == "jsonl.gz" else open
+            with opener(tmp_path, "wt") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+        else:
+            jsonl_path = f"{path}.jsonl.tmp"
+            try:
+                with open(jsonl_path, "w") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in records)
+                # The schema is the union of all the records' shapes, it is inferred from the whole file
+                pl.scan_ndjson(jsonl_path, infer_schema_length=None).sink_parquet(
+                    tmp_path
+                )
+            finally:
+                os.remove(jsonl_path)
+
+        os.replace(tmp_path, path)
+        return path
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, required=True, help="number of records")
+    parser.add_argument("--data-type", choices=DATA_TYPES, default="phenopackets")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="",
+        help="defaults to the output's extension",
+    )
+    parser.add_argument("--output", required=True, help="file to write the dataset to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-items", type=int, default=8, help="max number of items per list"
+    )
+    parser.add_argument(
+        "--max-depth", type=int, default=4, help="max nesting depth of extra properties"
+    )
+    args = parser.parse_args(argv)
+
+    generator = DatasetGenerator(args.seed, args.max_items, args.max_depth)
+    path = generator.write(args.output, args.count, args.data_type, args.format)
+    print(f"{args.count} {args.data_type} written to {path}")
+
+
+if __name__ == "__main__":
+    main()
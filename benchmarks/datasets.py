@@ -0,0 +1,27 @@
+"""
+Benchmark datasets, generated once per size and format and reused by the following runs.
+"""
+
+import os
+
+from benchmarks.datagen import FORMATS, DatasetGenerator
+
+__all__ = ["FORMATS", "dataset_name", "write_dataset"]
+
+
+def dataset_name(count: int, file_format: str) -> str:
+    return f"phenopackets-{count}.{file_format}"
+
+
+def write_dataset(data_dir: str, count: int, file_format: str) -> str:
+    """
+    Writes a dataset of `count` generated phenopackets, returns its path.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported dataset format {file_format}")
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, dataset_name(count, file_format))
+    if not os.path.exists(path):
+        DatasetGenerator().write(path, count, file_format=file_format)
+    return path
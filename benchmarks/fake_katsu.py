@@ -0,0 +1,132 @@
+"""
+Local stand-in for Katsu's ingest endpoints, the OIDC token endpoint used by loaders, and an HTTP data source for the
+API fetch extractor.
+
+Each ingest request waits for a latency drawn around `latency_ms`, and fails with `error_status` at `error_rate`.
+Draws are seeded, so that two benchmark runs see the same sequence of latencies and errors.
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import FileResponse
+
+__all__ = ["FakeKatsu"]
+
+
+class FakeKatsu:
+    def __init__(
+        self,
+        data_dir: str,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: int = 0,
+    ):
+        self.data_dir = data_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self.app = self._create_app()
+        self.reset()
+
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+        self.url = ""
+
+    def reset(self):
+        self._random = random.Random(self.seed)
+        self.stats = {"requests": 0, "errors": 0, "records": 0, "bytes": 0}
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/openid-configuration")
+        async def openid_configuration():
+            return {"token_endpoint": f"{self.url}/token"}
+
+        @app.post("/token")
+        async def token():
+            return {"access_token": "benchmark", "token_type": "Bearer"}
+
+        @app.post("/ingest/{dataset_id}/{data_type}")
+        async def ingest(dataset_id: str, data_type: str, request: Request):
+            body = await request.body()
+            latency = max(
+                0.0, self._random.gauss(self.latency_ms, self.jitter_ms) / 1000
+            )
+            failed = self._random.random() < self.error_rate
+            await asyncio.sleep(latency)
+
+            self.stats["requests"] += 1
+            self.stats["bytes"] += len(body)
+            if failed:
+                self.stats["errors"] += 1
+                return Response(status_code=self.error_status)
+
+            data = json.loads(body)
+            records = data["experiments"] if isinstance(data, dict) else data
+            self.stats["records"] += len(records)
+            return Response(status_code=204)
+
+        @app.get("/data/{name}")
+        async def data(name: str, request: Request):
+            # Pre-compressed files are served with a Content-Encoding, like a web server would
+            path = os.path.join(self.data_dir, name)
+            accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+            if accepts_gzip and os.path.isfile(f"{path}.gz"):
+                return FileResponse(
+                    f"{path}.gz",
+                    media_type="application/octet-stream",
+                    headers={"Content-Encoding": "gzip"},
+                )
+            return FileResponse(path, media_type="application/octet-stream")
+
+        @app.get("/_stats")
+        async def stats():
+            return self.stats
+
+        @app.post("/_stats/reset")
+        async def reset_stats():
+            self.reset()
+            return self.stats
+
+        return app
+
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+        config = uvicorn.Config(
+            self.app, host="127.0.0.1", port=port, log_level="warning"
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
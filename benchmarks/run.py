@@ -0,0 +1,449 @@
+"""
+End-to-end benchmarks of ETL jobs, run against local stand-ins instead of real services:
+- Katsu: `FakeKatsu`, an ingest endpoint with configurable latency and errors, which also serves the datasets
+  over HTTP for the API fetch extractor
+- S3: moto's in-process S3 mock, or any S3-compatible service (e.g. MinIO) when `AWS_ENDPOINT_URL` is set
+
+Each case (extractor source, file format, dataset size) runs a full job in its own process, so that peak memory is
+not shared between cases. Results are written as JSON with the commit they were measured on, and can be compared
+with the results of another commit with `--baseline`.
+
+    python -m benchmarks.run --sizes 1000,100000 --cases s3:jsonl,local:parquet,api:json --output results.json
+    python -m benchmarks.run --sizes 1000,100000 --cases s3:jsonl --baseline results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from benchmarks.datasets import FORMATS, dataset_name, write_dataset
+from benchmarks.fake_katsu import FakeKatsu
+
+__all__ = ["main", "percentile"]
+
+SOURCES = ("s3", "local", "api")
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), ".data")
+
+# Metrics compared with the baseline, and whether higher is better
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "upload_latency_p95_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def case_id(case: dict) -> str:
+    return (
+        f"{case['source']}:{case['format']}:{case['size']}"
+        f":batch={case['load_batch_size']}:validate={case['validate']}"
+    )
+
+
+def _case_env(case: dict, katsu_url: str, data_dir: str, work_dir: str) -> dict:
+    env = {
+        **os.environ,
+        "BENTO_AUTHZ_SERVICE_URL": "https://authz.local",
+        "BENTO_JSON_LOGS": "true",
+        "LOG_LEVEL": "warning",
+        "KATSU_URL": f"{katsu_url}/",
+        "BENTO_OPENID_CONFIG_URL": f"{katsu_url}/openid-configuration",
+        "S3_BUCKET": os.environ.get("S3_BUCKET", "benchmarks"),
+        "LOCAL_EXTRACT_DIR": data_dir,
+        "DB_NAME": os.path.join(work_dir, "bento_etl.db"),
+        "DEAD_LETTER_DIR": os.path.join(work_dir, "dead_letters"),
+        "EXTRACT_CACHE_TTL": "0",
+        "EXTRACT_BATCH_SIZE": str(case["extract_batch_size"]),
+        "PIPELINE_LOAD_CONCURRENCY": str(case["load_concurrency"]),
+    }
+    if "AWS_ENDPOINT_URL" not in os.environ:
+        # moto's mock, credentials are never checked
+        env.update(
+            AWS_ACCESS_KEY_ID="benchmarks",
+            AWS_SECRET_ACCESS_KEY="benchmarks",
+            AWS_DEFAULT_REGION="us-east-1",
+        )
+    return env
+
+
+def _extract_step(case: dict, katsu_url: str, data_dir: str, stack: ExitStack):
+    name = dataset_name(case["size"], case["format"])
+    if case["source"] == "local":
+        return {"path": name}
+    if case["source"] == "api":
+        # Compressed datasets are served with a Content-Encoding
+        url_name = name.removesuffix(".gz")
+        return {"type": "api-fetch", "extract_url": f"{katsu_url}/data/{url_name}"}
+
+    import boto3
+
+    if "AWS_ENDPOINT_URL" not in os.environ:
+        from moto import mock_aws
+
+        stack.enter_context(mock_aws())
+    s3 = boto3.client("s3")
+    bucket = os.environ["S3_BUCKET"]
+    if "AWS_ENDPOINT_URL" not in os.environ:
+        s3.create_bucket(Bucket=bucket)
+    s3.upload_file(os.path.join(data_dir, name), bucket, name)
+    return {"object_key": name}
+
+
+def run_case(case: dict, katsu_url: str, data_dir: str) -> dict:
+    """
+    Runs a single job, in the current process. The environment must be set with `_case_env`.
+    """
+    import httpx
+    from sqlmodel import SQLModel, create_engine
+
+    from bento_etl.config import get_config
+    from bento_etl.db import JobStatusDatabase
+    from bento_etl.dead_letter import get_dead_letter_store
+    from bento_etl.extractors.dependencies import get_extractor
+    from bento_etl.loaders.dependencies import get_loader
+    from bento_etl.logger import get_logger
+    from bento_etl.models import Job
+    from bento_etl.routers.jobs import run_pipeline
+    from bento_etl.transformers.dependencies import get_transformer
+    from bento_etl.validators.dependencies import get_validator
+
+    config = get_config()
+    logger = get_logger(config)
+
+    with ExitStack() as stack:
+        job = Job.model_validate(
+            {
+                "extractor": _extract_step(case, katsu_url, data_dir, stack),
+                "transformer": {"type": "None"},
+                "loader": {
+                    "dataset_id": "benchmarks",
+                    "batch_size": case["load_batch_size"],
+                    "data_type": "phenopackets",
+                    "skip_validation": not case["validate"],
+                    "skip_loaded_records": False,
+                },
+            }
+        )
+
+        engine = create_engine(f"sqlite:///{config.db_name}")
+        SQLModel.metadata.create_all(engine)
+        db = JobStatusDatabase(logger, config, engine)
+
+        extractor = get_extractor(job, logger, config)
+        transformer = get_transformer(job, logger)
+        loader = get_loader(job, logger, config)
+        validator = get_validator(job, logger)
+
+        # Client-side latency of each upload, retries of rejected batches included
+        latencies = []
+        load_batch = loader.load_batch
+
+        async def timed_load_batch(client, batch):
+            start = time.perf_counter()
+            try:
+                return await load_batch(client, batch)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        loader.load_batch = timed_load_batch
+
+        httpx.post(f"{katsu_url}/_stats/reset")
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if case["trace_memory"]:
+            tracemalloc.start()
+
+        job_id = db.create_status(job.model_dump(mode="json")).id
+        start = time.perf_counter()
+        asyncio.run(
+            run_pipeline(
+                job_id,
+                extractor,
+                transformer,
+                loader,
+                db,
+                config,
+                validator,
+                get_dead_letter_store(logger, config),
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+        traced_peak = (
+            tracemalloc.get_traced_memory()[1] if case["trace_memory"] else None
+        )
+        tracemalloc.stop()
+        status = db.get_status(job_id)
+        katsu_stats = httpx.get(f"{katsu_url}/_stats").json()
+
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss_unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "case": case_id(case),
+        **case,
+        "status": status.status.value,
+        "error": status.error_message,
+        "elapsed_s": elapsed,
+        "records_loaded": katsu_stats["records"],
+        "throughput_rps": katsu_stats["records"] / elapsed,
+        "uploads": katsu_stats["requests"],
+        "upload_errors": katsu_stats["errors"],
+        "uploaded_mb": katsu_stats["bytes"] / 1024**2,
+        "upload_latency_p50_ms": _ms(percentile(latencies, 50)),
+        "upload_latency_p95_ms": _ms(percentile(latencies, 95)),
+        "upload_latency_p99_ms": _ms(percentile(latencies, 99)),
+        "rss_before_mb": rss_before * 1024 / rss_unit / 1024,
+        "peak_rss_mb": peak_rss * 1024 / rss_unit / 1024,
+        "traced_peak_mb": traced_peak / 1024**2 if traced_peak is not None else None,
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return seconds * 1000 if seconds is not None else None
+
+
+def _median_result(runs: list[dict]) -> dict:
+    result = dict(runs[0])
+    for key, value in runs[0].items():
+        if isinstance(value, float):
+            values = [run[key] for run in runs if run[key] is not None]
+            result[key] = statistics.median(values) if values else None
+    result["repeats"] = len(runs)
+    return result
+
+
+def _run_case_process(case: dict, katsu_url: str, data_dir: str, repo_dir: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bento-etl-bench-") as work_dir:
+        result_file = os.path.join(work_dir, "result.json")
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.run",
+                "--run-case",
+                json.dumps(case),
+                "--katsu-url",
+                katsu_url,
+                "--data-dir",
+                data_dir,
+                "--result-file",
+                result_file,
+            ],
+            cwd=repo_dir,
+            env=_case_env(case, katsu_url, data_dir, work_dir),
+            check=True,
+        )
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def _git_commit(repo_dir: str) -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results: list[dict], baseline: dict[str, dict] | None):
+    header = f"{'case':<52} {'status':<8} {'rec/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['case']:<52} {result['status']:<8} {result['throughput_rps']:>10.0f} "
+            f"{_fmt(result['upload_latency_p50_ms'])} {_fmt(result['upload_latency_p95_ms'])} "
+            f"{_fmt(result['upload_latency_p99_ms'])} {result['peak_rss_mb']:>8.0f}"
+        )
+        previous = (baseline or {}).get(result["case"])
+        if previous:
+            changes = []
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                if result[metric] is None or not previous.get(metric):
+                    continue
+                change = (result[metric] - previous[metric]) / previous[metric] * 100
+                better = (change > 0) == higher_is_better
+                changes.append(
+                    f"{metric} {change:+.1f}% ({'better' if better else 'worse'})"
+                )
+            print(f"{'':<4}vs baseline: {', '.join(changes)}")
+
+
+def _fmt(value: float | None) -> str:
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000",
+        help="comma-separated numbers of phenopackets (default: 1000,10000)",
+    )
+    parser.add_argument(
+        "--cases",
+        default="s3:jsonl,local:jsonl,api:json",
+        help=f"comma-separated source:format pairs, sources: {SOURCES}, formats: {FORMATS}",
+    )
+    parser.add_argument("--load-batch-size", type=int, default=100)
+    parser.add_argument("--load-concurrency", type=int, default=4)
+    parser.add_argument("--extract-batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--no-validation", action="store_true", help="skip schema validation"
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also report the peak of Python allocations with tracemalloc (slows down the jobs)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs per case, the median is reported"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=20.0, help="mean ingest latency"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=5.0, help="ingest latency standard deviation"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of failed ingest requests",
+    )
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=500,
+        help="status code of failed ingest requests",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--data-dir",
+        default=DEFAULT_DATA_DIR,
+        help="directory of the generated datasets",
+    )
+    parser.add_argument("--output", help="file to write the results to, as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+
+    # Internal: runs a single case in a child process
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--katsu-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    args = _parse_args(argv)
+    data_dir = os.path.abspath(args.data_dir)
+
+    if args.run_case:
+        result = run_case(json.loads(args.run_case), args.katsu_url, data_dir)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    cases = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        for pair in args.cases.split(","):
+            source, file_format = pair.split(":", 1)
+            if source not in SOURCES or file_format not in FORMATS:
+                raise SystemExit(f"Unsupported case {pair}")
+            cases.append(
+                {
+                    "source": source,
+                    "format": file_format,
+                    "size": size,
+                    "load_batch_size": args.load_batch_size,
+                    "load_concurrency": args.load_concurrency,
+                    "extract_batch_size": args.extract_batch_size,
+                    "validate": not args.no_validation,
+                    "trace_memory": args.trace_memory,
+                }
+            )
+
+    datasets = {(case["size"], case["format"]) for case in cases}
+    # Compressed datasets fetched over HTTP are served as `.jsonl` with a gzip Content-Encoding
+    datasets |= {
+        (case["size"], "jsonl")
+        for case in cases
+        if case["source"] == "api" and case["format"] == "jsonl.gz"
+    }
+    for size, file_format in sorted(datasets):
+        print(f"Writing dataset {dataset_name(size, file_format)}...")
+        write_dataset(data_dir, size, file_format)
+
+    repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    results = []
+    with FakeKatsu(
+        data_dir,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    ) as katsu:
+        for case in cases:
+            print(f"Running {case_id(case)}...")
+            runs = [
+                _run_case_process(case, katsu.url, data_dir, repo_dir)
+                for _ in range(args.repeat)
+            ]
+            results.append(_median_result(runs))
+
+    report = {
+        "metadata": {
+            "commit": _git_commit(repo_dir),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "s3": os.environ.get("AWS_ENDPOINT_URL", "moto"),
+            "katsu": {
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate,
+                "error_status": args.error_status,
+                "seed": args.seed,
+            },
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["case"]: result for result in json.load(f)["results"]}
+    _print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Startup time benchmark of the service, as seen by a new replica: each run starts a fresh Python process which
+imports `bento_etl.main` and builds the app, then runs the app's startup and serves its first request.
+
+Heavy backends (Polars, boto3, the validation schemas) are imported by the jobs that use them, the modules loaded
+at startup are reported so that a new import on the startup path is caught even when it is fast on this machine.
+
+    python -m benchmarks.startup --repeat 20 --output startup.json
+    python -m benchmarks.startup --repeat 20 --baseline startup.json --max-regression 10
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+__all__ = ["main", "HEAVY_MODULES"]
+
+# Modules that must not be imported at startup
+HEAVY_MODULES = (
+    "polars",
+    "boto3",
+    "botocore",
+    "bento_etl.extractors.s3_extractor",
+    "bento_etl.validators.phenopackets_validator",
+    "bento_etl.validators.experiments_validator",
+)
+
+# Metrics compared with the baseline, lower is better
+COMPARED_METRICS = ("import_ms", "ready_ms")
+
+
+def _startup_env(work_dir: str) -> dict:
+    return {
+        **os.environ,
+        "BENTO_AUTHZ_SERVICE_URL": "https://authz.local",
+        "AUTHZ_ENABLED": "false",
+        "BENTO_JSON_LOGS": "true",
+        "LOG_LEVEL": "warning",
+        "DB_NAME": os.path.join(work_dir, "bento_etl.db"),
+        "PIPELINES_DIR": os.path.join(work_dir, "pipelines"),
+        "SCHEDULER_ENABLED": "false",
+    }
+
+
+def run_once() -> dict:
+    """
+    Measures the startup of the service in the current process, which must not have imported `bento_etl` yet.
+    """
+    start = time.perf_counter()
+    from bento_etl.main import create_app
+
+    app = create_app()
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+
+    # Entering the client runs the app's lifespan, like uvicorn before it accepts connections
+    with TestClient(app) as client:
+        client.get("/service-info").raise_for_status()
+        ready = time.perf_counter()
+
+    return {
+        "import_ms": (imported - start) * 1000,
+        "ready_ms": (ready - start) * 1000,
+        "modules": len(sys.modules),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in sys.modules],
+    }
+
+
+def _run_process(repo_dir: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bento-etl-startup-") as work_dir:
+        result_file = os.path.join(work_dir, "result.json")
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.startup",
+                "--run-once",
+                "--result-file",
+                result_file,
+            ],
+            cwd=repo_dir,
+            env=_startup_env(work_dir),
+            capture_output=True,
+            text=True,
+        )
+        # The startup logs are only shown on failure
+        if process.returncode != 0:
+            sys.stderr.write(process.stdout + process.stderr)
+            raise SystemExit(f"Startup failed with exit code {process.returncode}")
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def summarize(runs: list[dict]) -> dict:
+    from benchmarks.run import percentile
+
+    result = {"repeats": len(runs), "modules": runs[-1]["modules"]}
+    for metric in COMPARED_METRICS:
+        values = [run[metric] for run in runs]
+        result[metric] = statistics.median(values)
+        result[f"{metric}_p95"] = percentile(values, 95)
+    result["heavy_modules"] = sorted({m for run in runs for m in run["heavy_modules"]})
+    return result
+
+
+def compare(result: dict, baseline: dict) -> dict[str, float]:
+    """
+    Returns the change of each metric from the baseline, in percent, positive when slower.
+    """
+    return {
+        metric: (result[metric] - baseline[metric]) / baseline[metric] * 100
+        for metric in COMPARED_METRICS
+        if baseline.get(metric)
+    }
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=10, help="runs, the median is reported"
+    )
+    parser.add_argument("--output", help="file to write the results to, as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="fails if a median is slower than in the baseline by more than this percentage",
+    )
+
+    # Internal: measures a single startup in a child process
+    parser.add_argument("--run-once", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    args = _parse_args(argv)
+
+    if args.run_once:
+        result = run_once()
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    # Imported after the child process branch, benchmarks.run imports Polars to write its datasets
+    from benchmarks.run import _git_commit
+
+    repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    # The first run warms up the bytecode and OS file caches, like an image's layers on a node
+    _run_process(repo_dir)
+    result = summarize([_run_process(repo_dir) for _ in range(args.repeat)])
+
+    print(
+        f"import: {result['import_ms']:.0f} ms (p95 {result['import_ms_p95']:.0f} ms), "
+        f"ready: {result['ready_ms']:.0f} ms (p95 {result['ready_ms_p95']:.0f} ms), "
+        f"{result['modules']} modules"
+    )
+
+    failures = []
+    if result["heavy_modules"]:
+        failures.append(f"imported at startup: {', '.join(result['heavy_modules'])}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["result"]
+        changes = compare(result, baseline)
+        print(
+            f"{'':<4}vs baseline: "
+            + ", ".join(
+                f"{metric} {change:+.1f}%" for metric, change in changes.items()
+            )
+        )
+        if args.max_regression is not None:
+            failures.extend(
+                f"{metric} {change:+.1f}% slower than the baseline"
+                for metric, change in changes.items()
+                if change > args.max_regression
+            )
+
+    if args.output:
+        report = {
+            "metadata": {
+                "commit": _git_commit(repo_dir),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "result": result,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if failures:
+        raise SystemExit(f"Startup regression: {'; '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,57 @@
 from bento_lib.auth.middleware.fastapi import FastApiAuthMiddleware
+from bento_lib.auth.permissions import Permission
+from fastapi import Depends, Request
+from functools import lru_cache
 import httpx
 from .config import Config, get_config
 from .logger import get_logger
 
 __all__ = [
-    "authz_middleware",
+    "get_authz_middleware",
+    "dep_public_endpoint",
+    "dep_require_permissions_on_resource",
     "get_bearer_token_from_config",
     "get_bearer_token",
 ]
 
-config = get_config()
-authz_middleware = FastApiAuthMiddleware.build_from_fastapi_pydantic_config(
-    config,
-    get_logger(config),  # pyright: ignore[reportArgumentType]
-)
+
+@lru_cache
+def get_authz_middleware() -> FastApiAuthMiddleware:
+    # Built by the app factory, importing the routers or the bearer token helpers does not read the config
+    config = get_config()
+    return FastApiAuthMiddleware.build_from_fastapi_pydantic_config(
+        config,
+        get_logger(config),  # pyright: ignore[reportArgumentType]
+    )
+
+
+def dep_public_endpoint():
+    """
+    `FastApiAuthMiddleware.dep_public_endpoint`, with the middleware of the app looked up when a request is handled.
+    """
+
+    def _inner(request: Request):
+        return get_authz_middleware().dep_public_endpoint().dependency(request)
+
+    return Depends(_inner)
+
+
+def dep_require_permissions_on_resource(
+    permissions: frozenset[Permission], resource: dict | None = None
+):
+    """
+    `FastApiAuthMiddleware.dep_require_permissions_on_resource`, with the middleware of the app looked up when a
+    request is handled.
+    """
+
+    async def _inner(request: Request):
+        middleware = get_authz_middleware()
+        dependency = middleware.dep_require_permissions_on_resource(
+            permissions, resource
+        ).dependency
+        await dependency(request)
+
+    return Depends(_inner)
 
 
 def get_bearer_token_from_config(config: Config) -> str:
@@ -1,17 +1,46 @@
+import json
+
 from bento_lib.config.pydantic import BentoFastAPIBaseConfig
 from fastapi import Depends
 from functools import lru_cache
-from typing import Annotated
+from pydantic import BaseModel, ConfigDict, field_validator
+from typing import Annotated, Optional
 
 from .constants import SERVICE_GROUP, SERVICE_ARTIFACT
 
 __all__ = [
+    "TransportProfile",
     "Config",
     "get_config",
     "ConfigDependency",
 ]
 
 
+class TransportProfile(BaseModel):
+    """
+    HTTP transport settings of the uploads to a target, see ClientPool.
+    """
+
+    # Hashable, like the config holding it
+    model_config = ConfigDict(frozen=True)
+
+    # Host (and port) of the target using this profile, in LOAD_TRANSPORT_PROFILES
+    host: str = ""
+
+    # Multiplexes the uploads over a few connections, requires the h2 package
+    http2: bool = False
+    max_connections: int = 100
+    # Idle connections kept open between uploads, and for how many seconds
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    # Seconds, None waits forever. Ingesting a large batch can take minutes, hence the long read timeout
+    connect_timeout: Optional[float] = 10.0
+    read_timeout: Optional[float] = 300.0
+    write_timeout: Optional[float] = 60.0
+    # Seconds to wait for a free connection of the pool
+    pool_timeout: Optional[float] = 60.0
+
+
 class Config(BentoFastAPIBaseConfig):
     # Service Info
     service_id: str = f"{SERVICE_GROUP}:{SERVICE_ARTIFACT}"
@@ -30,6 +59,22 @@ class Config(BentoFastAPIBaseConfig):
     # database
     # TODO: mount to volume, allow test with a PG DB
     db_name: str = "bento_etl.db"
+    # SQLAlchemy URL of a database shared by several replicas (e.g. postgresql+psycopg://...), replaces `db_name`
+    database_url: str = ""
+
+    # Directory of the payloads rejected by jobs, see DeadLetterStore
+    dead_letter_dir: str = "dead_letters"
+
+    # Directory of the profiles of the jobs submitted with `profile`, see ProfileStore
+    profile_dir: str = "profiles"
+    # Seconds between two stack samples of a profiled job
+    profile_sample_interval: float = 0.05
+
+    # OpenTelemetry traces, see tracing.configure_tracing
+    # Exporter of the spans: "otlp", "file", or empty to disable tracing
+    otel_traces_exporter: str = ""
+    # File the spans are appended to with the "file" exporter
+    otel_traces_file: str = "traces.jsonl"
 
     # Extractor API auth
     # TODO: temp hack to authenticate with PCGL submission service, replace with a generic OIDC service flow later
@@ -40,6 +85,92 @@ class Config(BentoFastAPIBaseConfig):
 
     s3_bucket: str = ""
 
+    # Root directory of the files extracted by local file extract steps, e.g. a mounted volume
+    local_extract_dir: str = "data"
+
+    # Streaming pipeline
+    # Max number of batches waiting between two stages before the upstream stage blocks
+    pipeline_queue_size: int = 4
+    # Number of concurrent upload requests in the load stage
+    pipeline_load_concurrency: int = 4
+    # Min seconds between two job progress writes to the database
+    pipeline_progress_interval: float = 1.0
+    # Number of records per extracted batch, for sources that can be read incrementally
+    extract_batch_size: int = 1000
+
+    # Extract cache, shared by the jobs extracting the same source, see ExtractCache
+    extract_cache_dir: str = "extract_cache"
+    # Seconds during which a cached source is reused, 0 disables the cache
+    extract_cache_ttl: float = 0.0
+    # Max total size of the cached sources, least recently used sources are evicted first
+    extract_cache_max_bytes: int = 1024**3
+
+    # Bulk job submissions, see JobLimiter
+    # Max number of jobs of bulk submissions running at once
+    job_max_concurrency: int = 8
+    # Max number of jobs of bulk submissions loading into the same dataset at once
+    job_max_concurrency_per_target: int = 2
+
+    # Adaptive concurrency and circuit breaker of the uploads to each target, shared by all jobs, see LoadController
+    load_control_enabled: bool = True
+    # Bounds of the number of uploads to a target running at once
+    load_min_concurrency: int = 1
+    load_max_concurrency: int = 16
+    # Responses slower than this many seconds are a sign of overload and lower the concurrency
+    load_latency_threshold: float = 10.0
+    # Factor applied to the concurrency on signs of overload
+    load_backoff_factor: float = 0.5
+    # Seconds to pause the uploads after a 429 or 503 response without Retry-After header
+    load_throttle_pause: float = 1.0
+    # Max number of retries of an upload throttled with a 429 or 503 response
+    load_throttle_retries: int = 3
+    # Consecutive failed uploads after which the uploads to the target are paused
+    load_breaker_failures: int = 5
+    # Seconds before a probe upload is sent to a paused target
+    load_breaker_cooldown: float = 30.0
+    # Max seconds an upload waits for a paused target, and max pause asked by a Retry-After header
+    load_breaker_max_wait: float = 300.0
+
+    # Max number of requests sent to isolate the rejected records of an upload by bisecting it, 0 disables bisection
+    load_bisect_max_requests: int = 64
+
+    # Unbatched uploads of at least this many records are streamed instead of being encoded in memory first,
+    # 0 disables it
+    load_stream_min_records: int = 1000
+
+    # Transport of the uploads, clients are shared by all jobs, see ClientPool
+    # JSON, e.g. {"http2": true, "read_timeout": 600}
+    load_transport: TransportProfile = TransportProfile()
+    # Profiles of specific targets, e.g. [{"host": "katsu.local", "max_connections": 20}]
+    load_transport_profiles: tuple[TransportProfile, ...] = ()
+
+    @field_validator("load_transport", "load_transport_profiles", mode="before")
+    @classmethod
+    def parse_json(cls, value):
+        # The environment source of bento_lib's config only decodes complex values it knows about
+        return json.loads(value) if isinstance(value, str) else value
+
+    # Job queue, see JobWorker
+    # Submitted jobs are queued in the database and run by worker processes instead of the API process
+    job_queue_enabled: bool = False
+    # Max number of jobs running at once in a worker
+    worker_concurrency: int = 4
+    # Seconds between two checks for queued jobs by a worker with free slots
+    worker_poll_interval: float = 2.0
+    # Seconds a job stays claimed by a worker without a heartbeat, before other workers can claim it again
+    worker_lease_seconds: float = 60.0
+    # Max number of claims of a job, e.g. by workers that crashed while running it, before it fails
+    worker_max_attempts: int = 3
+
+    # Pipeline definitions
+    pipelines_dir: str = "pipelines"
+    # Refuses to start the service if a pipeline file is malformed
+    pipelines_fail_on_error: bool = True
+    # Runs the pipeline definitions that have a schedule, see PipelineScheduler
+    scheduler_enabled: bool = True
+    # Seconds between two checks for due pipelines
+    scheduler_interval: float = 30.0
+
 
 @lru_cache
 def get_config():
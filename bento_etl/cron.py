@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+__all__ = ["CronSchedule"]
+
+# Bounds of the 5 cron fields: minute, hour, day of month, month, day of week (0 and 7 are Sunday)
+FIELD_BOUNDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# Leap days can be more than a year apart
+MAX_SEARCH = timedelta(days=366 * 8)
+
+
+def _parse_field(field: str, low: int, high: int) -> set[int]:
+    values = set()
+    for part in field.split(","):
+        value_range, _, step = part.partition("/")
+        if value_range == "*":
+            start, end = low, high
+        elif "-" in value_range:
+            start, end = (int(v) for v in value_range.split("-", 1))
+        else:
+            start = int(value_range)
+            # "a/n" means every n from a, a lone value only matches itself
+            end = high if step else start
+
+        step_value = int(step) if step else 1
+        if start < low or end > high or start > end or step_value < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step_value))
+    return values
+
+
+class CronSchedule:
+    """
+    Standard 5 fields cron expression: `minute hour day-of-month month day-of-week`.
+
+    Fields support `*`, values, ranges (`1-5`), lists (`1,15`) and steps (`*/15`, `0-30/10`).
+    As in cron, when both day fields are restricted a day matches if either of them matches.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Cron expression must have 5 fields, got {len(fields)}: {expression}"
+            )
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, low, high)
+            for field, (low, high) in zip(fields, FIELD_BOUNDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_matches = dt.day in self.days
+        weekday_matches = dt.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def next_after(self, dt: datetime) -> datetime:
+        """
+        Returns the first time matching the schedule strictly after `dt`, at minute precision.
+        """
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + MAX_SEARCH
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(
+                    year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression}")
@@ -1,42 +1,256 @@
 from typing import Annotated, Any, Sequence
 from functools import lru_cache
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import UUID
 from typing import Optional
 
 from fastapi import Depends, HTTPException
-from sqlmodel import Session, SQLModel, create_engine, select
-from sqlalchemy import Engine
+from sqlmodel import Session, SQLModel, and_, col, create_engine, func, or_, select
+from sqlalchemy import Engine, inspect, literal, text, update
 
 from bento_etl.logger import BoundLogger, LoggerDependency
-from bento_etl.models import JobStatus, JobStatusType
+from bento_etl.models import (
+    JobGroupStatus,
+    JobStatus,
+    JobStatusType,
+    PipelineSchedule,
+    PipelineWatermark,
+)
 from bento_etl.config import Config, ConfigDependency
 
 __all__ = [
+    "FINAL_STATUSES",
     "JobStatusDatabase",
     "get_job_status_db",
     "JobStatusDatabaseDependency",
 ]
 
+FINAL_STATUSES = (JobStatusType.SUCCESS, JobStatusType.ERROR)
+
 
 class JobStatusDatabase:
     def __init__(
         self, logger: BoundLogger, config: Config, engine: Optional[Engine] = None
     ):
-        self.engine = engine or create_engine(f"sqlite:///{config.db_name}", echo=True)
+        self.engine = engine or create_engine(
+            config.database_url or f"sqlite:///{config.db_name}", echo=True
+        )
         self.logger = logger
 
     def setup(self):
         SQLModel.metadata.create_all(self.engine)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self):
+        """
+        Adds the columns of the models missing from tables created by an older version of the service, `create_all`
+        only creates missing tables. New columns must be nullable or have a scalar default (e.g. `attempts`).
+        """
+        inspector = inspect(self.engine)
+        quote = self.engine.dialect.identifier_preparer.quote
+        with self.engine.begin() as connection:
+            for table in SQLModel.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {
+                    column["name"] for column in inspector.get_columns(table.name)
+                }
+                added = [
+                    column for column in table.columns if column.name not in existing
+                ]
+                for column in added:
+                    definition = f"{quote(column.name)} {column.type.compile(dialect=self.engine.dialect)}"
+                    if not column.nullable:
+                        if column.default is None or not column.default.is_scalar:
+                            raise RuntimeError(
+                                f"Cannot add column {table.name}.{column.name} without a default"
+                            )
+                        default = literal(column.default.arg).compile(
+                            dialect=self.engine.dialect,
+                            compile_kwargs={"literal_binds": True},
+                        )
+                        definition += f" NOT NULL DEFAULT {default}"
+                    self.logger.info(
+                        f"Adding column {column.name} to table {table.name}"
+                    )
+                    connection.execute(
+                        text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {definition}")
+                    )
+                for index in table.indexes:
+                    if any(column in added for column in index.columns):
+                        index.create(connection, checkfirst=True)
 
-    def create_status(self, job_data: dict[str, Any]) -> JobStatus:
+    def create_status(
+        self, job_data: dict[str, Any], queue_key: str | None = None
+    ) -> JobStatus:
+        # Jobs with a `queue_key` are run by workers, see claim_job
         with Session(self.engine) as session:
-            job = JobStatus(status=JobStatusType.SUBMITTED, job_data=job_data)
+            job = JobStatus(
+                status=JobStatusType.SUBMITTED, job_data=job_data, queue_key=queue_key
+            )
             session.add(job)
             session.commit()
             session.refresh(job)
             return job
 
+    def create_statuses(
+        self,
+        jobs_data: list[dict[str, Any]],
+        group_id: UUID | None = None,
+        queue_keys: list[str] | None = None,
+        shards: list[list[dict[str, Any]]] | None = None,
+    ) -> list[JobStatus]:
+        """
+        Creates the statuses of a group of jobs in a single transaction, returns them in the order of `jobs_data`.
+
+        Jobs with `shards` are queued as the jobs of their shards, see `Job.shard_jobs` and `merge_shards`. The shards
+        share the queue key of their job, they count against its datasets' concurrency limit.
+        """
+        with Session(self.engine) as session:
+            jobs = []
+            for index, job_data in enumerate(jobs_data):
+                job_queue_key = queue_keys[index] if queue_keys else None
+                job_shards = shards[index] if shards else []
+                job = JobStatus(
+                    status=JobStatusType.SUBMITTED,
+                    job_data=job_data,
+                    group_id=group_id,
+                    queue_key=None if job_shards else job_queue_key,
+                )
+                jobs.append(job)
+                session.add(job)
+                session.add_all(
+                    JobStatus(
+                        status=JobStatusType.SUBMITTED,
+                        job_data=shard_data,
+                        parent_id=job.id,
+                        queue_key=job_queue_key,
+                    )
+                    for shard_data in job_shards
+                )
+            session.commit()
+            for job in jobs:
+                session.refresh(job)
+            return jobs
+
+    def get_shards(self, parent_id: UUID) -> Sequence[JobStatus]:
+        with Session(self.engine) as session:
+            return self._get_shards(session, parent_id)
+
+    @staticmethod
+    def _merge_shards(parent: JobStatus, shards: Sequence[JobStatus]):
+        """
+        Sets the status of a sharded job from the statuses of its shards:
+        - Successful once all of its shards are, failed once all of them finished and any failed
+        - Otherwise at the furthest stage reached by any running shard
+        - Its progress sums the counters of the shards' progress, with the number of shards in each status
+
+        The stored status of the job is only merged when one of its shards finishes or is retried, not on every
+        progress update of its shards. Reads of the job merge the progress of its running shards, see `get_status`.
+        """
+        statuses = [shard.status for shard in shards]
+        progress: dict[str, Any] = {
+            "shards": {status.value: statuses.count(status) for status in set(statuses)}
+        }
+        for shard in shards:
+            for name, value in (shard.progress or {}).items():
+                if isinstance(value, int):
+                    progress[name] = progress.get(name, 0) + value
+        parent.progress = progress
+
+        if all(status == JobStatusType.SUCCESS for status in statuses):
+            parent.status = JobStatusType.SUCCESS
+            parent.completed_at = parent.completed_at or datetime.now()
+            parent.error_message = None
+        elif all(status in FINAL_STATUSES for status in statuses):
+            failed = [
+                f"shard {index}: {shard.error_message}"
+                for index, shard in enumerate(shards)
+                if shard.status == JobStatusType.ERROR
+            ]
+            parent.status = JobStatusType.ERROR
+            parent.error_message = (
+                f"{len(failed)} of {len(shards)} shards failed, {'; '.join(failed)}"
+            )
+            parent.error_at = parent.error_at or datetime.now()
+        else:
+            stages = list(JobStatusType)
+            parent.status = max(
+                (status for status in statuses if status not in FINAL_STATUSES),
+                key=stages.index,
+            )
+            parent.error_message = None
+
+    def _store_merged_shards(self, session: Session, parent_id: UUID):
+        # Locks the job first (its row on Postgres, the database on SQLite), shards finishing at the same time are
+        # merged one after the other, the last one sees all of them
+        session.exec(  # type: ignore
+            update(JobStatus)
+            .where(col(JobStatus.id) == parent_id)
+            .values(status=JobStatus.status)
+        )
+        parent = session.get(JobStatus, parent_id, populate_existing=True)
+        if parent is None:
+            session.rollback()
+            return
+        self._merge_shards(parent, self._get_shards(session, parent_id))
+        session.add(parent)
+        session.commit()
+
+    @staticmethod
+    def _get_shards(session: Session, parent_id: UUID) -> Sequence[JobStatus]:
+        return session.exec(
+            select(JobStatus)
+            .where(JobStatus.parent_id == parent_id)
+            .order_by(col(JobStatus.created_at))
+        ).all()
+
+    def retry_shards(self, parent_id: UUID) -> list[UUID]:
+        """
+        Queues the failed shards of a sharded job again, returns their IDs.
+        Successful shards are not run again, they are the checkpoints of the job.
+        """
+        with Session(self.engine) as session:
+            shards = session.exec(
+                select(JobStatus).where(
+                    JobStatus.parent_id == parent_id,
+                    JobStatus.status == JobStatusType.ERROR,
+                )
+            ).all()
+            for shard in shards:
+                shard.status = JobStatusType.SUBMITTED
+                shard.error_message = None
+                shard.error_at = None
+                shard.progress = None
+                shard.worker_id = None
+                shard.lease_expires_at = None
+                shard.attempts = 0
+                session.add(shard)
+            session.commit()
+            shard_ids = [shard.id for shard in shards]
+            if shards:
+                self._store_merged_shards(session, parent_id)
+            return shard_ids
+
+    def get_group_status(self, group_id: UUID) -> JobGroupStatus:
+        with Session(self.engine) as session:
+            statuses = session.exec(
+                select(JobStatus.status).where(JobStatus.group_id == group_id)
+            ).all()
+        if not statuses:
+            raise HTTPException(
+                status_code=404, detail=f"Job group {group_id} not found in database"
+            )
+
+        counts = {status: statuses.count(status) for status in set(statuses)}
+        done = counts.get(JobStatusType.SUCCESS, 0) + counts.get(JobStatusType.ERROR, 0)
+        return JobGroupStatus(
+            group_id=group_id,
+            total=len(statuses),
+            statuses=counts,
+            completed=done == len(statuses),
+        )
+
     def update_status(
         self, job_id: UUID, status: JobStatusType, error_info: str | None = None
     ) -> JobStatus:
@@ -54,6 +268,23 @@ class JobStatusDatabase:
                 job.error_message = error_info
                 job.error_at = datetime.now()
 
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            if job.parent_id is not None and job.status in FINAL_STATUSES:
+                self._store_merged_shards(session, job.parent_id)
+                session.refresh(job)
+            return job
+
+    def update_progress(self, job_id: UUID, progress: dict[str, Any]) -> JobStatus:
+        with Session(self.engine) as session:
+            job = session.get(JobStatus, job_id)
+            if not job:
+                error_message = f"Requested job with id {job_id} is not found in database. Cannot update progress"
+                self.logger.error(error_message)
+                raise ValueError(error_message)
+
+            job.progress = progress
             session.add(job)
             session.commit()
             session.refresh(job)
@@ -61,7 +292,17 @@ class JobStatusDatabase:
 
     def get_all_status(self) -> Sequence[JobStatus]:
         with Session(self.engine) as session:
-            return session.exec(select(JobStatus)).all()
+            jobs = session.exec(select(JobStatus)).all()
+            # Merged in memory only, not stored, see _merge_shards
+            session.expunge_all()
+        shards: dict[UUID, list[JobStatus]] = {}
+        for job in sorted(jobs, key=lambda job: job.created_at):
+            if job.parent_id is not None:
+                shards.setdefault(job.parent_id, []).append(job)
+        for job in jobs:
+            if job.id in shards and job.status not in FINAL_STATUSES:
+                self._merge_shards(job, shards[job.id])
+        return jobs
 
     def get_status(self, job_id: UUID) -> JobStatus:
         with Session(self.engine) as session:
@@ -71,6 +312,11 @@ class JobStatusDatabase:
                 raise HTTPException(
                     status_code=404, detail=f"Job {job_id} not found in database"
                 )
+            # The progress of running shards is merged when their job is read, it is not stored on every update
+            if result.job_data.get("shards") and result.status not in FINAL_STATUSES:
+                shards = self._get_shards(session, job_id)
+                session.expunge_all()
+                self._merge_shards(result, shards)
             return result
 
     def delete_status(self, job_id: UUID):
@@ -78,9 +324,261 @@ class JobStatusDatabase:
             job = session.get(JobStatus, job_id)
             if not job:
                 raise HTTPException(status_code=404, detail="Job not found")
+            for shard in session.exec(
+                select(JobStatus).where(JobStatus.parent_id == job_id)
+            ).all():
+                session.delete(shard)
             session.delete(job)
             session.commit()
 
+    def _running_per_dataset(self, session: Session, now: datetime) -> dict[str, int]:
+        # Queue keys are the datasets of their jobs, joined with commas, see `queue_key`
+        running: dict[str, int] = {}
+        for key, count in session.exec(
+            select(JobStatus.queue_key, func.count())
+            .where(
+                col(JobStatus.queue_key).is_not(None),
+                col(JobStatus.status).not_in(FINAL_STATUSES),
+                col(JobStatus.lease_expires_at) >= now,
+            )
+            .group_by(JobStatus.queue_key)
+        ).all():
+            for dataset in key.split(","):
+                running[dataset] = running.get(dataset, 0) + count
+        return running
+
+    def _lock_datasets(self, session: Session, datasets: list[str]):
+        # Serializes the claims of jobs loading into the same datasets until the transaction ends. On SQLite, the
+        # claim's update locks the whole database instead.
+        if self.engine.dialect.name != "postgresql":
+            return
+        # Always locked in the same order, claims of jobs with several datasets cannot deadlock
+        for dataset in sorted(datasets):
+            session.connection().execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:name))"),
+                {"name": f"bento_etl.claim:{dataset}"},
+            )
+
+    def claim_job(
+        self, worker_id: str, lease_seconds: float, max_running_per_key: int
+    ) -> JobStatus | None:
+        """
+        Claims a queued job for a worker, None if no job can be claimed.
+
+        Claimable jobs are queued jobs that are not finished and not leased, or whose lease expired (their worker
+        stopped sending heartbeats, e.g. it crashed). Datasets are scheduled fairly: the job is the oldest job of the
+        queue key with the fewest running jobs in its datasets, and jobs loading into a dataset with
+        `max_running_per_key` running jobs are skipped.
+
+        Claims are safe across processes: candidates are locked with `FOR UPDATE SKIP LOCKED` on databases with
+        row locks (e.g. Postgres), and the claim itself is a conditional update, which fails if another worker
+        claimed the job first (e.g. on SQLite, which serializes writes instead). The running jobs of the datasets
+        are counted again in the claim's transaction, with the datasets locked, and the claim is rolled back if
+        it exceeds their limit.
+        """
+        now = datetime.now()
+        claimable = and_(
+            col(JobStatus.queue_key).is_not(None),
+            col(JobStatus.status).not_in(FINAL_STATUSES),
+            or_(
+                col(JobStatus.lease_expires_at).is_(None),
+                col(JobStatus.lease_expires_at) < now,
+            ),
+            # A worker late with its heartbeat is still running its jobs, it does not start them twice
+            or_(
+                col(JobStatus.worker_id).is_(None),
+                col(JobStatus.worker_id) != worker_id,
+            ),
+        )
+        with Session(self.engine) as session:
+            # Only orders the candidates, the limits are checked with each claim
+            running = self._running_per_dataset(session, now)
+            oldest = dict(
+                session.exec(
+                    select(JobStatus.queue_key, func.min(JobStatus.created_at))
+                    .where(claimable)
+                    .group_by(JobStatus.queue_key)
+                ).all()
+            )
+            load = {
+                key: max(running.get(dataset, 0) for dataset in key.split(","))
+                for key in oldest
+            }
+            keys = sorted(
+                (key for key in oldest if load[key] < max_running_per_key),
+                key=lambda key: (load[key], oldest[key]),
+            )
+            session.rollback()
+
+            for key in keys:
+                datasets = key.split(",")
+                self._lock_datasets(session, datasets)
+                candidate = session.exec(
+                    select(JobStatus.id)
+                    .where(claimable, JobStatus.queue_key == key)
+                    .order_by(col(JobStatus.created_at))
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).first()
+                if candidate is None:
+                    session.rollback()
+                    continue
+                result = session.exec(  # type: ignore
+                    update(JobStatus)
+                    .where(col(JobStatus.id) == candidate, claimable)
+                    .values(
+                        worker_id=worker_id,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds),
+                        attempts=JobStatus.attempts + 1,
+                    )
+                )
+                if result.rowcount != 1:
+                    session.rollback()
+                    continue
+                # Counts the claim itself
+                running = self._running_per_dataset(session, now)
+                if any(running[dataset] > max_running_per_key for dataset in datasets):
+                    session.rollback()
+                    continue
+                session.commit()
+                return session.get(JobStatus, candidate)
+        return None
+
+    def renew_leases(
+        self, worker_id: str, job_ids: list[UUID], lease_seconds: float
+    ) -> list[UUID]:
+        """
+        Extends the leases of the jobs still claimed by a worker, returns the IDs of the jobs it lost.
+        """
+        if not job_ids:
+            return []
+        with Session(self.engine) as session:
+            session.exec(  # type: ignore
+                update(JobStatus)
+                .where(
+                    col(JobStatus.id).in_(job_ids),
+                    JobStatus.worker_id == worker_id,
+                )
+                .values(
+                    lease_expires_at=datetime.now() + timedelta(seconds=lease_seconds)
+                )
+            )
+            session.commit()
+            kept = set(
+                session.exec(
+                    select(JobStatus.id).where(
+                        col(JobStatus.id).in_(job_ids),
+                        JobStatus.worker_id == worker_id,
+                    )
+                ).all()
+            )
+        return [job_id for job_id in job_ids if job_id not in kept]
+
+    def get_unfinished(self, job_ids: list[UUID]) -> set[UUID]:
+        if not job_ids:
+            return set()
+        with Session(self.engine) as session:
+            return set(
+                session.exec(
+                    select(JobStatus.id).where(
+                        col(JobStatus.id).in_(job_ids),
+                        col(JobStatus.status).not_in(FINAL_STATUSES),
+                    )
+                ).all()
+            )
+
+    def count_unfinished(self, pipeline_name: str) -> int:
+        """
+        Counts the unfinished jobs of a pipeline definition, started by any replica. Shards are counted with their job.
+        """
+        with Session(self.engine) as session:
+            return session.exec(
+                select(func.count()).where(
+                    col(JobStatus.job_data)["name"].as_string() == pipeline_name,
+                    col(JobStatus.parent_id).is_(None),
+                    col(JobStatus.status).not_in(FINAL_STATUSES),
+                )
+            ).one()
+
+    def release_jobs(self, worker_id: str, job_ids: list[UUID]):
+        """
+        Gives up the leases of unfinished jobs, so that other workers can claim them right away.
+        """
+        if not job_ids:
+            return
+        with Session(self.engine) as session:
+            session.exec(  # type: ignore
+                update(JobStatus)
+                .where(
+                    col(JobStatus.id).in_(job_ids),
+                    JobStatus.worker_id == worker_id,
+                    col(JobStatus.status).not_in(FINAL_STATUSES),
+                )
+                .values(worker_id=None, lease_expires_at=None)
+            )
+            session.commit()
+
+    def get_watermark(self, pipeline_name: str) -> dict[str, Any] | None:
+        with Session(self.engine) as session:
+            watermark = session.get(PipelineWatermark, pipeline_name)
+            return watermark.watermark if watermark else None
+
+    def set_watermark(
+        self, pipeline_name: str, watermark: dict[str, Any], job_id: UUID
+    ) -> PipelineWatermark:
+        with Session(self.engine) as session:
+            entry = session.get(PipelineWatermark, pipeline_name) or PipelineWatermark(
+                pipeline_name=pipeline_name, watermark=watermark, job_id=job_id
+            )
+            entry.watermark = watermark
+            entry.job_id = job_id
+            entry.updated_at = datetime.now()
+            session.add(entry)
+            session.commit()
+            session.refresh(entry)
+            return entry
+
+    def delete_watermark(self, pipeline_name: str):
+        with Session(self.engine) as session:
+            watermark = session.get(PipelineWatermark, pipeline_name)
+            if not watermark:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No watermark found for pipeline {pipeline_name}",
+                )
+            session.delete(watermark)
+            session.commit()
+
+    def get_schedule(self, pipeline_name: str) -> PipelineSchedule | None:
+        with Session(self.engine) as session:
+            return session.get(PipelineSchedule, pipeline_name)
+
+    def claim_schedule(
+        self, pipeline_name: str, due: datetime, next_run_at: datetime
+    ) -> bool:
+        """
+        Moves a due schedule to its next run, returns whether this call claimed the due run.
+        Safe across replicas: the run is claimed by the first replica moving the schedule from `due`.
+        """
+        with Session(self.engine) as session:
+            result = session.exec(  # type: ignore
+                update(PipelineSchedule)
+                .where(
+                    PipelineSchedule.pipeline_name == pipeline_name,
+                    PipelineSchedule.next_run_at == due,
+                )
+                .values(next_run_at=next_run_at)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def save_schedule(self, schedule: PipelineSchedule) -> PipelineSchedule:
+        with Session(self.engine) as session:
+            schedule = session.merge(schedule)
+            session.commit()
+            session.refresh(schedule)
+            return schedule
+
 
 @lru_cache
 def get_job_status_db(
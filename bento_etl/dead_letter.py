@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import IO, Annotated, Any, Iterator
+from uuid import UUID
+
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.logger import BoundLogger, LoggerDependency
+
+__all__ = [
+    "DeadLetterStore",
+    "DeadLetterWriter",
+    "get_dead_letter_store",
+    "DeadLetterStoreDependency",
+]
+
+
+def _entry(
+    stage: str, reasons: list[str], payload: Any, branch: str | None
+) -> dict[str, Any]:
+    entry = {
+        "stage": stage,
+        "reasons": reasons,
+        "payload": payload,
+        "rejected_at": datetime.now().isoformat(),
+    }
+    if branch is not None:
+        entry["branch"] = branch
+    return entry
+
+
+class DeadLetterWriter:
+    """
+    Appends the dead letters of a running job to its file, which is kept open until the writer is closed.
+
+    The file is created on the first write, a job without dead letters has no file. Writes are blocking and
+    thread-safe, pipelines call them from worker threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: IO[str] | None = None
+        self._lock = threading.Lock()
+
+    def write(
+        self,
+        stage: str,
+        reasons: list[str],
+        payload: Any,
+        branch: str | None = None,
+    ):
+        line = json.dumps(_entry(stage, reasons, payload, branch)) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                # Appending creates a new gzip member, concatenated members are read back as a single stream
+                self._file = gzip.open(self.path, mode="at", encoding="utf-8")
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class DeadLetterStore:
+    """
+    Local store for the data a job could not load, indexed by job ID.
+
+    Each job has its own gzipped JSONL file, where every line is an entry with:
+    - `stage`: the pipeline stage that rejected the data ("validation" or "load")
+    - `reasons`: the reasons for the rejection, prefixed with the ID of their record for rejected records
+    - `payload`: the rejected data, in the shape expected by the job's loader. Records rejected from the same batch
+      are stored together, in a single payload
+    - `rejected_at`: ISO timestamp of the rejection
+    - `branch`: the branch of a fan-out job that rejected the data, absent for other jobs
+
+    Since payloads are stored after the transform step, they can be re-driven into a new job's loader
+    without re-extracting the source.
+    Running jobs write their dead letters with a `DeadLetterWriter`, the file is complete once the job finished.
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.directory = config.dead_letter_dir
+
+    def path(self, job_id: UUID) -> str:
+        return os.path.join(self.directory, f"{job_id}.jsonl.gz")
+
+    def writer(self, job_id: UUID) -> DeadLetterWriter:
+        """
+        Returns a writer for the dead letters of a job, to close once the job finished.
+        """
+        return DeadLetterWriter(self.path(job_id))
+
+    def add(
+        self,
+        job_id: UUID,
+        stage: str,
+        reasons: list[str],
+        payload: Any,
+        branch: str | None = None,
+    ):
+        # Single entry, running jobs keep a writer open instead
+        writer = self.writer(job_id)
+        try:
+            writer.write(stage, reasons, payload, branch)
+        finally:
+            writer.close()
+
+    def exists(self, job_id: UUID) -> bool:
+        return os.path.isfile(self.path(job_id))
+
+    def entries(self, job_id: UUID) -> Iterator[dict[str, Any]]:
+        if not self.exists(job_id):
+            return
+        with gzip.open(self.path(job_id), mode="rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def delete(self, job_id: UUID):
+        if self.exists(job_id):
+            os.remove(self.path(job_id))
+
+
+@lru_cache
+def get_dead_letter_store(logger: LoggerDependency, config: ConfigDependency):
+    return DeadLetterStore(logger, config)
+
+
+DeadLetterStoreDependency = Annotated[DeadLetterStore, Depends(get_dead_letter_store)]
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import suppress
+from functools import lru_cache
+from typing import Annotated, Any, BinaryIO, Callable, Iterator
+
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.formats import decompress, read_batches
+from bento_etl.logger import BoundLogger, LoggerDependency
+
+__all__ = [
+    "CachedSource",
+    "ExtractCache",
+    "get_extract_cache",
+    "ExtractCacheDependency",
+]
+
+
+class CachedSource:
+    """
+    A source payload stored in the extract cache, with the `info` recorded by its download
+    (e.g. compression, file name, response validators).
+    The payload is not evicted until the source is released, explicitly or once garbage collected.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        version: str | None,
+        info: dict[str, Any],
+        release: Callable[[], None] | None = None,
+    ):
+        self.path = path
+        self.version = version
+        self.info = info
+        self._finalizer = weakref.finalize(self, release) if release else None
+
+    def release(self):
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def read_batches(
+        self,
+        name: str,
+        batch_size: int,
+        columns: list[str] | None = None,
+        shard: tuple[int, int] | None = None,
+    ) -> Iterator[Any]:
+        """
+        Reads the payload like `formats.read_batches`, after decoding the `compression` of its download if any.
+        """
+        compression = self.info.get("compression")
+        if compression is None:
+            # Read from its path, so that local file optimizations apply (e.g. memory-mapping)
+            yield from read_batches(self.path, name, batch_size, columns, shard)
+            return
+        with open(self.path, "rb") as f:
+            yield from read_batches(
+                decompress(f, compression), name, batch_size, columns, shard
+            )
+
+
+class ExtractCache:
+    """
+    On-disk cache of extracted source payloads, shared by the jobs extracting the same source.
+
+    Entries are keyed by the identity of their source (e.g. an S3 object or a URL) and stored as downloaded,
+    compressed payloads stay compressed. An entry is reused while:
+    - it is younger than `EXTRACT_CACHE_TTL` seconds
+    - its version matches the current version of the source, when known (e.g. the ETag of an S3 object)
+
+    The cache is bounded to `EXTRACT_CACHE_MAX_BYTES`, least recently used entries are evicted first. Entries
+    being read by the jobs of this process are not evicted, even if they exceed the size limit.
+    Concurrent extractions of the same source wait for a single download instead of each downloading it.
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.directory = config.extract_cache_dir
+        self.ttl = config.extract_cache_ttl
+        self.max_bytes = config.extract_cache_max_bytes
+        self._lock = threading.Lock()
+        # Downloads in progress, with the number of fetches waiting for them
+        self._downloads: dict[str, tuple[threading.Lock, int]] = {}
+        # Number of unreleased sources of each entry, by data path
+        self._readers: dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        digest = self._digest(key)
+        return (
+            os.path.join(self.directory, f"{digest}.data"),
+            os.path.join(self.directory, f"{digest}.json"),
+        )
+
+    def _source(
+        self, data_path: str, version: str | None, info: dict[str, Any]
+    ) -> CachedSource:
+        # Must be called with the lock held, so that the entry is not evicted in between
+        self._readers[data_path] = self._readers.get(data_path, 0) + 1
+        return CachedSource(
+            data_path, version, info, release=lambda: self._release(data_path)
+        )
+
+    def _release(self, data_path: str):
+        with self._lock:
+            if self._readers[data_path] == 1:
+                del self._readers[data_path]
+            else:
+                self._readers[data_path] -= 1
+
+    def get(self, key: str, version: str | None = None) -> CachedSource | None:
+        data_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                # Marks the entry as recently used
+                os.utime(data_path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+
+            if time.time() - meta["created_at"] > self.ttl:
+                return None
+            if version is not None and meta["version"] != version:
+                return None
+            return self._source(data_path, meta["version"], meta["info"])
+
+    def put(
+        self,
+        key: str,
+        download: Callable[[BinaryIO], dict[str, Any]],
+        version: str | None = None,
+    ) -> CachedSource:
+        """
+        Stores a payload written by `download` in a file, `download` returns the info to store with it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self._paths(key)
+
+        # Written to temporary files first, readers never see a partial payload or meta file
+        info = self._write(data_path, "wb", download)
+        meta = {
+            "key": key,
+            "version": version,
+            "info": info,
+            "created_at": time.time(),
+        }
+        self._write(meta_path, "w", lambda f: json.dump(meta, f))
+
+        with self._lock:
+            entry = self._source(data_path, version, info)
+        self.evict()
+        return entry
+
+    def _write(self, path: str, mode: str, write: Callable[[Any], Any]) -> Any:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as f:
+                result = write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return result
+
+    def fetch(
+        self,
+        key: str,
+        download: Callable[[BinaryIO], dict[str, Any]],
+        version: str | None = None,
+    ) -> CachedSource:
+        """
+        Returns the cached payload of a source, downloading it with `download` on a miss.
+        """
+        if (entry := self.get(key, version)) is not None:
+            self.logger.info(f"Extract cache hit for {key}")
+            return entry
+
+        with self._lock:
+            download_lock, waiting = self._downloads.get(key, (threading.Lock(), 0))
+            self._downloads[key] = (download_lock, waiting + 1)
+        try:
+            with download_lock:
+                # Another job may have downloaded the source while this one was waiting
+                if (entry := self.get(key, version)) is not None:
+                    self.logger.info(f"Extract cache hit for {key}, after waiting")
+                    return entry
+
+                self.logger.info(f"Extract cache miss for {key}, downloading")
+                return self.put(key, download, version)
+        finally:
+            # The lock is dropped once no fetch is waiting for the download
+            with self._lock:
+                waiting = self._downloads[key][1] - 1
+                if waiting == 0:
+                    del self._downloads[key]
+                else:
+                    self._downloads[key] = (download_lock, waiting)
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".data"):
+                    with suppress(FileNotFoundError):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, data_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if data_path in self._readers:
+                    continue
+                self.logger.info(f"Evicting extract cache entry {data_path}")
+                for path in (data_path, data_path.removesuffix(".data") + ".json"):
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+                total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@lru_cache
+def get_extract_cache(logger: LoggerDependency, config: ConfigDependency):
+    return ExtractCache(logger, config)
+
+
+ExtractCacheDependency = Annotated[ExtractCache, Depends(get_extract_cache)]
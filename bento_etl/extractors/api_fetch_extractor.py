@@ -1,10 +1,43 @@
+import hashlib
+from datetime import datetime, timezone
 from logging import Logger
+from typing import Any, BinaryIO, Iterator
+from urllib.parse import urlparse
 import httpx
 
+from bento_etl.extract_cache import CachedSource, ExtractCache
 from bento_etl.extractors.base import BaseExtractor
+from bento_etl.formats import (
+    CONTENT_ENCODINGS,
+    compression_from_encoding,
+    decompress,
+    is_supported,
+    iter_stream,
+    read_batches,
+    to_records,
+    zstd_available,
+)
+from bento_etl.tracing import inject_trace_context, span
+
+# Content types of new-line delimited JSON responses, which are streamed in batches
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
 
 
 class ApiPollExtractor(BaseExtractor):
+    """
+    Fetches data from an HTTP endpoint.
+
+    Responses are streamed and decompressed on the fly, according to their Content-Encoding (gzip, zstd when
+    available). The format of the body is detected from the extension of the URL path
+    (e.g. `/exports/data.jsonl.gz`), or from an NDJSON Content-Type, and defaults to JSON.
+
+    Conditional extractions send the validators (ETag, Last-Modified) of the last successful job's response, an
+    unchanged resource is answered with a 304 and nothing is extracted.
+
+    Non-incremental GET extractions go through the extract cache when it is enabled, jobs fetching the same
+    endpoint within `EXTRACT_CACHE_TTL` seconds share a single download.
+    """
+
     def __init__(
         self,
         logger: Logger,
@@ -12,27 +45,184 @@ class ApiPollExtractor(BaseExtractor):
         http_verb: str = "GET",
         expected_status_code=200,
         bearer_token: str = "",
+        incremental: bool = False,
+        watermark_param: str = "updated_since",
+        batch_size: int = 1000,
+        cache: ExtractCache | None = None,
+        conditional: bool = False,
     ):
         self.endpoint = endpoint
         self.http_verb = http_verb
         self.expected_status_code = expected_status_code
         self.bearer_token = bearer_token
+        # Both modes only extract what changed since the watermark of the last successful job
+        self.incremental = incremental or conditional
+        self.filter_updated = incremental
+        self.conditional = conditional
+        self.watermark_param = watermark_param
+        self.batch_size = batch_size
+        self.cache = cache
+        self._extracted_at: str | None = None
+        self._validators: dict[str, str] = {}
+        self._not_modified = False
         super().__init__(logger)
 
-    def extract(self) -> dict:
-        headers = None
+    def _headers(self) -> dict[str, str]:
+        encodings = "gzip, deflate, zstd" if zstd_available() else "gzip, deflate"
+        headers = {"Accept-Encoding": encodings}
         if self.bearer_token:
-            headers = {"Authorization": f"Bearer {self.bearer_token}"}
-        response = httpx.request(self.http_verb, self.endpoint, headers=headers)
+            headers["Authorization"] = f"Bearer {self.bearer_token}"
+        return headers
 
+    def _conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if not (self.conditional and self.watermark):
+            return headers
+        if etag := self.watermark.get("etag"):
+            headers["If-None-Match"] = etag
+        if last_modified := self.watermark.get("last_modified"):
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    @staticmethod
+    def _response_validators(response: httpx.Response) -> dict[str, str]:
+        validators = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+        return {name: value for name, value in validators.items() if value}
+
+    def _file_name(self, response: httpx.Response) -> str:
+        path = urlparse(self.endpoint).path
+        if is_supported(path):
+            return path
+        if response.headers.get("content-type", "").startswith(NDJSON_CONTENT_TYPES):
+            return "response.jsonl"
+        return "response.json"
+
+    @staticmethod
+    def _raw_body(response: httpx.Response) -> tuple[Iterator[bytes], str | None]:
+        """
+        Returns the chunks of the body as sent, and their compression.
+        """
+        content_encoding = response.headers.get("content-encoding", "").lower()
+        if content_encoding not in CONTENT_ENCODINGS:
+            # Uncompressed, or encodings decoded by httpx itself (e.g. deflate)
+            return response.iter_bytes(), None
+        return response.iter_raw(), compression_from_encoding(content_encoding)
+
+    def _check_status(self, response: httpx.Response):
         if response.status_code != self.expected_status_code:
-            error_message = f"API request failed with response: {response}"
-            self.logger.error(error_message)
-            raise Exception(error_message)
+            raise Exception(f"API request failed with response: {response}")
+
+    def _cache_key(self) -> str:
+        key = f"{self.http_verb} {self.endpoint}"
+        if self.bearer_token:
+            # Responses may depend on the caller's permissions
+            token_digest = hashlib.sha256(self.bearer_token.encode("utf-8"))
+            key += f" {token_digest.hexdigest()}"
+        return key
+
+    def _get_cached(self) -> CachedSource:
+        def download(file: BinaryIO) -> dict:
+            with httpx.stream(
+                self.http_verb, self.endpoint, headers=self._headers()
+            ) as response:
+                self._check_status(response)
+                chunks, compression = self._raw_body(response)
+                for chunk in chunks:
+                    file.write(chunk)
+                return {
+                    "compression": compression,
+                    "name": self._file_name(response),
+                }
+
+        return self.cache.fetch(self._cache_key(), download)
+
+    def _fetch_batches(self, params: dict | None) -> Iterator[Any]:
+        # Incremental extractions must see the latest data, they are never cached
+        if (
+            self.cache
+            and self.cache.enabled
+            and self.http_verb.upper() == "GET"
+            and not self.incremental
+        ):
+            entry = self._get_cached()
+            try:
+                yield from entry.read_batches(entry.info["name"], self.batch_size)
+            finally:
+                entry.release()
+            return
+
+        attributes = {"http.request.method": self.http_verb, "url.full": self.endpoint}
+        # Not the current span, the generator is resumed from different contexts
+        with span(self.http_verb, attributes, current=False) as request_span:
+            headers = {**self._headers(), **self._conditional_headers()}
+            with httpx.stream(
+                self.http_verb,
+                self.endpoint,
+                headers=inject_trace_context(headers),
+                params=params,
+            ) as response:
+                request_span.set_attribute(
+                    "http.response.status_code", response.status_code
+                )
+                if response.status_code == 304 and self.conditional and self.watermark:
+                    self.logger.info(
+                        f"{self.endpoint} not modified since the last successful job, nothing to extract"
+                    )
+                    self._not_modified = True
+                    return
 
+                self._check_status(response)
+                self._validators = self._response_validators(response)
+                chunks, compression = self._raw_body(response)
+                yield from read_batches(
+                    decompress(iter_stream(chunks), compression),
+                    self._file_name(response),
+                    self.batch_size,
+                )
+                request_span.set_attribute(
+                    "http.response.body.size", response.num_bytes_downloaded
+                )
+
+    def extract_batches(self) -> Iterator[Any]:
+        params = None
+        if self.filter_updated and self.watermark:
+            if since := self.watermark.get("extracted_at"):
+                params = {self.watermark_param: since}
+                self.logger.info(f"Fetching data updated since {since}")
+            else:
+                # E.g. the previous jobs of the pipeline only used conditional requests
+                self.logger.info(
+                    "Watermark has no extraction time, fetching all the data"
+                )
+
+        # Taken before the request, so that updates made during the extraction are fetched again by the next job
+        extracted_at = datetime.now(timezone.utc).isoformat()
         try:
-            data = response.json()
+            yield from self._fetch_batches(params)
         except Exception as e:
             self.logger.error(e)
             raise
-        return data
+        self._extracted_at = extracted_at
+
+    def extract(self) -> Any:
+        batches = [to_records(batch) for batch in self.extract_batches()]
+        # A JSON document is a single batch, returned as is
+        if len(batches) == 1:
+            return batches[0]
+        return [record for batch in batches for record in batch]
+
+    def next_watermark(self) -> dict | None:
+        if not self.incremental or self._extracted_at is None:
+            return None
+        if self._not_modified:
+            return self.watermark
+
+        watermark = {}
+        if self.filter_updated:
+            watermark["extracted_at"] = self._extracted_at
+        if self.conditional:
+            watermark.update(self._validators)
+        return watermark
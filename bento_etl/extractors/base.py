@@ -1,4 +1,5 @@
 from logging import Logger
+from typing import Iterator
 
 __all__ = ["BaseExtractor"]
 
@@ -13,10 +14,36 @@ class BaseExtractor:
 
     Concrete extractors should be configured in the constructor and implement the `extract` function, which returns
     a json dict.
+    Extractors that can read their source incrementally should also override `extract_batches`.
+
+    Incremental extractors only extract the data that changed since the `watermark` of the last successful job of
+    their pipeline, and return the watermark to store for the next job with `next_watermark`.
     """
 
+    incremental: bool = False
+
     def __init__(self, logger: Logger):
         self.logger = logger
+        # Set by the job runner before the extraction, None for the first job of a pipeline
+        self.watermark: dict | None = None
 
     def extract(self) -> dict:
         raise NotImplementedError
+
+    def extract_batches(self) -> Iterator:
+        """
+        Yields the extracted data in batches, consumed one at a time by a streaming pipeline.
+
+        Default implementation: yields the whole output of `extract` as a single batch.
+        Overridable: Should be overriden by extractors that can read their source incrementally.
+        """
+        yield self.extract()
+
+    def next_watermark(self) -> dict | None:
+        """
+        Returns the watermark to store once the job succeeds, only valid after the extraction.
+
+        Default implementation: returns None, nothing is stored.
+        Overridable: Should be overriden by incremental extractors.
+        """
+        return None
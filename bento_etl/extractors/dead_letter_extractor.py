@@ -0,0 +1,35 @@
+from logging import Logger
+from typing import Any, Iterator
+from uuid import UUID
+
+from bento_etl.dead_letter import DeadLetterStore
+from bento_etl.extractors.base import BaseExtractor
+
+
+class DeadLetterExtractor(BaseExtractor):
+    """
+    Re-drives the payloads dead-lettered by a previous job, one batch per payload.
+
+    Payloads were stored in their loader's shape, jobs using this extractor should not transform the data again.
+    Only the payloads of the given `branch` are re-driven for fan-out jobs, since each branch has its own loader.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        store: DeadLetterStore,
+        job_id: UUID,
+        branch: str | None = None,
+    ):
+        self.store = store
+        self.job_id = job_id
+        self.branch = branch
+        super().__init__(logger)
+
+    def extract_batches(self) -> Iterator[Any]:
+        if not self.store.exists(self.job_id):
+            raise Exception(f"No dead letters found for job {self.job_id}")
+
+        for entry in self.store.entries(self.job_id):
+            if entry.get("branch") == self.branch:
+                yield entry["payload"]
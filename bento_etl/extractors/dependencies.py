@@ -2,11 +2,20 @@ from fastapi import Depends
 from typing import Annotated
 
 from bento_etl.config import ConfigDependency
+from bento_etl.dead_letter import get_dead_letter_store
+from bento_etl.extract_cache import get_extract_cache
 from bento_etl.extractors.api_fetch_extractor import ApiPollExtractor
-from bento_etl.extractors.s3_extractor import S3Extractor
+from bento_etl.extractors.dead_letter_extractor import DeadLetterExtractor
+from bento_etl.extractors.local_file_extractor import LocalFileExtractor
 from bento_etl.extractors.base import BaseExtractor
 from bento_etl.logger import LoggerDependency
-from bento_etl.models import Job, ApiFetchExtractStep, S3ExtractStep
+from bento_etl.models import (
+    Job,
+    ApiFetchExtractStep,
+    S3ExtractStep,
+    LocalFileExtractStep,
+    DeadLetterExtractStep,
+)
 
 __all__ = ["get_extractor", "ExtractorDep"]
 
@@ -22,9 +31,33 @@ def get_extractor(
             http_verb=job.extractor.http_verb,
             expected_status_code=job.extractor.expected_status_code,
             bearer_token=config.extractor_bearer_token,
+            incremental=job.extractor.incremental,
+            watermark_param=job.extractor.watermark_param,
+            batch_size=config.extract_batch_size,
+            cache=get_extract_cache(logger, config),
+            conditional=job.extractor.conditional,
         )
     elif isinstance(job.extractor, S3ExtractStep):
-        return S3Extractor(logger=logger, config=config, ext_config=job.extractor)
+        # boto3 is slow to import, only the jobs extracting from S3 load it
+        from bento_etl.extractors.s3_extractor import S3Extractor
+
+        return S3Extractor(
+            logger=logger,
+            config=config,
+            ext_config=job.extractor,
+            cache=get_extract_cache(logger, config),
+        )
+    elif isinstance(job.extractor, LocalFileExtractStep):
+        return LocalFileExtractor(
+            logger=logger, config=config, ext_config=job.extractor
+        )
+    elif isinstance(job.extractor, DeadLetterExtractStep):
+        return DeadLetterExtractor(
+            logger=logger,
+            store=get_dead_letter_store(logger, config),
+            job_id=job.extractor.dead_letter_job_id,
+            branch=job.extractor.branch,
+        )
     else:
         raise NotImplementedError
 
@@ -0,0 +1,86 @@
+import glob
+import os
+from logging import Logger
+from typing import Any, Iterator
+
+from bento_etl.config import Config
+from bento_etl.extractors.base import BaseExtractor
+from bento_etl.formats import is_supported, read_batches, shard_files, to_records
+from bento_etl.models import LocalFileExtractStep
+from bento_etl.tracing import span
+
+
+class LocalFileExtractor(BaseExtractor):
+    """
+    Extracts the files matching a glob pattern in `LOCAL_EXTRACT_DIR`, for data already on the ETL node or on a
+    mounted volume. Patterns support `**` to match nested directories.
+
+    Large files are memory-mapped instead of being read in memory: JSONL files are streamed line by line, and
+    Parquet and Arrow IPC files are handed to Polars without copy, then yielded as DataFrame batches.
+    JSON files are yielded whole, as a single batch. See `formats.read_batches` for the supported formats.
+
+    The shard of a sharded job extracts its share of the matching files, or its part of the file if a single
+    file matches, see `Job.shard_jobs`.
+    """
+
+    def __init__(
+        self, logger: Logger, config: Config, ext_config: LocalFileExtractStep
+    ):
+        self.root = os.path.realpath(config.local_extract_dir)
+        self.pattern = ext_config.path
+        self.columns = ext_config.columns
+        self.batch_size = config.extract_batch_size
+        self.shard = (
+            (ext_config.shard.index, ext_config.shard.count)
+            if ext_config.shard
+            else None
+        )
+        super().__init__(logger)
+
+    def _paths(self) -> list[str]:
+        paths = []
+        for path in sorted(
+            glob.glob(os.path.join(self.root, self.pattern), recursive=True)
+        ):
+            path = os.path.realpath(path)
+            if os.path.commonpath([self.root, path]) != self.root:
+                raise Exception(f"File {path} is outside of {self.root}")
+            if not os.path.isfile(path):
+                continue
+            if not is_supported(path):
+                self.logger.info(f"Skipping file {path} with unsupported extension")
+                continue
+            paths.append(path)
+
+        if not paths:
+            raise Exception(f"No files match {self.pattern} in {self.root}")
+        return paths
+
+    def extract(self):
+        data = []
+        for batch in self.extract_batches():
+            records = to_records(batch)
+            data.extend(records if isinstance(records, list) else [records])
+        return data
+
+    def extract_batches(self) -> Iterator[Any]:
+        paths = self._paths()
+        file_shard = None
+        if self.shard and len(paths) > 1:
+            paths = shard_files(
+                {path: os.path.getsize(path) for path in paths}, self.shard
+            )
+            self.logger.info(
+                f"Extracting {len(paths)} file(s) of shard {self.shard[0]}/{self.shard[1]}"
+            )
+        else:
+            file_shard = self.shard
+
+        for path in paths:
+            self.logger.info(f"Extracting local file {path}")
+            attributes = {"etl.file.path": path, "etl.bytes": os.path.getsize(path)}
+            # Not the current span, the generator is resumed from different contexts
+            with span("etl.extract.file", attributes, current=False):
+                yield from read_batches(
+                    path, path, self.batch_size, self.columns, file_shard
+                )
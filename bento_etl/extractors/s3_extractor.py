@@ -1,40 +1,210 @@
 import boto3
-import json
-from botocore.response import StreamingBody
+import os
+import shutil
+from typing import Any, BinaryIO, Iterator
 
 from logging import Logger
 from bento_etl.extractors.base import BaseExtractor
 from bento_etl.models import S3ExtractStep
 from bento_etl.config import Config
+from bento_etl.extract_cache import CachedSource, ExtractCache
+from bento_etl.formats import (
+    compression_from_encoding,
+    decompress,
+    detect_format,
+    is_supported,
+    read_batches,
+    read_line_range,
+    shard_files,
+    shard_range,
+    to_records,
+)
+from bento_etl.tracing import span
 
 
 class S3Extractor(BaseExtractor):
-    def __init__(self, logger: Logger, config: Config, ext_config: S3ExtractStep):
+    """
+    Extracts a single object, or all the objects under a prefix, see `S3ExtractStep`.
+
+    The shard of a sharded job extracts its share of the objects of the prefix, balanced by size, or its part of
+    the single object: uncompressed JSONL objects are read with a ranged request for the shard's byte range only,
+    other formats are downloaded whole, see `Job.shard_jobs`.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        config: Config,
+        ext_config: S3ExtractStep,
+        cache: ExtractCache | None = None,
+    ):
         self.bucket = config.s3_bucket
         self.object_key = ext_config.object_key
+        self.prefix = ext_config.prefix
+        self.incremental = ext_config.incremental
+        self.columns = ext_config.columns
+        self.batch_size = config.extract_batch_size
+        self.cache = cache
+        self.shard = (
+            (ext_config.shard.index, ext_config.shard.count)
+            if ext_config.shard
+            else None
+        )
+        self._etags: dict[str, str] | None = None
+        self._sizes: dict[str, int] = {}
 
         self.s3_client = boto3.client("s3")
         super().__init__(logger)
 
-    def _parse_body(self, body: StreamingBody) -> list[dict]:
-        if self.object_key.endswith(".json"):
-            self.logger.info("Parsing object as JSON")
-            return json.loads(body.read())
-        elif self.object_key.endswith(".jsonl"):
-            self.logger.info("Parsing object as new-line-delimited JSON (JSONL)")
-            data = []
-            for line_bytes in body.iter_lines():
-                line_str = line_bytes.decode("utf-8")
-                data.append(json.loads(line_str))
-            return data
+    def _get_body(self, object_key: str) -> tuple[BinaryIO, int]:
+        """
+        Returns the object's decoded body, and its size as stored.
+        """
+        response: dict = self.s3_client.get_object(Bucket=self.bucket, Key=object_key)
+        # Objects stored with a Content-Encoding are decoded as they are read, like an HTTP client would
+        compression = compression_from_encoding(response.get("ContentEncoding"))
+        return decompress(response["Body"], compression), response["ContentLength"]
+
+    def _read_range(self, object_key: str, shard: tuple[int, int]) -> Iterator[Any]:
+        """
+        Reads the lines of the shard's byte range of an uncompressed JSONL object, see `formats.read_line_range`.
+        Objects stored with a Content-Encoding cannot be read by range, they are read whole.
+        """
+        head = self.s3_client.head_object(Bucket=self.bucket, Key=object_key)
+        if compression_from_encoding(head.get("ContentEncoding")) is not None:
+            body, _ = self._get_body(object_key)
+            yield from read_batches(
+                body, object_key, self.batch_size, self.columns, shard
+            )
+            return
+
+        start, end = shard_range(head["ContentLength"], shard)
+        if start >= end:
+            return
+        # Open-ended, the last line of the range ends after it
+        response = self.s3_client.get_object(
+            Bucket=self.bucket, Key=object_key, Range=f"bytes={max(start - 1, 0)}-"
+        )
+        try:
+            yield from read_line_range(
+                response["Body"], start, end, self.batch_size, self.columns
+            )
+        finally:
+            response["Body"].close()
+
+    def _get_cached(self, object_key: str) -> CachedSource:
+        """
+        Returns the object from the extract cache, as long as its ETag did not change.
+        """
+        if self._etags and object_key in self._etags:
+            etag = self._etags[object_key]
         else:
-            file_ext = self.object_key.split(".")[-1]
-            raise Exception(f"No parsing method supports file extension: {file_ext}")
+            etag = self.s3_client.head_object(Bucket=self.bucket, Key=object_key)[
+                "ETag"
+            ]
 
-    def extract(self):
-        response: dict = self.s3_client.get_object(
-            Bucket=self.bucket, Key=self.object_key
+        def download(file: BinaryIO) -> dict:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=object_key)
+            shutil.copyfileobj(response["Body"], file)
+            return {
+                "compression": compression_from_encoding(
+                    response.get("ContentEncoding")
+                )
+            }
+
+        return self.cache.fetch(f"s3://{self.bucket}/{object_key}", download, etag)
+
+    def _list_etags(self) -> dict[str, str]:
+        if not self.prefix:
+            response = self.s3_client.head_object(
+                Bucket=self.bucket, Key=self.object_key
+            )
+            self._sizes[self.object_key] = response["ContentLength"]
+            return {self.object_key: response["ETag"]}
+
+        etags = {}
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                if is_supported(obj["Key"]):
+                    etags[obj["Key"]] = obj["ETag"]
+                    self._sizes[obj["Key"]] = obj["Size"]
+                else:
+                    self.logger.info(
+                        f"Skipping object {obj['Key']} with unsupported extension"
+                    )
+        return etags
+
+    def _object_keys(self) -> list[str]:
+        """
+        Returns the keys of the objects to extract.
+        In incremental mode, objects with the same ETag as in the watermark are not extracted again.
+        """
+        if not self.prefix and not self.incremental:
+            return [self.object_key]
+
+        self._etags = self._list_etags()
+        if self.shard:
+            keys = shard_files(self._sizes, self.shard)
+            self.logger.info(
+                f"Extracting {len(keys)} of {len(self._etags)} object(s) in shard {self.shard[0]}/{self.shard[1]}"
+            )
+            return keys
+        if not self.incremental:
+            return list(self._etags)
+
+        previous = (self.watermark or {}).get("etags", {})
+        keys = [key for key, etag in self._etags.items() if previous.get(key) != etag]
+        self.logger.info(
+            f"Extracting {len(keys)} changed object(s), "
+            f"{len(self._etags) - len(keys)} unchanged since the last successful job"
         )
+        return keys
+
+    def extract(self):
+        batches = [to_records(batch) for batch in self.extract_batches()]
+        if not self.prefix:
+            # A single JSON object is returned as is
+            if len(batches) == 1 and not isinstance(batches[0], list):
+                return batches[0]
+        return [
+            record
+            for batch in batches
+            for record in (batch if isinstance(batch, list) else [batch])
+        ]
+
+    def extract_batches(self) -> Iterator[Any]:
+        # The objects of a prefix are split between the shards, a single object is split itself
+        object_shard = None if self.prefix else self.shard
+        for key in self._object_keys():
+            # Fails early on unsupported extensions, before downloading the object
+            detect_format(key)
+            self.logger.info(f"Extracting object {key}")
+            attributes = {"etl.s3.bucket": self.bucket, "etl.s3.key": key}
+            # Not the current span, the generator is resumed from different contexts
+            with span("etl.extract.object", attributes, current=False) as object_span:
+                if self.cache and self.cache.enabled:
+                    entry = self._get_cached(key)
+                    object_span.set_attribute("etl.extract_cache", True)
+                    try:
+                        object_span.set_attribute(
+                            "etl.bytes", os.path.getsize(entry.path)
+                        )
+                        yield from entry.read_batches(
+                            key, self.batch_size, self.columns, object_shard
+                        )
+                    finally:
+                        entry.release()
+                elif object_shard and detect_format(key) == ("jsonl", None):
+                    yield from self._read_range(key, object_shard)
+                else:
+                    body, size = self._get_body(key)
+                    object_span.set_attribute("etl.bytes", size)
+                    yield from read_batches(
+                        body, key, self.batch_size, self.columns, object_shard
+                    )
 
-        body: StreamingBody = response["Body"]
-        return self._parse_body(body)
+    def next_watermark(self) -> dict | None:
+        if not self.incremental or self._etags is None:
+            return None
+        return {"etags": self._etags}
@@ -0,0 +1,405 @@
+import gzip
+import io
+import json
+import mmap
+import os
+import sys
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterator
+
+# Polars is imported by the readers of columnar files only, it is not needed at startup nor by JSON jobs
+if TYPE_CHECKING:
+    import polars as pl
+
+__all__ = [
+    "SUPPORTED_EXTENSIONS",
+    "CONTENT_ENCODINGS",
+    "detect_format",
+    "is_supported",
+    "compression_from_encoding",
+    "zstd_available",
+    "decompress",
+    "iter_stream",
+    "shard_range",
+    "shard_files",
+    "read_line_range",
+    "read_batches",
+    "to_records",
+]
+
+FORMATS = {
+    ".json": "json",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+    ".arrow": "ipc",
+    ".ipc": "ipc",
+    ".feather": "ipc",
+}
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+# Columnar formats have their own internal compression
+COMPRESSIBLE_FORMATS = frozenset({"json", "jsonl"})
+# Content-Encoding header values decoded with `decompress`
+CONTENT_ENCODINGS = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd"}
+
+SUPPORTED_EXTENSIONS = tuple(FORMATS) + tuple(
+    f"{ext}{compression_ext}"
+    for ext, file_format in FORMATS.items()
+    if file_format in COMPRESSIBLE_FORMATS
+    for compression_ext in COMPRESSIONS
+)
+
+
+def detect_format(name: str) -> tuple[str, str | None]:
+    """
+    Returns the format and compression of a file from its name, e.g. ("jsonl", "gzip") for `data.jsonl.gz`.
+    """
+    root, ext = os.path.splitext(name.lower())
+    compression = COMPRESSIONS.get(ext)
+    if compression:
+        root, ext = os.path.splitext(root)
+
+    file_format = FORMATS.get(ext)
+    if file_format is None or (compression and file_format not in COMPRESSIBLE_FORMATS):
+        file_ext = name.split(".", 1)[-1] if "." in name else name
+        raise Exception(f"No parsing method supports file extension: {file_ext}")
+    return file_format, compression
+
+
+def is_supported(name: str) -> bool:
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def compression_from_encoding(content_encoding: str | None) -> str | None:
+    """
+    Returns the compression of a Content-Encoding header value, None for uncompressed content.
+    """
+    if not content_encoding or content_encoding.lower() == "identity":
+        return None
+    compression = CONTENT_ENCODINGS.get(content_encoding.lower())
+    if compression is None:
+        raise Exception(f"Unsupported content encoding: {content_encoding}")
+    return compression
+
+
+def _zstd_module():
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            from backports import zstd
+        except ImportError:
+            zstd = None
+    return zstd
+
+
+def zstd_available() -> bool:
+    if _zstd_module() is not None:
+        return True
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _zstd_reader(stream: BinaryIO) -> BinaryIO:
+    if (zstd := _zstd_module()) is not None:
+        return zstd.ZstdFile(stream)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception(
+            "Reading zstd compressed data requires the zstandard or backports.zstd package"
+        )
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+def decompress(stream: BinaryIO, compression: str | None) -> BinaryIO:
+    """
+    Wraps a binary stream to decompress it while it is read, without temporary files.
+    """
+    if compression is None:
+        return stream
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream)
+    if compression == "zstd":
+        return _zstd_reader(stream)
+    raise Exception(f"Unsupported compression: {compression}")
+
+
+class _IteratorStream(io.RawIOBase):
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def iter_stream(chunks: Iterator[bytes]) -> BinaryIO:
+    """
+    Wraps an iterator of byte chunks, e.g. an HTTP response body, in a readable binary stream.
+    """
+    return io.BufferedReader(_IteratorStream(chunks))
+
+
+def _project(data: Any, columns: list[str] | None) -> Any:
+    if not columns:
+        return data
+    if isinstance(data, dict):
+        return {column: data[column] for column in columns if column in data}
+    if isinstance(data, list):
+        return [_project(record, columns) for record in data]
+    return data
+
+
+def _iter_lines(stream: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    # Works with any readable stream, not all decompressors and HTTP bodies iterate over lines
+    pending = b""
+    while chunk := stream.read(chunk_size):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _line_batches(
+    lines: Iterator[bytes], batch_size: int, columns: list[str] | None
+) -> Iterator[list]:
+    batch = []
+    for line in lines:
+        if not line.strip():
+            continue
+        batch.append(_project(json.loads(line), columns))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def shard_range(total: int, shard: tuple[int, int]) -> tuple[int, int]:
+    """
+    Returns the [start, end) range of the `(index, count)` shard of `total` bytes or rows.
+    """
+    index, count = shard
+    return total * index // count, total * (index + 1) // count
+
+
+def shard_files(sizes: dict[str, int], shard: tuple[int, int]) -> list[str]:
+    """
+    Returns the files of the `(index, count)` shard of a set of files, by name, balanced by size: files are assigned
+    to the least loaded shard, largest first. Every shard computes the same assignment from the same sizes.
+    """
+    index, count = shard
+    loads = [0] * count
+    assigned: list[list[str]] = [[] for _ in range(count)]
+    for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        target = min(range(count), key=lambda i: (loads[i], i))
+        loads[target] += sizes[name]
+        assigned[target].append(name)
+    return sorted(assigned[index])
+
+
+def read_line_range(
+    stream: BinaryIO, start: int, end: int, batch_size: int, columns: list[str] | None
+) -> Iterator[list]:
+    """
+    Reads the JSON lines that start in the [start, end) byte range of an uncompressed JSONL file, in batches.
+    The stream must start at byte `max(start - 1, 0)` of the file, e.g. with a ranged S3 request.
+
+    Lines crossing a range boundary belong to the range they start in, so that consecutive ranges read every line
+    exactly once. Reading stops at the first line starting after the range.
+    """
+    position = max(start - 1, 0)
+    lines = _iter_lines(stream)
+    if start > 0:
+        # The end of the line started before the range, empty if the range starts on a line
+        position += len(next(lines, b"")) + 1
+
+    def in_range() -> Iterator[bytes]:
+        nonlocal position
+        for line in lines:
+            if position >= end:
+                return
+            position += len(line) + 1
+            yield line
+
+    yield from _line_batches(in_range(), batch_size, columns)
+
+
+def _every_nth(items: Iterator[Any], shard: tuple[int, int] | None) -> Iterator[Any]:
+    # Shards of a stream whose length is unknown, records are dealt round-robin
+    if shard is None:
+        yield from items
+        return
+    index, count = shard
+    for position, item in enumerate(items):
+        if position % count == index:
+            yield item
+
+
+def _frame_batches(
+    frame: "pl.LazyFrame",
+    batch_size: int,
+    columns: list[str] | None,
+    shard: tuple[int, int] | None = None,
+) -> Iterator["pl.DataFrame"]:
+    import polars as pl
+
+    # Slices are pushed down to the reader, only the row groups of the current batch are decoded
+    if columns:
+        frame = frame.select(columns)
+    rows = frame.select(pl.len()).collect().item()
+    start, end = shard_range(rows, shard) if shard else (0, rows)
+    for offset in range(start, end, batch_size):
+        yield frame.slice(offset, min(batch_size, end - offset)).collect()
+
+
+def _read_path(
+    path: str,
+    file_format: str,
+    compression: str | None,
+    batch_size,
+    columns,
+    shard: tuple[int, int] | None,
+) -> Iterator[Any]:
+    if file_format == "parquet":
+        import polars as pl
+
+        # Polars memory-maps local files when scanning them
+        yield from _frame_batches(pl.scan_parquet(path), batch_size, columns, shard)
+    elif file_format == "ipc":
+        import polars as pl
+
+        yield from _frame_batches(
+            pl.scan_ipc(path, memory_map=True), batch_size, columns, shard
+        )
+    elif file_format == "jsonl" and compression is None and shard is not None:
+        start, end = shard_range(os.path.getsize(path), shard)
+        with open(path, "rb") as file:
+            file.seek(max(start - 1, 0))
+            yield from read_line_range(file, start, end, batch_size, columns)
+    elif file_format == "jsonl" and compression is None:
+        if os.path.getsize(path) == 0:
+            return
+        # Memory-mapped, lines are read from the page cache without loading the whole file
+        with (
+            open(path, "rb") as file,
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped,
+        ):
+            yield from _line_batches(iter(mapped.readline, b""), batch_size, columns)
+    else:
+        with open(path, "rb") as file:
+            yield from _read_stream(
+                file, file_format, compression, batch_size, columns, shard
+            )
+
+
+def _read_stream(
+    stream: BinaryIO,
+    file_format: str,
+    compression: str | None,
+    batch_size,
+    columns,
+    shard: tuple[int, int] | None,
+) -> Iterator[Any]:
+    if file_format in ("parquet", "ipc"):
+        import polars as pl
+
+        # Columnar files need random access, the (compressed) file is buffered in memory
+        buffer = io.BytesIO(stream.read())
+        frame = (
+            pl.scan_parquet(buffer) if file_format == "parquet" else pl.scan_ipc(buffer)
+        )
+        yield from _frame_batches(frame, batch_size, columns, shard)
+    elif file_format == "jsonl":
+        # Lines of other shards are skipped before being parsed
+        lines = (
+            line
+            for line in _iter_lines(decompress(stream, compression))
+            if line.strip()
+        )
+        yield from _line_batches(_every_nth(lines, shard), batch_size, columns)
+    else:
+        data = json.load(decompress(stream, compression))
+        if shard is None:
+            yield _project(data, columns)
+        elif isinstance(data, list):
+            yield _project(list(_every_nth(iter(data), shard)), columns)
+        elif shard[0] == 0:
+            # A single JSON object is not split, the first shard extracts it
+            yield _project(data, columns)
+
+
+def read_batches(
+    source: str | BinaryIO,
+    name: str,
+    batch_size: int,
+    columns: list[str] | None = None,
+    shard: tuple[int, int] | None = None,
+) -> Iterator[Any]:
+    """
+    Reads a file, from a local path or a binary stream, in batches of `batch_size` records.
+
+    The format and compression are detected from the file `name`:
+    - `.json`: the whole document is a single batch
+    - `.jsonl`/`.ndjson`: lists of records, streamed
+    - JSON and JSONL can be compressed with gzip (`.gz`) or zstd (`.zst`), they are decompressed while being read
+    - `.parquet` and Arrow IPC (`.arrow`/`.ipc`/`.feather`): Polars DataFrames, read lazily one slice at a time
+
+    Only the given `columns` are read when set, other fields of JSON records are dropped.
+
+    With an `(index, count)` shard, only the part of the file of this shard is read: a range of rows of columnar
+    files, a byte range of uncompressed JSONL files (see `read_line_range`), every `count`-th record otherwise.
+    """
+    file_format, compression = detect_format(name)
+    if isinstance(source, str):
+        yield from _read_path(
+            source, file_format, compression, batch_size, columns, shard
+        )
+    else:
+        yield from _read_stream(
+            source, file_format, compression, batch_size, columns, shard
+        )
+
+
+def _drop_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_drop_nulls(v) for v in value]
+    return value
+
+
+def to_records(data: Any) -> Any:
+    """
+    Converts a columnar batch to a list of JSON records, other data is returned as is.
+
+    Extractors of columnar sources yield Polars DataFrames, which stay columnar through the transform step and are
+    only converted when the loader needs JSON. Values are converted with their JSON representation
+    (e.g. dates as ISO strings), so that the records can be sent as is.
+    Null fields are dropped, since columnar formats cannot tell a missing field from a null one.
+    """
+    # Data cannot be a Polars frame if Polars was never imported
+    pl = sys.modules.get("polars")
+    if pl is None:
+        return data
+    if isinstance(data, pl.LazyFrame):
+        data = data.collect()
+    if isinstance(data, pl.DataFrame):
+        return _drop_nulls(json.loads(data.write_json()))
+    return data
@@ -0,0 +1,76 @@
+import asyncio
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from typing import Annotated, Any, Coroutine
+
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.models import Job
+
+__all__ = [
+    "JobLimiter",
+    "job_targets",
+    "get_job_limiter",
+    "JobLimiterDependency",
+]
+
+
+def job_targets(job: Job) -> list[str]:
+    """
+    Returns the datasets a job loads into, one per branch for fan-out jobs.
+    """
+    loaders = (
+        [branch.loader for branch in job.branches] if job.branches else [job.loader]
+    )
+    return sorted({loader.dataset_id for loader in loaders})
+
+
+class JobLimiter:
+    """
+    Bounds the number of jobs of bulk submissions running at once:
+    - at most `JOB_MAX_CONCURRENCY` jobs in total
+    - at most `JOB_MAX_CONCURRENCY_PER_TARGET` jobs loading into the same dataset
+
+    Waiting jobs keep their `submitted` status until they get a slot.
+    """
+
+    def __init__(self, config: Config):
+        self.max_concurrency = config.job_max_concurrency
+        self.max_concurrency_per_target = config.job_max_concurrency_per_target
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._target_slots: dict[str, asyncio.Semaphore] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _target_semaphore(self, target: str) -> asyncio.Semaphore:
+        if target not in self._target_slots:
+            self._target_slots[target] = asyncio.Semaphore(
+                self.max_concurrency_per_target
+            )
+        return self._target_slots[target]
+
+    async def run(self, targets: list[str], job: Coroutine) -> Any:
+        async with AsyncExitStack() as stack:
+            # Targets are always acquired in the same order, jobs with several targets cannot deadlock
+            for target in sorted(targets):
+                await stack.enter_async_context(self._target_semaphore(target))
+            await stack.enter_async_context(self._slots)
+            return await job
+
+    def submit(self, targets: list[str], job: Coroutine) -> asyncio.Task:
+        """
+        Runs a job in the background once there is a free slot for it and all its targets.
+        Must be called from a running event loop.
+        """
+        task = asyncio.create_task(self.run(targets, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+
+@lru_cache
+def get_job_limiter(config: ConfigDependency):
+    return JobLimiter(config)
+
+
+JobLimiterDependency = Annotated[JobLimiter, Depends(get_job_limiter)]
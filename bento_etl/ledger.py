@@ -0,0 +1,148 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Annotated, Any
+
+from fastapi import Depends
+from sqlalchemy import Engine, delete
+from sqlmodel import Session, col, select
+
+from bento_etl.db import JobStatusDatabaseDependency
+from bento_etl.logger import BoundLogger
+from bento_etl.models import LoadedRecord
+
+__all__ = [
+    "LoadLedger",
+    "record_hash",
+    "get_load_ledger",
+    "LoadLedgerDependency",
+]
+
+
+# Max number of ledger entries written per statement
+UPSERT_CHUNK_SIZE = 500
+
+
+def record_hash(record: Any) -> str:
+    # Canonical JSON, so that key order does not change the hash
+    content = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class LoadLedger:
+    """
+    Ledger of the records already loaded in each dataset, stored in the job status database.
+
+    Records are identified by their `id` field and fingerprinted with a hash of their content,
+    which lets re-runs and incremental syncs skip the records that were loaded before and did not change.
+    Records without an `id` are always loaded.
+    """
+
+    def __init__(self, logger: BoundLogger, engine: Engine):
+        self.logger = logger
+        self.engine = engine
+
+    @staticmethod
+    def _record_id(record: Any) -> str | None:
+        if isinstance(record, dict) and record.get("id") is not None:
+            return str(record["id"])
+        return None
+
+    def _loaded_hashes(
+        self, session: Session, dataset_id: str, data_type: str, record_ids: list[str]
+    ) -> dict[str, LoadedRecord]:
+        if not record_ids:
+            return {}
+        statement = select(LoadedRecord).where(
+            LoadedRecord.dataset_id == dataset_id,
+            LoadedRecord.data_type == data_type,
+            col(LoadedRecord.record_id).in_(record_ids),
+        )
+        return {entry.record_id: entry for entry in session.exec(statement)}
+
+    def filter_loaded(self, dataset_id: str, data_type: str, records: list) -> list:
+        """
+        Returns the records that are new or changed since they were last loaded in the dataset.
+        """
+        record_ids = [self._record_id(record) for record in records]
+        with Session(self.engine) as session:
+            loaded = self._loaded_hashes(
+                session, dataset_id, data_type, [i for i in record_ids if i]
+            )
+
+        return [
+            record
+            for record, record_id in zip(records, record_ids)
+            if record_id not in loaded
+            or loaded[record_id].content_hash != record_hash(record)
+        ]
+
+    def _insert(self):
+        # Upserts are dialect-specific
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.engine.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise NotImplementedError(
+                f"Unsupported database for the load ledger: {self.engine.dialect.name}"
+            )
+        return insert(LoadedRecord)
+
+    def add_loaded(self, dataset_id: str, data_type: str, records: list):
+        """
+        Records the content of successfully loaded records.
+        Safe across processes: entries are upserted, concurrent jobs loading the same records do not conflict.
+        """
+        hashes = {
+            record_id: record_hash(record)
+            for record in records
+            if (record_id := self._record_id(record))
+        }
+        if not hashes:
+            return
+        now = datetime.now()
+        rows = [
+            {
+                "dataset_id": dataset_id,
+                "data_type": data_type,
+                "record_id": record_id,
+                "content_hash": content_hash,
+                "loaded_at": now,
+            }
+            for record_id, content_hash in hashes.items()
+        ]
+        with Session(self.engine) as session:
+            # Chunked to stay under the databases' limits on the number of bound parameters
+            for index in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                statement = self._insert().values(
+                    rows[index : index + UPSERT_CHUNK_SIZE]
+                )
+                session.exec(  # type: ignore
+                    statement.on_conflict_do_update(
+                        index_elements=["dataset_id", "data_type", "record_id"],
+                        set_={
+                            "content_hash": statement.excluded.content_hash,
+                            "loaded_at": statement.excluded.loaded_at,
+                        },
+                    )
+                )
+            session.commit()
+
+    def clear(self, dataset_id: str) -> int:
+        """
+        Forgets all the records loaded in a dataset, e.g. after the dataset was cleared in the target service.
+        """
+        with Session(self.engine) as session:
+            result = session.exec(  # type: ignore
+                delete(LoadedRecord).where(col(LoadedRecord.dataset_id) == dataset_id)
+            )
+            session.commit()
+            return result.rowcount
+
+
+def get_load_ledger(db: JobStatusDatabaseDependency) -> LoadLedger:
+    return LoadLedger(db.logger, db.engine)
+
+
+LoadLedgerDependency = Annotated[LoadLedger, Depends(get_load_ledger)]
@@ -0,0 +1,276 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Annotated, AsyncIterator
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.logger import BoundLogger, LoggerDependency
+
+__all__ = [
+    "CircuitOpenError",
+    "LoadSlot",
+    "TargetController",
+    "LoadController",
+    "get_load_controller",
+    "LoadControllerDependency",
+]
+
+# Responses of a target asking its clients to slow down
+THROTTLING_STATUS_CODES = frozenset({429, 503})
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when an upload waited too long for the circuit of its target to close.
+    """
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Returns the seconds to wait from a Retry-After header value, either seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class LoadSlot:
+    """
+    Permission to send one upload request to a target, see `TargetController.slot`.
+    The response is recorded with `record`, transport errors are recorded when leaving the slot.
+    """
+
+    def __init__(self, started_at: float, probe: bool):
+        self.started_at = started_at
+        self.probe = probe
+        self.status_code: int | None = None
+        self.retry_after: float | None = None
+        self.latency: float | None = None
+
+    def record(self, response: httpx.Response):
+        self.latency = time.monotonic() - self.started_at
+        self.status_code = response.status_code
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+    @property
+    def throttled(self) -> bool:
+        return self.status_code in THROTTLING_STATUS_CODES
+
+
+class TargetController:
+    """
+    Adaptive concurrency limit and circuit breaker of the uploads to a single target (e.g. Katsu).
+
+    The limit follows AIMD (additive increase, multiplicative decrease), like TCP congestion control:
+    - Each timely response raises the limit by `1 / limit`, i.e. by one upload per round of uploads,
+      up to `LOAD_MAX_CONCURRENCY`
+    - Overload signals cut it by `LOAD_BACKOFF_FACTOR`, down to `LOAD_MIN_CONCURRENCY`: 429 and 503 responses,
+      timeouts and responses slower than `LOAD_LATENCY_THRESHOLD`. Uploads sent before the last cut do not cut
+      the limit again, a burst of slow responses to the same round of uploads counts once
+    - A Retry-After header pauses all the uploads to the target for the given time
+
+    After `LOAD_BREAKER_FAILURES` consecutive failures (server errors, timeouts, connection errors) the circuit opens
+    and uploads wait for `LOAD_BREAKER_COOLDOWN` seconds. A single probe upload is then sent: the circuit closes if it
+    succeeds, uploads resume, and it opens again otherwise. Uploads waiting for more than `LOAD_BREAKER_MAX_WAIT`
+    seconds fail with `CircuitOpenError`.
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config, target: str):
+        self.logger = logger
+        self.target = target
+        self.min_concurrency = config.load_min_concurrency
+        self.max_concurrency = config.load_max_concurrency
+        self.latency_threshold = config.load_latency_threshold
+        self.backoff_factor = config.load_backoff_factor
+        self.throttle_pause = config.load_throttle_pause
+        self.breaker_failures = config.load_breaker_failures
+        self.breaker_cooldown = config.load_breaker_cooldown
+        self.breaker_max_wait = config.load_breaker_max_wait
+
+        # Starts at the max, the limit only goes down once the target shows signs of overload
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.failures = 0
+        self.paused_until = 0.0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._decreased_at = 0.0
+        self._waiters: list[asyncio.Future] = []
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.opened_at is not None
+
+    def _wait_time(self, now: float) -> float | None:
+        """
+        Returns 0 if an upload can be sent now, the seconds to wait otherwise, None to wait for a running upload.
+        """
+        if self.opened_at is not None:
+            if now < self.opened_at + self.breaker_cooldown:
+                return self.opened_at + self.breaker_cooldown - now
+            # Half-open, a single probe is sent
+            return None if self._probing else 0
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= math.floor(self.limit):
+            return None
+        return 0
+
+    async def _acquire(self) -> LoadSlot:
+        waiting_since = time.monotonic()
+        while (wait := self._wait_time(time.monotonic())) != 0:
+            if self.circuit_open and (
+                time.monotonic() - waiting_since > self.breaker_max_wait
+            ):
+                raise CircuitOpenError(
+                    f"Uploads to {self.target} are paused, its circuit is open after repeated failures"
+                )
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                timeout = wait
+                if self.circuit_open:
+                    timeout = min(wait or self.breaker_max_wait, self.breaker_max_wait)
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        probe = self.circuit_open
+        self._probing = self._probing or probe
+        self.in_flight += 1
+        return LoadSlot(time.monotonic(), probe)
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _decrease(self, slot: LoadSlot, now: float, reason: str):
+        if slot.started_at < self._decreased_at:
+            return
+        limit = max(self.min_concurrency, self.limit * self.backoff_factor)
+        if limit < self.limit:
+            self.logger.warning(
+                f"{reason} from {self.target}, lowering its concurrency limit to {math.floor(limit)}"
+            )
+        self.limit = limit
+        self._decreased_at = now
+
+    def _open(self, now: float):
+        if self.opened_at is None:
+            self.logger.warning(
+                f"Pausing uploads to {self.target} for {self.breaker_cooldown}s after {self.failures} consecutive failures"
+            )
+        self.opened_at = now
+
+    def _close(self):
+        self.logger.info(f"Uploads to {self.target} resumed")
+        self.opened_at = None
+        self.failures = 0
+
+    def _release(self, slot: LoadSlot, failed: bool):
+        now = time.monotonic()
+        self.in_flight -= 1
+        if slot.probe:
+            self._probing = False
+
+        if slot.status_code is not None and not failed:
+            if slot.throttled:
+                self._decrease(slot, now, f"Got status {slot.status_code}")
+                self.paused_until = max(
+                    self.paused_until,
+                    now
+                    + min(
+                        slot.retry_after
+                        if slot.retry_after is not None
+                        else self.throttle_pause,
+                        self.breaker_max_wait,
+                    ),
+                )
+            elif (slot.latency or 0) > self.latency_threshold:
+                self._decrease(slot, now, f"Slow response ({slot.latency:.1f}s)")
+            elif slot.status_code < 500:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+        if failed or (slot.status_code or 0) >= 500:
+            self.failures += 1
+            if slot.probe or self.failures >= self.breaker_failures:
+                self._open(now)
+        elif slot.status_code is not None:
+            self.failures = 0
+            if slot.probe:
+                self._close()
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[LoadSlot]:
+        """
+        Waits until an upload can be sent to the target, then yields its slot.
+        """
+        slot = await self._acquire()
+        failed = False
+        try:
+            yield slot
+        except httpx.TransportError as e:
+            # Timeouts, refused or reset connections
+            failed = True
+            self._decrease(slot, time.monotonic(), type(e).__name__)
+            raise
+        finally:
+            self._release(slot, failed)
+
+
+class LoadController:
+    """
+    Adapts the uploads of all the jobs of the process to how their targets respond, see `TargetController`.
+    Targets are identified by the host of their URL, jobs loading into different datasets of the same Katsu
+    instance share its limit and its circuit.
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.config = config
+        self.enabled = config.load_control_enabled
+        self._targets: dict[str, TargetController] = {}
+
+    def target(self, url: str) -> TargetController:
+        key = urlsplit(url).netloc or url
+        if key not in self._targets:
+            self._targets[key] = TargetController(self.logger, self.config, key)
+        return self._targets[key]
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[LoadSlot]:
+        if not self.enabled:
+            yield LoadSlot(time.monotonic(), False)
+            return
+        async with self.target(url).slot() as slot:
+            yield slot
+
+
+@lru_cache
+def get_load_controller(logger: LoggerDependency, config: ConfigDependency):
+    return LoadController(logger, config)
+
+
+LoadControllerDependency = Annotated[LoadController, Depends(get_load_controller)]
@@ -1,14 +1,126 @@
 from asyncio.tasks import Task
 import asyncio
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from logging import Logger
+from typing import Any, AsyncIterator, Iterator
 from httpx import AsyncClient
 import httpx
 
 from bento_etl.config import Config
 from bento_etl.authz import get_bearer_token_from_config
+from bento_etl.load_controller import (
+    CircuitOpenError,
+    LoadController,
+    get_load_controller,
+)
+from bento_etl.models import RejectedRecord
+from bento_etl.tracing import inject_trace_context, span
+from bento_etl.transport import ClientPool, get_client_pool
 
 
-__all__ = ["BaseLoader"]
+__all__ = ["BaseLoader", "LoadError", "PartialLoadError", "stream_json"]
+
+# Rejections caused by the content of a batch, which can be narrowed down to some records by bisecting the batch
+BISECTABLE_STATUS_CODES = frozenset({400, 422})
+
+# Number of requests sent to upload the batch loaded by the current task, bisections included
+_batch_requests: ContextVar[int] = ContextVar("batch_requests", default=0)
+
+
+def _request_body_size(response: httpx.Response) -> int | None:
+    try:
+        return len(response.request.content)
+    except RuntimeError:
+        # Responses built without a request, e.g. in tests
+        return None
+
+
+# Size of the chunks of streamed request bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _encode_json(value: Any) -> bytes:
+    # Same encoding as httpx's `json=` bodies
+    return json.dumps(
+        value, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+    ).encode("utf-8")
+
+
+def _iter_json(value: Any) -> Iterator[bytes]:
+    # Lists, including the lists of an object (e.g. an experiments batch), are encoded one item at a time
+    if isinstance(value, list):
+        yield b"["
+        for index, item in enumerate(value):
+            if index:
+                yield b","
+            yield _encode_json(item)
+        yield b"]"
+    elif isinstance(value, dict):
+        yield b"{"
+        for index, (key, item) in enumerate(value.items()):
+            yield (b"," if index else b"") + _encode_json(str(key)) + b":"
+            if isinstance(item, list):
+                yield from _iter_json(item)
+            else:
+                yield _encode_json(item)
+        yield b"}"
+    else:
+        yield _encode_json(value)
+
+
+async def stream_json(value: Any, sent: list[int]) -> AsyncIterator[bytes]:
+    """
+    Encodes a JSON request body in chunks of about `STREAM_CHUNK_SIZE` bytes, as the connection sends them,
+    instead of encoding the whole body in memory first. The number of bytes sent is added to `sent`.
+    """
+    chunk = bytearray()
+    for part in _iter_json(value):
+        chunk += part
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            sent[0] += len(chunk)
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        sent[0] += len(chunk)
+        yield bytes(chunk)
+
+
+class LoadError(Exception):
+    """
+    Raised when the target service responds to an upload with an unexpected status code.
+    """
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PartialLoadError(Exception):
+    """
+    Raised when an upload fails while its batch is bisected, once some parts of the batch were loaded.
+    Holds the loaded records, the records isolated as rejected until then, and the batch of the records left unsent.
+    """
+
+    def __init__(
+        self, message: str, loaded: list, rejected: list[RejectedRecord], unsent
+    ):
+        super().__init__(message)
+        self.loaded = loaded
+        self.rejected = rejected
+        self.unsent = unsent
+
+
+class _Bisection:
+    """
+    State of the bisection of a rejected batch: the requests left to send and the records loaded or rejected so far.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.loaded: list = []
+        self.rejected: list[RejectedRecord] = []
 
 
 class BaseLoader:
@@ -17,8 +129,21 @@ class BaseLoader:
 
     Loaders are the final step of an ETL pipeline, they receive transformed data from their upstream
     and load it into the target destination.
+
+    Uploads go through the process' `LoadController`, which adapts their concurrency to how the target responds
+    and pauses them while the target is failing. Uploads throttled with a 429 or 503 response are retried up to
+    `LOAD_THROTTLE_RETRIES` times, once the target accepts uploads again.
+
+    Unbatched uploads (`batch_size` of 0) of at least `LOAD_STREAM_MIN_RECORDS` records are streamed: their JSON body
+    is encoded record by record as it is sent, see `stream_json`.
     """
 
+    # Scope of the loaded records in the LoadLedger, records of loaders without a dataset are not tracked
+    dataset_id: str | None = None
+    data_type: str | None = None
+    # Whether records already loaded in the dataset with the same content should be skipped
+    skip_loaded_records: bool = False
+
     def __init__(
         self,
         logger: Logger,
@@ -27,6 +152,8 @@ class BaseLoader:
         service_name: str,
         expected_status_code: int,
         batch_size: int = 0,
+        controller: LoadController | None = None,
+        clients: ClientPool | None = None,
     ):
         if batch_size < 0:
             raise ValueError("Batch size must be at least 0")
@@ -45,15 +172,145 @@ class BaseLoader:
         self.service_name = service_name
         self.expected_status_code = expected_status_code
         self.batch_size = batch_size
+        self.controller = controller or get_load_controller(logger, config)  # pyright: ignore[reportArgumentType]
+        self.clients = clients or get_client_pool(logger, config)  # pyright: ignore[reportArgumentType]
+        self._headers: dict[str, str] = {}
+
+    @asynccontextmanager
+    async def client(self) -> AsyncIterator[AsyncClient]:
+        """
+        HTTP client of the target to use with `load_batch`, shared with the other jobs, see `ClientPool`.
+        The uploads sent until the context exits are authenticated with a token fetched on entering it.
+        """
+        self._headers = {"Authorization": get_bearer_token_from_config(self.config)}
+        yield self.clients.client(self.load_url)
+
+    async def load_batch(self, client: AsyncClient, batch) -> list[RejectedRecord]:
+        """
+        Uploads a single batch, as returned by `_create_data_batches`.
+        Used by the streaming pipeline, which creates the batches itself.
+
+        When the target rejects the batch because of its content, the batch is bisected to isolate the rejected
+        records: the rest of the batch is loaded and the rejected records are returned.
+        Other failures are raised, as a `PartialLoadError` once parts of the batch were loaded, and so is the rejection
+        of the batch when none of its parts could be loaded (e.g. an unknown dataset).
+        Bisecting a batch sends at most `LOAD_BISECT_MAX_REQUESTS` more requests, the parts of the batch left once they
+        are sent are rejected as a whole.
+        """
+        records = len(self._batch_records(batch))
+        attributes = {"etl.loader.service": self.service_name, "etl.records": records}
+        with span("etl.load.batch", attributes) as batch_span:
+            requests = _batch_requests.set(0)
+            try:
+                rejected = await self._load_or_bisect(client, batch)
+                batch_span.set_attribute("etl.records.rejected", len(rejected))
+                return rejected
+            finally:
+                sent = _batch_requests.get()
+                batch_span.set_attribute("etl.load.requests", sent)
+                batch_span.set_attribute("etl.load.retries", max(0, sent - 1))
+                _batch_requests.reset(requests)
+
+    async def _load_or_bisect(self, client: AsyncClient, batch) -> list[RejectedRecord]:
+        try:
+            await self._send_json_data(client, batch)
+            return []
+        except LoadError as e:
+            if e.status_code not in BISECTABLE_STATUS_CODES:
+                raise
+            error = e
+            bisection = _Bisection(self.config.load_bisect_max_requests)
+            if len(self._batch_records(batch)) <= 1 or bisection.budget < 2:
+                raise
+
+        self.logger.warning(
+            "Batch rejected, bisecting it to isolate the rejected records"
+        )
+        try:
+            await self._bisect_batch(client, batch, error, bisection)
+        except Exception as e:
+            if not bisection.loaded:
+                raise
+            unsent = self._unsent_batch(batch, bisection)
+            raise PartialLoadError(
+                f"Upload failed while bisecting the batch, after {len(bisection.loaded)} record(s) were loaded: {e}",
+                bisection.loaded,
+                bisection.rejected,
+                unsent,
+            ) from e
+
+        if not bisection.loaded:
+            # Every part was rejected, the rejection is likely not caused by specific records (e.g. unknown dataset,
+            # schema mismatch): the upload fails as a whole
+            raise error
+        return bisection.rejected
+
+    def _halve_batch(self, batch) -> list:
+        records = self._batch_records(batch)
+        middle = len(records) // 2
+        return [
+            self._replace_batch_records(batch, half)
+            for half in (records[:middle], records[middle:])
+        ]
+
+    def _unsent_batch(self, batch, bisection: "_Bisection"):
+        done = {id(record) for record in bisection.loaded}
+        done.update(id(rejected.record) for rejected in bisection.rejected)
+        records = [
+            record for record in self._batch_records(batch) if id(record) not in done
+        ]
+        return self._replace_batch_records(batch, records)
+
+    async def _try_send(
+        self, client: AsyncClient, batch, bisection: "_Bisection"
+    ) -> LoadError | None:
+        """
+        Sends a part of a bisected batch, returns the error if the target rejected it because of its content.
+        """
+        bisection.budget -= 1
+        try:
+            await self._send_json_data(client, batch)
+        except LoadError as e:
+            if e.status_code not in BISECTABLE_STATUS_CODES:
+                raise
+            return e
+        bisection.loaded += self._batch_records(batch)
+        return None
+
+    async def _bisect_batch(
+        self, client: AsyncClient, batch, error: LoadError, bisection: "_Bisection"
+    ):
+        """
+        Isolates the rejected records of a rejected part of a batch, with at most `bisection.budget` more requests.
+        Parts left once the budget is spent are rejected as a whole.
+        """
+        records = self._batch_records(batch)
+        if len(records) <= 1:
+            bisection.rejected += [
+                RejectedRecord(record=record, reasons=[str(error)])
+                for record in records
+            ]
+            return
+        if bisection.budget < 2:
+            reason = (
+                f"{error} Not bisected further, LOAD_BISECT_MAX_REQUESTS was reached."
+            )
+            bisection.rejected += [
+                RejectedRecord(record=record, reasons=[reason]) for record in records
+            ]
+            return
+
+        # Both halves are sent before either is bisected, the budget left is shared between them
+        halves = self._halve_batch(batch)
+        errors = [await self._try_send(client, half, bisection) for half in halves]
+        for half, half_error in zip(halves, errors):
+            if half_error:
+                await self._bisect_batch(client, half, half_error, bisection)
 
     async def _load(self, data: list[dict]):
-        limits = httpx.Limits(max_keepalive_connections=20, max_connections=len(data))
-        headers = {"Authorization": get_bearer_token_from_config(self.config)}
         load_requests = set()
 
-        async with AsyncClient(
-            limits=limits, verify=self.config.bento_validate_ssl, headers=headers
-        ) as client:
+        async with self.client() as client:
             try:
                 data_batches = self._create_data_batches(data)
 
@@ -82,6 +339,37 @@ class BaseLoader:
             for index in range(0, len(data), self.batch_size)
         ]
 
+    def _batch_records(self, batch) -> list:
+        """
+        Returns the records contained in a batch.
+
+        Default implementation: A batch is a list of records.
+        Overridable: Should be overriden by custom Loaders to account for unique data shapes.
+        """
+        return batch
+
+    def _replace_batch_records(self, batch, records: list):
+        """
+        Returns a batch with the same shape as `batch`, containing only the given records.
+
+        Default implementation: A batch is a list of records.
+        Overridable: Should be overriden by custom Loaders to account for unique data shapes.
+        """
+        return records
+
+    def _dead_letter_payloads(
+        self, batch, rejected: list[RejectedRecord]
+    ) -> list[tuple[Any, list[RejectedRecord]]]:
+        """
+        Returns the payloads to dead-letter for the records rejected from `batch`, each with the rejected records it
+        holds. Payloads can be re-driven to this loader.
+
+        Default implementation: A single batch of all the rejected records, see `_replace_batch_records`.
+        Overridable: Should be overriden by custom Loaders whose batches hold several kinds of records.
+        """
+        records = [rejected_record.record for rejected_record in rejected]
+        return [(self._replace_batch_records(batch, records), rejected)]
+
     def _create_data_batches(self, data: list[dict]) -> list:
         if self.batch_size == 0:
             return [data]
@@ -89,12 +377,63 @@ class BaseLoader:
             return self._slice_data(data)
 
     async def _send_json_data(self, client: AsyncClient, data: list[dict]):
-        response = await client.post(self.load_url, json=data)
+        retries = self.config.load_throttle_retries
+        for attempt in range(retries + 1):
+            try:
+                async with self.controller.slot(self.load_url) as slot:
+                    response = await self._post(client, data)
+                    slot.record(response)
+            except CircuitOpenError as e:
+                self.logger.error(str(e))
+                raise LoadError(str(e), 503)
+
+            if slot.throttled and attempt < retries:
+                # The controller holds the retry until the target accepts uploads again
+                self.logger.warning(
+                    f"Upload to {self.service_name} throttled with status {response.status_code}, retrying"
+                )
+                continue
+            if response.status_code != self.expected_status_code:
+                error_message = f"Upload to {self.service_name} failed. Expected status code {self.expected_status_code}, but received {response.status_code}."
+                self.logger.error(error_message)
+                raise LoadError(error_message, response.status_code)
+            return
 
-        if response.status_code != self.expected_status_code:
-            error_message = f"Upload to {self.service_name} failed. Expected status code {self.expected_status_code}, but received {response.status_code}."
-            self.logger.error(error_message)
-            raise Exception(error_message)
+    def _streamed(self, data) -> bool:
+        min_records = self.config.load_stream_min_records
+        # Batched uploads keep their encoding, some targets do not accept chunked requests
+        if not min_records or self.batch_size:
+            return False
+        try:
+            return len(self._batch_records(data)) >= min_records
+        except (KeyError, TypeError):
+            # Malformed batches are sent as is, for the target to reject them
+            return False
+
+    async def _post(self, client: AsyncClient, data: list[dict]) -> httpx.Response:
+        _batch_requests.set(_batch_requests.get() + 1)
+        attributes = {"http.request.method": "POST", "url.full": self.load_url}
+        with span("POST", attributes) as request_span:
+            # The target service continues the job's trace
+            headers = inject_trace_context(dict(self._headers))
+            if self._streamed(data):
+                # Sent with chunked transfer encoding, the body is never held in memory as a whole
+                sent = [0]
+                response = await client.post(
+                    self.load_url,
+                    content=stream_json(data, sent),
+                    headers={**headers, "Content-Type": "application/json"},
+                )
+                body_size = sent[0]
+            else:
+                response = await client.post(self.load_url, json=data, headers=headers)
+                body_size = _request_body_size(response)
+            request_span.set_attribute(
+                "http.response.status_code", response.status_code
+            )
+            if body_size is not None:
+                request_span.set_attribute("http.request.body.size", body_size)
+            return response
 
     def _cancel_all_requests(self, requests: set[Task]):
         for request in requests:
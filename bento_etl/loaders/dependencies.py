@@ -14,13 +14,24 @@ __all__ = ["get_loader", "LoaderDep"]
 
 def get_loader(job: Job, logger: LoggerDependency, config: ConfigDependency):
     # returns the appropriate loader instance depending on the job description
-    if job.loader.data_type == "phenopackets":
+    if job.loader is None:
+        # Fan-out jobs have a loader per branch
+        return None
+    elif job.loader.data_type == "phenopackets":
         return PhenopacketsLoader(
-            logger, config, job.loader.dataset_id, job.loader.batch_size
+            logger,
+            config,
+            job.loader.dataset_id,
+            job.loader.batch_size,
+            job.loader.skip_loaded_records,
         )
     elif job.loader.data_type == "experiments":
         return ExperimentsLoader(
-            logger, config, job.loader.dataset_id, job.loader.batch_size
+            logger,
+            config,
+            job.loader.dataset_id,
+            job.loader.batch_size,
+            job.loader.skip_loaded_records,
         )
     elif job.loader.data_type == "print":  # pragma: no cover
         return PrintLoader(logger, config)
@@ -1,19 +1,32 @@
 from logging import Logger
 
 from bento_etl.config import Config
+from bento_etl.models import RejectedRecord
 from .base import BaseLoader
 
 
 class ExperimentsLoader(BaseLoader):
+    data_type = "experiments"
+
     def __init__(
-        self, logger: Logger, config: Config, dataset_id: str, batch_size: int = 0
+        self,
+        logger: Logger,
+        config: Config,
+        dataset_id: str,
+        batch_size: int = 0,
+        skip_loaded_records: bool = True,
     ):
         if not dataset_id:
             raise ValueError("Dataset ID must be non-empty")
+        self.dataset_id = str(dataset_id)
+        self.skip_loaded_records = skip_loaded_records
         load_url = f"{config.katsu_url}ingest/{dataset_id}/experiments_json"
         super().__init__(logger, config, load_url, "katsu", 204, batch_size)
 
     def _slice_data(self, data: dict) -> list[dict]:
+        if not data["experiments"]:
+            # Re-driven resources, rejected without their experiments
+            return [data] if data.get("resources") else []
         return [
             {
                 "experiments": data["experiments"][index : index + self.batch_size],
@@ -22,5 +35,35 @@ class ExperimentsLoader(BaseLoader):
             for index in range(0, len(data["experiments"]), self.batch_size)
         ]
 
+    def _batch_records(self, batch: dict) -> list[dict]:
+        return batch["experiments"]
+
+    def _replace_batch_records(self, batch: dict, records: list[dict]) -> dict:
+        resources = batch.get("resources", []) if isinstance(batch, dict) else []
+        return {"experiments": records, "resources": resources}
+
+    def _dead_letter_payloads(
+        self, batch: dict, rejected: list[RejectedRecord]
+    ) -> list[tuple[dict, list[RejectedRecord]]]:
+        resources = [r for r in rejected if r.kind == "resource"]
+        experiments = [r for r in rejected if r.kind != "resource"]
+        payloads = []
+        if resources:
+            # Re-driven as resources, not as experiments of a batch with the original resources
+            payloads.append(
+                (
+                    {"experiments": [], "resources": [r.record for r in resources]},
+                    resources,
+                )
+            )
+        if experiments:
+            payloads.append(
+                (
+                    self._replace_batch_records(batch, [r.record for r in experiments]),
+                    experiments,
+                )
+            )
+        return payloads
+
     async def load(self, data: list[dict]):
         await self._load(data)
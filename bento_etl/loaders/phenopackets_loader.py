@@ -5,11 +5,20 @@ from .base import BaseLoader
 
 
 class PhenopacketsLoader(BaseLoader):
+    data_type = "phenopackets"
+
     def __init__(
-        self, logger: Logger, config: Config, dataset_id: str, batch_size: int = 0
+        self,
+        logger: Logger,
+        config: Config,
+        dataset_id: str,
+        batch_size: int = 0,
+        skip_loaded_records: bool = True,
     ):
         if not dataset_id:
             raise ValueError("Dataset ID must be non-empty")
+        self.dataset_id = str(dataset_id)
+        self.skip_loaded_records = skip_loaded_records
         load_url = f"{config.katsu_url}ingest/{dataset_id}/phenopackets_json"
         super().__init__(logger, config, load_url, "katsu", 204, batch_size)
 
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from logging import Logger
 
 from bento_etl.config import Config
@@ -11,3 +12,12 @@ class PrintLoader(BaseLoader):
     async def load(self, data: list[dict]):  # pragma: no cover
         for idx, item in enumerate(data):
             self.logger.debug(f"Item {idx} parsed: {item}")
+
+    @asynccontextmanager
+    async def client(self):  # pragma: no cover
+        # Nothing is sent over the network
+        yield None
+
+    async def load_batch(self, client, batch: list[dict]):  # pragma: no cover
+        await self.load(batch)
+        return []
@@ -5,14 +5,19 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
 from bento_etl.db import get_job_status_db
-
+from bento_etl.pipeline_registry import get_pipeline_registry
+from bento_etl.scheduler import get_pipeline_scheduler
+from bento_etl.tracing import configure_tracing, shutdown_tracing
+from bento_etl.transport import get_client_pool
 
 from . import __version__
-from .authz import authz_middleware
+from .authz import get_authz_middleware
 from .config import get_config
 from .logger import get_logger
 from .constants import BENTO_SERVICE_KIND, SERVICE_TYPE
 from .routers.jobs import job_router
+from .routers.ledger import ledger_router
+from .routers.pipelines import pipeline_router
 
 BENTO_SERVICE_INFO: BentoExtraServiceInfo = {
     "serviceKind": BENTO_SERVICE_KIND,
@@ -21,41 +26,61 @@ BENTO_SERVICE_INFO: BentoExtraServiceInfo = {
     "gitRepository": "https://github.com/bento-platform/bento_etl",
 }
 
-config = get_config()
-logger = get_logger(config)  # pyright: ignore[reportArgumentType]
-db = get_job_status_db(logger, config)  # pyright: ignore[reportArgumentType]
-
-
-@asynccontextmanager
-async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    if config.testing:
-        # tests with in-memory DB
-        logger.info("Handing off control to testing env for lifespan events")
-        yield
-    else:  # pragma: no cover
-        logger.info("Starting up database...")
-        db.setup()
-        yield
-        logger.info("Shutting down database...")
-        db.engine.dispose()
-        logger.info("Finished shutting down database.")
-
-
-app = BentoFastAPI(
-    authz_middleware,
-    config,
-    logger,
-    BENTO_SERVICE_INFO,
-    SERVICE_TYPE,
-    __version__,
-    configure_structlog_access_logger=True,
-    lifespan=lifespan,
-)
-
-app.include_router(job_router)
-
-# Dummy data source router for dev work
-if config.bento_debug or config.testing:
-    from .routers.test_sources import data_source_test_router
-
-    app.include_router(data_source_test_router)
+
+def create_app() -> FastAPI:
+    """
+    Builds the app, with its config, logger and authz middleware. Run with `uvicorn --factory bento_etl.main:create_app`,
+    importing this module does not read the config.
+    """
+    config = get_config()
+    logger = get_logger(config)  # pyright: ignore[reportArgumentType]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+        if config.testing:
+            # tests with in-memory DB
+            logger.info("Handing off control to testing env for lifespan events")
+            yield
+        else:  # pragma: no cover
+            # Created on first use, the app factory does not create the database engine nor the scheduler
+            db = get_job_status_db(logger, config)  # pyright: ignore[reportArgumentType]
+            pipelines = get_pipeline_registry(logger, config)  # pyright: ignore[reportArgumentType]
+            scheduler = get_pipeline_scheduler(logger, config)  # pyright: ignore[reportArgumentType]
+            configure_tracing(config, logger)
+            logger.info("Starting up database...")
+            db.setup()
+            logger.info("Validating pipeline files...")
+            if (errors := pipelines.errors()) and config.pipelines_fail_on_error:
+                raise RuntimeError(f"Malformed pipeline files: {', '.join(errors)}")
+            if config.scheduler_enabled:
+                scheduler.start()
+            yield
+            await scheduler.stop()
+            await get_client_pool(logger, config).aclose()  # pyright: ignore[reportArgumentType]
+            shutdown_tracing()
+            logger.info("Shutting down database...")
+            db.engine.dispose()
+            logger.info("Finished shutting down database.")
+
+    app = BentoFastAPI(
+        get_authz_middleware(),
+        config,
+        logger,
+        BENTO_SERVICE_INFO,
+        SERVICE_TYPE,
+        __version__,
+        configure_structlog_access_logger=True,
+        lifespan=lifespan,
+    )
+
+    app.include_router(job_router)
+    app.include_router(ledger_router)
+    app.include_router(pipeline_router)
+
+    # Dummy data source router for dev work
+    if config.bento_debug or config.testing:
+        from .routers.test_sources import data_source_test_router
+
+        app.include_router(data_source_test_router)
+
+    return app
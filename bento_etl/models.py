@@ -1,20 +1,34 @@
 from datetime import datetime
 from enum import Enum
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator, model_validator
 from sqlmodel import JSON, Column, Enum as SQLModelEnum, Field, SQLModel
 
+from bento_etl.cron import CronSchedule
+
 __all__ = [
     "Job",
     "ExtractStep",
     "ApiFetchExtractStep",
     "S3ExtractStep",
+    "LocalFileExtractStep",
+    "DeadLetterExtractStep",
+    "Shard",
     "TransformStep",
     "LoadStep",
+    "BranchStep",
+    "Schedule",
     "Job",
+    "PipelineDefinition",
     "JobStatus",
     "JobStatusType",
+    "JobGroupStatus",
+    "BatchStage",
+    "RejectedRecord",
+    "LoadedRecord",
+    "PipelineWatermark",
+    "PipelineSchedule",
 ]
 
 
@@ -31,10 +45,70 @@ class ApiFetchExtractStep(ExtractStep):
     extract_url: str
     http_verb: str = "GET"
     expected_status_code: int = 200
+    # Only fetches the data updated since the last successful job of the pipeline, see PipelineWatermark
+    incremental: bool = False
+    # Query parameter set to the start time of the last successful extraction in incremental mode
+    watermark_param: str = "updated_since"
+    # Sends the ETag/Last-Modified of the last successful job's response, nothing is extracted on a 304
+    conditional: bool = False
+
+
+class Shard(BaseModel):
+    """
+    Part of the input of a sharded job extracted by one of its shards, see `Job.shards`.
+    """
+
+    index: int = Field(ge=0)
+    count: int = Field(ge=1)
+
+    @model_validator(mode="after")
+    def check_index(self):
+        if self.index >= self.count:
+            raise ValueError("Shard index must be lower than the shard count")
+        return self
 
 
 class S3ExtractStep(BaseModel):
-    object_key: str
+    """
+    Extracts a single object with `object_key`, or all the objects under a `prefix`.
+    """
+
+    object_key: str = ""
+    prefix: str = ""
+    # Only extracts the objects whose ETag changed since the last successful job of the pipeline
+    incremental: bool = False
+    # Only extracts these columns/fields of the records
+    columns: Optional[list[str]] = None
+    # Set on the jobs of the shards of a sharded job
+    shard: Optional[Shard] = None
+
+    @model_validator(mode="after")
+    def check_object_key_or_prefix(self):
+        if bool(self.object_key) == bool(self.prefix):
+            raise ValueError("Exactly one of object_key or prefix must be set")
+        return self
+
+
+class LocalFileExtractStep(BaseModel):
+    """
+    Extracts the files matching a glob pattern, relative to the local extract directory.
+    """
+
+    path: str
+    # Only extracts these columns/fields of the records
+    columns: Optional[list[str]] = None
+    # Set on the jobs of the shards of a sharded job
+    shard: Optional[Shard] = None
+
+
+class DeadLetterExtractStep(BaseModel):
+    """
+    Re-drives the data dead-lettered by a previous job.
+    """
+
+    dead_letter_job_id: uuid.UUID
+    # Branch of a fan-out job to re-drive
+    branch: Optional[str] = None
 
 
 class TransformStep(BaseModel):
@@ -55,13 +129,125 @@ class LoadStep(BaseModel):
     dataset_id: str
     batch_size: int
     data_type: Literal["phenopackets", "experiments", "print"]
+    # Disables the schema validation of transformed data before it is loaded
+    skip_validation: bool = False
+    # Skips the records that were already loaded in the dataset with the same content
+    skip_loaded_records: bool = True
 
 
-class Job(BaseModel):
-    extractor: ApiFetchExtractStep | S3ExtractStep
+class BranchStep(BaseModel):
+    """
+    Transformer and loader of one branch of a fan-out job, fed by the job's extractor.
+    """
+
+    name: str
     transformer: TransformStep
     loader: LoadStep
 
+
+class Schedule(BaseModel):
+    """
+    Recurring runs of a pipeline definition, see PipelineScheduler.
+    """
+
+    cron: str
+    # Max random delay added to each run, spreads the load of pipelines sharing the same cron expression
+    jitter_seconds: int = Field(default=0, ge=0)
+    # Scheduled runs are skipped while this many runs of the pipeline are still running
+    max_concurrent_runs: int = Field(default=1, ge=1)
+
+    @field_validator("cron")
+    @classmethod
+    def check_cron(cls, cron: str) -> str:
+        CronSchedule(cron)
+        return cron
+
+
+class Job(BaseModel):
+    # Name of the pipeline definition, incremental extractions keep one watermark per name
+    name: Optional[str] = None
+    extractor: (
+        ApiFetchExtractStep
+        | S3ExtractStep
+        | LocalFileExtractStep
+        | DeadLetterExtractStep
+    )
+    # Set either a transformer and a loader, or several branches sharing the extracted data (fan-out job)
+    transformer: Optional[TransformStep] = None
+    loader: Optional[LoadStep] = None
+    branches: Optional[list[BranchStep]] = None
+    # Only used by pipeline definition files
+    schedule: Optional[Schedule] = None
+    # Profiles the job's run, see JobProfiler, the profile is downloaded from /jobs/{id}/profile
+    profile: bool = False
+    # Splits the input in this many shards, run in parallel by the workers, see shard_jobs
+    shards: Optional[int] = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_loader_or_branches(self):
+        if self.branches is None:
+            if self.transformer is None or self.loader is None:
+                raise ValueError(
+                    "A transformer and a loader are required without branches"
+                )
+        else:
+            if self.transformer is not None or self.loader is not None:
+                raise ValueError("Set either a transformer and a loader, or branches")
+            names = [branch.name for branch in self.branches]
+            if not names:
+                raise ValueError("A fan-out job needs at least one branch")
+            if len(set(names)) != len(names):
+                raise ValueError("Branch names must be unique")
+        return self
+
+    @model_validator(mode="after")
+    def check_shards(self):
+        if self.shards is None:
+            return self
+        if not isinstance(self.extractor, (S3ExtractStep, LocalFileExtractStep)):
+            raise ValueError("Only S3 and local file extractions can be sharded")
+        if getattr(self.extractor, "incremental", False):
+            raise ValueError("Incremental extractions cannot be sharded")
+        if self.extractor.shard is not None:
+            raise ValueError("Set either shards, or the shard of an extractor")
+        return self
+
+    def branch_jobs(self) -> dict[str, "Job"]:
+        """
+        Returns a single-loader job for each branch of a fan-out job, by branch name.
+        """
+        return {
+            branch.name: Job(
+                name=self.name,
+                extractor=self.extractor,
+                transformer=branch.transformer,
+                loader=branch.loader,
+                profile=self.profile,
+            )
+            for branch in self.branches or []
+        }
+
+    def shard_jobs(self) -> list["Job"]:
+        """
+        Returns the job of each shard of a sharded job, which extracts its own part of the input:
+        - S3 prefixes and local file patterns matching several files: whole objects/files, balanced by size
+        - Single uncompressed JSONL files: byte ranges, split on line boundaries
+        - Single Parquet and Arrow IPC files: ranges of rows
+        - Other single files: every `shards`-th record
+        """
+        return [
+            self.model_copy(
+                update={
+                    "extractor": self.extractor.model_copy(
+                        update={"shard": Shard(index=index, count=self.shards)}
+                    ),
+                    "shards": None,
+                },
+                deep=True,
+            )
+            for index in range(self.shards or 0)
+        ]
+
     # TODO: add rest of fields
     # Should be able to describe an ETL pipeline to run
     # - Extractor to use and its config
@@ -69,6 +255,16 @@ class Job(BaseModel):
     # - Loader to use and its config
 
 
+class PipelineDefinition(BaseModel):
+    """
+    Pipeline definition file, with its job or the reason it is malformed.
+    """
+
+    name: str
+    job: Optional[Job] = None
+    error: Optional[str] = None
+
+
 class JobStatusType(str, Enum):
     SUBMITTED = "submitted"
     EXTRACTING = "extracting"
@@ -78,15 +274,99 @@ class JobStatusType(str, Enum):
     ERROR = "error"
 
 
+class BatchStage(str, Enum):
+    """
+    Stage of a single batch flowing through a streaming pipeline.
+    """
+
+    EXTRACTING = "extracting"
+    QUEUED_FOR_TRANSFORM = "queued_for_transform"
+    TRANSFORMING = "transforming"
+    VALIDATING = "validating"
+    QUEUED_FOR_LOAD = "queued_for_load"
+    LOADING = "loading"
+
+
+class RejectedRecord(BaseModel):
+    """
+    A record that was not loaded, with the reasons for its rejection.
+    """
+
+    record: Any
+    reasons: list[str]
+    # Kind of record, for batches holding several kinds of records (e.g. "experiment" or "resource")
+    kind: Optional[str] = None
+
+
 class JobStatus(SQLModel, table=True):
     """
     Describes the current status of a job
     """
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Set for the jobs submitted together in a bulk submission
+    group_id: Optional[uuid.UUID] = Field(default=None, index=True)
     status: JobStatusType = Field(sa_column=Column(SQLModelEnum(JobStatusType)))
     job_data: dict = Field(sa_column=Column(JSON))
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     completed_at: Optional[datetime] = None
     error_at: Optional[datetime] = None
     error_message: Optional[str] = None
+    # Per-stage queue depths and active stage of in-flight batches, see PipelineProgress
+    progress: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # Set for the shards of a sharded job, whose status is merged from its shards' statuses
+    parent_id: Optional[uuid.UUID] = Field(default=None, index=True)
+    # Set for the jobs run by workers, the datasets the job loads into, see JobWorker
+    queue_key: Optional[str] = Field(default=None, index=True)
+    # Worker running the job, the job can be claimed again once the lease expires without a heartbeat
+    worker_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+
+
+class JobGroupStatus(BaseModel):
+    """
+    Aggregate status of the jobs of a bulk submission.
+    """
+
+    group_id: uuid.UUID
+    total: int
+    # Number of jobs in each status
+    statuses: dict[JobStatusType, int]
+    # All the jobs of the group are done, successfully or not
+    completed: bool
+
+
+class LoadedRecord(SQLModel, table=True):
+    """
+    Ledger entry of a record successfully loaded in a dataset, see LoadLedger
+    """
+
+    dataset_id: str = Field(primary_key=True)
+    data_type: str = Field(primary_key=True)
+    record_id: str = Field(primary_key=True)
+    content_hash: str
+    loaded_at: datetime = Field(default_factory=datetime.now)
+
+
+class PipelineWatermark(SQLModel, table=True):
+    """
+    Watermark of the last successful incremental extraction of a pipeline definition
+    """
+
+    pipeline_name: str = Field(primary_key=True)
+    watermark: dict = Field(sa_column=Column(JSON))
+    job_id: uuid.UUID
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class PipelineSchedule(SQLModel, table=True):
+    """
+    Next run of a scheduled pipeline definition, kept across restarts
+    """
+
+    pipeline_name: str = Field(primary_key=True)
+    cron: str
+    next_run_at: datetime
+    last_run_at: Optional[datetime] = None
+    last_job_id: Optional[uuid.UUID] = None
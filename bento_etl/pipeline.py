@@ -0,0 +1,636 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from logging import Logger
+from typing import Any
+from uuid import UUID
+
+from bento_etl.db import JobStatusDatabase
+from bento_etl.dead_letter import DeadLetterStore, DeadLetterWriter
+from bento_etl.extractors.base import BaseExtractor
+from bento_etl.formats import to_records
+from bento_etl.ledger import LoadLedger
+from bento_etl.loaders.base import BaseLoader, PartialLoadError
+from bento_etl.models import BatchStage, JobStatusType, RejectedRecord
+from bento_etl.profiler import JobProfiler
+from bento_etl.tracing import span
+from bento_etl.transformers.base import BaseTransformer
+from bento_etl.validators.base import BaseValidator
+
+__all__ = ["PipelineProgress", "StreamingPipeline", "PipelineBranch", "FanOutPipeline"]
+
+# Marks the end of a stage's output in the queue connecting it to the next stage
+_END_OF_STREAM = object()
+
+# Job statuses of a running pipeline, in the order they are reached
+_RUNNING_STATUSES = [
+    JobStatusType.SUBMITTED,
+    JobStatusType.EXTRACTING,
+    JobStatusType.TRANSFORMING,
+    JobStatusType.LOADING,
+]
+
+
+def _is_further(status: JobStatusType, than: JobStatusType) -> bool:
+    return _RUNNING_STATUSES.index(status) > _RUNNING_STATUSES.index(than)
+
+
+def _record_count(batch) -> int:
+    if isinstance(batch, list):
+        return len(batch)
+    if isinstance(batch, dict) and isinstance(batch.get("experiments"), list):
+        return len(batch["experiments"])
+    # Polars DataFrames, or a single JSON object
+    return getattr(batch, "height", 1)
+
+
+async def _extract_stage(
+    extractor: BaseExtractor, pipelines: list["StreamingPipeline"]
+):
+    """
+    Queues each extracted batch for the transform stage of all the given pipelines.
+    """
+    batches = extractor.extract_batches()
+    batch_index = 0
+    while True:
+        for pipeline in pipelines:
+            pipeline.progress.set_stage(batch_index, BatchStage.EXTRACTING)
+        with span("etl.extract.batch", {"etl.batch.index": batch_index}) as batch_span:
+            # Extractors are synchronous, pull each batch from a worker thread to keep the loop free
+            batch = await asyncio.to_thread(next, batches, _END_OF_STREAM)
+            if batch is not _END_OF_STREAM:
+                batch_span.set_attribute("etl.records", _record_count(batch))
+        if batch is _END_OF_STREAM:
+            for pipeline in pipelines:
+                pipeline.progress.active_batches.pop(batch_index, None)
+            break
+
+        for pipeline in pipelines:
+            pipeline.progress.set_stage(batch_index, BatchStage.QUEUED_FOR_TRANSFORM)
+            await pipeline._put(
+                pipeline.transform_queue, "transform", (batch_index, batch)
+            )
+        batch_index += 1
+
+    for pipeline in pipelines:
+        await pipeline._put(pipeline.transform_queue, "transform", _END_OF_STREAM)
+
+
+async def _instrumented(profiler: JobProfiler | None, name: str, stage):
+    with span(f"etl.stage {name}", {"etl.stage": name}):
+        if profiler is None:
+            return await stage
+        profiler.stage_started(name)
+        try:
+            return await stage
+        finally:
+            profiler.stage_finished(name)
+
+
+def _record_reasons(rejected_record: RejectedRecord) -> list[str]:
+    # Records rejected together share a dead letter, their reasons are told apart by record ID
+    record = rejected_record.record
+    if not isinstance(record, dict) or record.get("id") is None:
+        return rejected_record.reasons
+    return [f"{record['id']}: {reason}" for reason in rejected_record.reasons]
+
+
+async def _close_writer(writer: DeadLetterWriter | None):
+    if writer is not None:
+        await asyncio.to_thread(writer.close)
+
+
+async def _run_stages(stages: list[asyncio.Task], logger: Logger):
+    try:
+        await asyncio.gather(*stages)
+    except Exception:
+        logger.warning("Pipeline stage failed, cancelling all stages")
+        for stage in stages:
+            stage.cancel()
+        raise
+
+
+class PipelineProgress:
+    """
+    In-memory view of a running pipeline, periodically persisted on the job's status.
+
+    Tracks the depth of the queues between stages, the active stage of every in-flight batch
+    and the number of batches that went through the whole pipeline.
+    """
+
+    def __init__(self):
+        self.queue_depths: dict[str, int] = {"transform": 0, "load": 0}
+        self.active_batches: dict[int, BatchStage] = {}
+        self.completed_batches = 0
+        self.rejected_records = 0
+        self.failed_uploads = 0
+        self.skipped_records = 0
+
+    def set_stage(self, batch_index: int, stage: BatchStage):
+        self.active_batches[batch_index] = stage
+
+    def complete(self, batch_index: int):
+        self.active_batches.pop(batch_index, None)
+        self.completed_batches += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "queue_depths": dict(self.queue_depths),
+            "active_batches": {
+                str(index): stage.value for index, stage in self.active_batches.items()
+            },
+            "completed_batches": self.completed_batches,
+            "rejected_records": self.rejected_records,
+            "failed_uploads": self.failed_uploads,
+            "skipped_records": self.skipped_records,
+        }
+
+
+class StreamingPipeline:
+    """
+    Staged streaming executor for an ETL job.
+
+    The extract, transform and load stages run concurrently and are connected by bounded queues:
+    while batch N is transformed, batch N+1 is extracted and batch N-1 is loaded.
+    A full queue blocks the upstream stage, which bounds memory usage to a few batches in flight.
+    Extraction, transforms, validation and ledger lookups run in worker threads, the event loop is left to the
+    uploads. Transformers and validators must therefore not rely on running in the event loop's thread.
+
+    A "batch" here is one chunk produced by `BaseExtractor.extract_batches`, which the loader
+    may further slice into several upload requests according to its `batch_size`.
+
+    When a validator is given, transformed batches are validated before being queued for loading.
+    Invalid records are dead-lettered and the rest of the batch keeps flowing.
+    Records rejected by the target service are isolated by the loader and dead-lettered, the rest of their upload
+    is loaded. Failed uploads are dead-lettered as well and the load stage moves on to the next upload,
+    the run raises once all batches went through if any upload failed.
+
+    When a ledger is given, successfully loaded records are recorded in it and, if the loader is configured to,
+    records that were already loaded with the same content are not uploaded again.
+
+    When a profiler is given, it is told when each stage starts and finishes.
+    Each stage, extracted batch and transformed batch is traced in its own span, see `tracing`.
+    """
+
+    def __init__(
+        self,
+        job_id: UUID,
+        extractor: BaseExtractor,
+        transformer: BaseTransformer | None,
+        loader: BaseLoader,
+        db: JobStatusDatabase,
+        logger: Logger,
+        queue_size: int = 4,
+        load_concurrency: int = 4,
+        progress_interval: float = 1.0,
+        validator: BaseValidator | None = None,
+        dead_letters: DeadLetterStore | None = None,
+        ledger: LoadLedger | None = None,
+        profiler: JobProfiler | None = None,
+    ):
+        if queue_size < 1:
+            raise ValueError("Queue size must be at least 1")
+        if load_concurrency < 1:
+            raise ValueError("Load concurrency must be at least 1")
+
+        self.job_id = job_id
+        self.extractor = extractor
+        self.transformer = transformer
+        self.loader = loader
+        self.validator = validator
+        self.dead_letters = dead_letters
+        self.ledger = ledger
+        self.profiler = profiler
+        self.db = db
+        self.logger = logger
+        self.load_concurrency = load_concurrency
+        self.progress_interval = progress_interval
+
+        self.transform_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.load_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.progress = PipelineProgress()
+
+        self._status = JobStatusType.SUBMITTED
+        self._last_report = 0.0
+        # Number of loader requests still pending for each batch
+        self._pending_uploads: dict[int, int] = {}
+        self._last_upload_error: Exception | None = None
+        # Open while the pipeline runs, shared by the branches of a fan-out pipeline
+        self._dead_letter_writer: DeadLetterWriter | None = None
+
+    async def run(self):
+        self._advance_status(JobStatusType.EXTRACTING)
+        if self.dead_letters:
+            self._dead_letter_writer = self.dead_letters.writer(self.job_id)
+
+        async with self.loader.client() as client:
+            stages = [
+                asyncio.create_task(
+                    _instrumented(
+                        self.profiler,
+                        "extract",
+                        _extract_stage(self.extractor, [self]),
+                    )
+                ),
+                *self._downstream_stages(client),
+            ]
+            try:
+                await _run_stages(stages, self.logger)
+            finally:
+                self._report(force=True)
+                await _close_writer(self._dead_letter_writer)
+
+        if self._last_upload_error:
+            raise Exception(self._upload_error_message())
+
+    def _stage_name(self, stage: str) -> str:
+        return stage
+
+    def _downstream_stages(self, client) -> list[asyncio.Task]:
+        return [
+            asyncio.create_task(
+                _instrumented(
+                    self.profiler,
+                    self._stage_name("transform"),
+                    self._transform_stage(),
+                )
+            ),
+            *[
+                asyncio.create_task(
+                    _instrumented(
+                        self.profiler,
+                        self._stage_name("load"),
+                        self._load_stage(client),
+                    )
+                )
+                for _ in range(self.load_concurrency)
+            ],
+        ]
+
+    def _upload_error_message(self) -> str:
+        return (
+            f"{self.progress.failed_uploads} upload(s) failed and were dead-lettered, "
+            f"last error: {self._last_upload_error}"
+        )
+
+    async def _transform_stage(self):
+        while (
+            item := await self._get(self.transform_queue, "transform")
+        ) is not _END_OF_STREAM:
+            batch_index, data = item
+
+            with span(
+                "etl.transform.batch",
+                {"etl.batch.index": batch_index, "etl.records": _record_count(data)},
+            ) as batch_span:
+                if self.transformer:
+                    self._advance_status(JobStatusType.TRANSFORMING)
+                    self.progress.set_stage(batch_index, BatchStage.TRANSFORMING)
+                # CPU-bound, runs in a worker thread so that the other stages keep extracting and loading meanwhile
+                records, data, rejected = await asyncio.to_thread(
+                    self._transform_batch, batch_index, data
+                )
+                if data is not None:
+                    batch_span.set_attribute("etl.records.out", _record_count(data))
+            await self._reject_records(batch_index, records, rejected, "validation")
+            if data is None:
+                self.progress.complete(batch_index)
+                continue
+
+            uploads = self.loader._create_data_batches(data)
+            if not uploads:
+                self.progress.complete(batch_index)
+                continue
+
+            self._pending_uploads[batch_index] = len(uploads)
+            self.progress.set_stage(batch_index, BatchStage.QUEUED_FOR_LOAD)
+            for upload in uploads:
+                await self._put(self.load_queue, "load", (batch_index, upload))
+
+        # One end-of-stream marker per load worker
+        for _ in range(self.load_concurrency):
+            await self._put(self.load_queue, "load", _END_OF_STREAM)
+
+    def _transform_batch(
+        self, batch_index: int, data
+    ) -> tuple[Any, Any, list[RejectedRecord]]:
+        """
+        Transforms and validates a batch, called from a worker thread.
+        Returns the transformed records, their valid part (None if all of them were rejected) and the rejected records.
+        """
+        if self.transformer:
+            data = self.transformer.transform(data)
+
+        # Columnar batches stay columnar up to here, validators and loaders work on JSON records
+        records = to_records(data)
+
+        if not self.validator:
+            return records, records, []
+        self.progress.set_stage(batch_index, BatchStage.VALIDATING)
+        data, rejected = self.validator.validate(records)
+        return records, data, rejected
+
+    async def _load_stage(self, client):
+        while (item := await self._get(self.load_queue, "load")) is not _END_OF_STREAM:
+            batch_index, upload = item
+
+            self._advance_status(JobStatusType.LOADING)
+            self.progress.set_stage(batch_index, BatchStage.LOADING)
+            rejected = None
+            try:
+                upload = await self._skip_loaded_records(upload)
+                if upload is not None:
+                    rejected = await self.loader.load_batch(client, upload)
+            except PartialLoadError as e:
+                # Only the unsent records are dead-lettered, the loaded ones must not be re-driven
+                self.logger.error(f"Upload from batch {batch_index} failed: {e}")
+                self.progress.failed_uploads += 1
+                self._last_upload_error = e
+                await self._dead_letter("load", [str(e)], e.unsent)
+                upload = self.loader._replace_batch_records(upload, e.loaded)
+                rejected = e.rejected
+            except Exception as e:
+                self.logger.error(f"Upload from batch {batch_index} failed: {e}")
+                self.progress.failed_uploads += 1
+                self._last_upload_error = e
+                await self._dead_letter("load", [str(e)], upload)
+
+            # The upload went through, at least partly: what follows must not count it as a failed upload
+            if rejected is not None:
+                await self._reject_records(batch_index, upload, rejected, "load")
+                await self._add_loaded_records(upload, rejected)
+
+            self._pending_uploads[batch_index] -= 1
+            if self._pending_uploads[batch_index] == 0:
+                del self._pending_uploads[batch_index]
+                self.progress.complete(batch_index)
+            self._report()
+
+    def _tracks_loaded_records(self) -> bool:
+        return self.ledger is not None and self.loader.dataset_id is not None
+
+    async def _skip_loaded_records(self, upload):
+        if not (self._tracks_loaded_records() and self.loader.skip_loaded_records):
+            return upload
+
+        records = self.loader._batch_records(upload)
+        if not records:
+            # E.g. re-driven experiment resources, without experiments
+            return upload
+        # Hashes the records and queries the database, in a worker thread like the transforms
+        changed = await asyncio.to_thread(
+            self.ledger.filter_loaded,
+            self.loader.dataset_id,
+            self.loader.data_type,
+            records,
+        )
+        self.progress.skipped_records += len(records) - len(changed)
+        if not changed:
+            return None
+        if len(changed) == len(records):
+            return upload
+        return self.loader._replace_batch_records(upload, changed)
+
+    async def _add_loaded_records(self, upload, rejected: list[RejectedRecord]):
+        if not self._tracks_loaded_records():
+            return
+
+        rejected_records = {id(rejected_record.record) for rejected_record in rejected}
+        loaded = [
+            record
+            for record in self.loader._batch_records(upload)
+            if id(record) not in rejected_records
+        ]
+        try:
+            await asyncio.to_thread(
+                self.ledger.add_loaded,
+                self.loader.dataset_id,
+                self.loader.data_type,
+                loaded,
+            )
+        except Exception as e:
+            # The records are in the target, the next runs only load them again
+            self.logger.error(
+                f"Could not record {len(loaded)} loaded record(s) in the ledger: {e}"
+            )
+
+    async def _reject_records(
+        self, batch_index: int, batch, rejected: list[RejectedRecord], stage: str
+    ):
+        if not rejected:
+            return
+        self.progress.rejected_records += len(rejected)
+        self.logger.warning(
+            f"Rejected {len(rejected)} record(s) in batch {batch_index}, first reasons: {rejected[0].reasons}"
+        )
+        # Records rejected together are stored in the same payload, re-driven to the same loader in a single upload
+        for payload, records in self.loader._dead_letter_payloads(batch, rejected):
+            reasons = [
+                reason for record in records for reason in _record_reasons(record)
+            ]
+            await self._dead_letter(stage, reasons, payload)
+
+    async def _dead_letter(
+        self, stage: str, reasons: list[str], payload, branch: str | None = None
+    ):
+        if self._dead_letter_writer is not None:
+            # Blocking gzip write
+            await asyncio.to_thread(
+                self._dead_letter_writer.write, stage, reasons, payload, branch
+            )
+
+    async def _put(self, queue: asyncio.Queue, name: str, item):
+        # Blocks when the downstream stage is behind (backpressure)
+        await queue.put(item)
+        self.progress.queue_depths[name] = queue.qsize()
+        self._report()
+
+    async def _get(self, queue: asyncio.Queue, name: str):
+        item = await queue.get()
+        self.progress.queue_depths[name] = queue.qsize()
+        return item
+
+    def _advance_status(self, status: JobStatusType):
+        # The job status reflects the furthest stage reached by any batch
+        if _is_further(status, self._status):
+            self._status = status
+            self.db.update_status(self.job_id, status)
+
+    def _report(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            self.db.update_progress(self.job_id, self.progress.as_dict())
+
+
+class PipelineBranch:
+    """
+    Transform, validation and load steps of one branch of a fan-out pipeline.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        transformer: BaseTransformer | None,
+        loader: BaseLoader,
+        validator: BaseValidator | None = None,
+    ):
+        self.name = name
+        self.transformer = transformer
+        self.loader = loader
+        self.validator = validator
+
+
+class _BranchPipeline(StreamingPipeline):
+    """
+    Transform and load stages of a branch, its status and progress are reported by its fan-out pipeline.
+    """
+
+    def __init__(self, fan_out: "FanOutPipeline", branch: PipelineBranch, **kwargs):
+        self.name = branch.name
+        self.fan_out = fan_out
+        super().__init__(
+            transformer=branch.transformer,
+            loader=branch.loader,
+            validator=branch.validator,
+            **kwargs,
+        )
+
+    def _advance_status(self, status: JobStatusType):
+        if _is_further(status, self._status):
+            self._status = status
+            self.fan_out._advance_status(status)
+
+    def _report(self, force: bool = False):
+        self.fan_out._report(force)
+
+    def _stage_name(self, stage: str) -> str:
+        return f"{stage} ({self.name})"
+
+    async def _dead_letter(
+        self, stage: str, reasons: list[str], payload, branch: str | None = None
+    ):
+        await super()._dead_letter(stage, reasons, payload, self.name)
+
+
+class FanOutPipeline:
+    """
+    Streaming executor for a job with several branches, each with its own transform and load steps.
+
+    The source is extracted once, every extracted batch is shared in memory by all the branches. Transformers,
+    validators and loaders must not modify the batches they receive in place.
+    Each branch has its own bounded queues and load workers: a slow branch does not slow down the others until
+    its transform queue is full, at which point the extraction waits for it.
+
+    The job status reflects the furthest stage reached by any branch, the job's progress has the status and
+    progress of each branch under `branches`. Failed uploads are dead-lettered with their branch name.
+    """
+
+    def __init__(
+        self,
+        job_id: UUID,
+        extractor: BaseExtractor,
+        branches: list[PipelineBranch],
+        db: JobStatusDatabase,
+        logger: Logger,
+        queue_size: int = 4,
+        load_concurrency: int = 4,
+        progress_interval: float = 1.0,
+        dead_letters: DeadLetterStore | None = None,
+        ledger: LoadLedger | None = None,
+        profiler: JobProfiler | None = None,
+    ):
+        if not branches:
+            raise ValueError("A fan-out pipeline needs at least one branch")
+
+        self.job_id = job_id
+        self.extractor = extractor
+        self.db = db
+        self.logger = logger
+        self.progress_interval = progress_interval
+        self.profiler = profiler
+        self.dead_letters = dead_letters
+        self.pipelines = [
+            _BranchPipeline(
+                self,
+                branch,
+                job_id=job_id,
+                extractor=extractor,
+                db=db,
+                logger=logger,
+                queue_size=queue_size,
+                load_concurrency=load_concurrency,
+                progress_interval=progress_interval,
+                dead_letters=dead_letters,
+                ledger=ledger,
+                profiler=profiler,
+            )
+            for branch in branches
+        ]
+
+        self._status = JobStatusType.SUBMITTED
+        self._branch_statuses: dict[str, JobStatusType] = {}
+        self._last_report = 0.0
+
+    async def run(self):
+        self._advance_status(JobStatusType.EXTRACTING)
+        # The branches write to the same dead-letter file, tagged with their name
+        writer = self.dead_letters.writer(self.job_id) if self.dead_letters else None
+        for pipeline in self.pipelines:
+            pipeline._dead_letter_writer = writer
+
+        async with AsyncExitStack() as stack:
+            stages = [
+                asyncio.create_task(
+                    _instrumented(
+                        self.profiler,
+                        "extract",
+                        _extract_stage(self.extractor, self.pipelines),
+                    )
+                )
+            ]
+            for pipeline in self.pipelines:
+                client = await stack.enter_async_context(pipeline.loader.client())
+                stages.extend(pipeline._downstream_stages(client))
+            try:
+                await _run_stages(stages, self.logger)
+                for pipeline in self.pipelines:
+                    failed = pipeline._last_upload_error is not None
+                    self._branch_statuses[pipeline.name] = (
+                        JobStatusType.ERROR if failed else JobStatusType.SUCCESS
+                    )
+            finally:
+                self._report(force=True)
+                await _close_writer(writer)
+
+        failed_branches = [
+            f"{pipeline.name}: {pipeline._upload_error_message()}"
+            for pipeline in self.pipelines
+            if pipeline._last_upload_error
+        ]
+        if failed_branches:
+            raise Exception(f"Branch(es) failed, {'; '.join(failed_branches)}")
+
+    def progress_as_dict(self) -> dict[str, Any]:
+        return {
+            "branches": {
+                pipeline.name: {
+                    "status": self._branch_statuses.get(
+                        pipeline.name, pipeline._status
+                    ).value,
+                    **pipeline.progress.as_dict(),
+                }
+                for pipeline in self.pipelines
+            }
+        }
+
+    def _advance_status(self, status: JobStatusType):
+        if _is_further(status, self._status):
+            self._status = status
+            self.db.update_status(self.job_id, status)
+
+    def _report(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            self.db.update_progress(self.job_id, self.progress_as_dict())
@@ -0,0 +1,106 @@
+import json
+import os
+from functools import lru_cache
+from typing import Annotated
+
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.logger import BoundLogger, LoggerDependency
+from bento_etl.models import Job, PipelineDefinition
+
+__all__ = [
+    "PipelineRegistry",
+    "get_pipeline_registry",
+    "PipelineRegistryDependency",
+]
+
+
+class PipelineRegistry:
+    """
+    Cache of the validated pipeline definitions of `PIPELINES_DIR`, indexed by file name without the extension.
+
+    Files are only read and validated again when their modification time changes, checked with a single
+    directory scan on each access. Malformed files are kept with their validation error instead of a job.
+    Pipelines without a `name` are named after their file.
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.directory = os.path.abspath(config.pipelines_dir)
+        self._definitions: dict[str, PipelineDefinition] = {}
+        self._mtimes: dict[str, int] = {}
+
+    def _load(self, name: str) -> PipelineDefinition:
+        path = os.path.join(self.directory, f"{name}.json")
+        try:
+            with open(path) as file:
+                job = Job.model_validate(json.load(file))
+        except Exception as e:
+            self.logger.error(f"Malformed pipeline file {path}: {e}")
+            return PipelineDefinition(name=name, error=str(e))
+
+        job.name = job.name or name
+        self.logger.info(f"Loaded pipeline {name} from {path}")
+        return PipelineDefinition(name=name, job=job)
+
+    def reload(self):
+        try:
+            mtimes = {
+                entry.name.removesuffix(".json"): entry.stat().st_mtime_ns
+                for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(".json")
+            }
+        except FileNotFoundError:
+            mtimes = {}
+        if mtimes == self._mtimes:
+            return
+
+        for name, mtime in mtimes.items():
+            if self._mtimes.get(name) != mtime:
+                self._definitions[name] = self._load(name)
+        for name in self._mtimes.keys() - mtimes.keys():
+            self.logger.info(f"Removed pipeline {name}")
+            del self._definitions[name]
+        self._mtimes = mtimes
+
+    def definitions(self) -> list[PipelineDefinition]:
+        self.reload()
+        return [
+            definition.model_copy(deep=True)
+            for _, definition in sorted(self._definitions.items())
+        ]
+
+    def jobs(self) -> dict[str, Job]:
+        """
+        Returns the valid pipeline definitions by name.
+        """
+        return {
+            definition.name: definition.job
+            for definition in self.definitions()
+            if definition.job is not None
+        }
+
+    def get(self, name: str) -> Job:
+        self.reload()
+        definition = self._definitions.get(name)
+        if definition is None:
+            raise KeyError(f"Pipeline {name} not found in {self.directory}")
+        if definition.job is None:
+            raise ValueError(f"Pipeline {name} is malformed: {definition.error}")
+        return definition.job.model_copy(deep=True)
+
+    def errors(self) -> dict[str, str]:
+        return {
+            definition.name: definition.error
+            for definition in self.definitions()
+            if definition.error is not None
+        }
+
+
+@lru_cache
+def get_pipeline_registry(logger: LoggerDependency, config: ConfigDependency):
+    return PipelineRegistry(logger, config)
+
+
+PipelineRegistryDependency = Annotated[PipelineRegistry, Depends(get_pipeline_registry)]
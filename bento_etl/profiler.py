@@ -0,0 +1,259 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+from functools import lru_cache
+from types import FrameType
+from typing import Annotated, Any
+from uuid import UUID
+
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.logger import BoundLogger, LoggerDependency
+
+__all__ = [
+    "JobProfiler",
+    "ProfileStore",
+    "get_profile_store",
+    "ProfileStoreDependency",
+]
+
+# Functions whose frames attribute a sample to a pipeline stage, searched from the leaf of the stack
+STAGE_FRAMES = {
+    "extract_batches": "extract",
+    "_extract_stage": "extract",
+    "_transform_stage": "transform",
+    "_load_stage": "load",
+}
+
+# Label of the samples of the event loop thread outside of any stage, mostly time spent waiting for I/O
+IDLE_STAGE = "idle"
+
+# tracemalloc is process-wide, it is traced as long as a profiled job is running
+_tracing_lock = threading.Lock()
+_tracing_jobs = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_jobs, _tracing_started
+    with _tracing_lock:
+        if _tracing_jobs == 0 and not tracemalloc.is_tracing():
+            # Not stopped afterwards if something else started it
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_jobs += 1
+
+
+def _stop_tracing():
+    global _tracing_jobs, _tracing_started
+    with _tracing_lock:
+        _tracing_jobs -= 1
+        if _tracing_jobs == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    # Flamegraph tools split stacks on semicolons
+    path = "/".join(code.co_filename.split(os.sep)[-2:]).replace(";", "_")
+    return f"{code.co_qualname} ({path}:{code.co_firstlineno})"
+
+
+def _stack(frame: FrameType | None) -> list[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class JobProfiler:
+    """
+    Profile of a single job run, with:
+    - a sampling profiler: a thread takes the stacks of the event loop thread and of the extraction threads every
+      `sample_interval` seconds, attributed to the pipeline stage running them. Samples of the event loop thread
+      outside of any stage are attributed to `idle`, mostly time spent waiting for the target service.
+    - the traced memory when each stage finishes, and tracemalloc snapshots at the start and at the end of the job
+      with the allocation sites that grew the most in between. Snapshots of a large heap take a while, `start` and
+      `stop` are meant to be run in a worker thread, see `run_pipeline`.
+
+    Profiles are wall-clock profiles of the whole process: jobs running at the same time share the event loop, their
+    samples may appear in each other's profiles.
+    """
+
+    def __init__(self, sample_interval: float = 0.05, memory_top: int = 25):
+        self.sample_interval = sample_interval
+        self.memory_top = memory_top
+        self.stacks: Counter[str] = Counter()
+        self.stages: dict[str, dict[str, float]] = {}
+        self.memory: list[dict[str, Any]] = []
+
+        self._loop_thread_id: int | None = None
+        self._started_at = 0.0
+        self._stage_workers: Counter[str] = Counter()
+        self._start_snapshot: tracemalloc.Snapshot | None = None
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def start(self, loop_thread_id: int | None = None):
+        # The event loop thread is sampled even outside of stages, defaults to the calling thread
+        self._loop_thread_id = loop_thread_id or threading.get_ident()
+        self._started_at = time.monotonic()
+        _start_tracing()
+        self._start_snapshot = self._snapshot("start")
+        self._sampler = threading.Thread(
+            target=self._sample_loop, name="job-profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._snapshot("end")
+        self._start_snapshot = None
+        _stop_tracing()
+
+    def stage_started(self, name: str):
+        # Stages with several workers (e.g. load) start with their first worker and finish with their last one
+        if self._stage_workers[name] == 0 and name not in self.stages:
+            self.stages[name] = {"started_at": time.monotonic() - self._started_at}
+        self._stage_workers[name] += 1
+
+    def stage_finished(self, name: str):
+        self._stage_workers[name] -= 1
+        if self._stage_workers[name] == 0:
+            stage = self.stages[name]
+            stage["duration"] = (
+                time.monotonic() - self._started_at - stage["started_at"]
+            )
+            # Called from the event loop, the snapshot diffs are only taken at the end of the job
+            self._memory(f"{name} finished")
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self.sample()
+
+    def sample(self):
+        sampler_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+            stack = _stack(frame)
+            stage = next(
+                (
+                    STAGE_FRAMES[f.f_code.co_name]
+                    for f in reversed(stack)
+                    if f.f_code.co_name in STAGE_FRAMES
+                ),
+                None,
+            )
+            if stage is None:
+                if thread_id != self._loop_thread_id:
+                    # Idle worker threads, or threads unrelated to the job
+                    continue
+                stage = IDLE_STAGE
+            self.stacks[";".join([stage, *map(_frame_name, stack)])] += 1
+
+    def _memory(self, label: str, top: list[dict[str, Any]] | None = None):
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory.append(
+            {
+                "label": label,
+                "at": time.monotonic() - self._started_at,
+                "traced_current": current,
+                "traced_peak": peak,
+                "top_allocations": top or [],
+            }
+        )
+
+    def _snapshot(self, label: str) -> tracemalloc.Snapshot | None:
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        top = []
+        if self._start_snapshot is not None:
+            top = [
+                {
+                    "location": str(stat.traceback),
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in snapshot.compare_to(self._start_snapshot, "lineno")[
+                    : self.memory_top
+                ]
+            ]
+        self._memory(label, top)
+        return snapshot
+
+    def collapsed_stacks(self) -> str:
+        """
+        Samples in the collapsed stack format of flamegraph.pl, which speedscope and most flamegraph tools read.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def summary(self) -> dict[str, Any]:
+        samples = Counter()
+        for stack, count in self.stacks.items():
+            samples[stack.split(";", 1)[0]] += count
+        return {
+            "sample_interval": self.sample_interval,
+            "samples": dict(samples),
+            "stages": self.stages,
+            "memory": self.memory,
+        }
+
+
+class ProfileStore:
+    """
+    Local store for the profiles of the jobs submitted with `profile`, indexed by job ID.
+
+    Each profile is a zip archive with:
+    - `stacks.folded`: the sampled stacks, in the collapsed stack format of flamegraph tools
+    - `summary.json`: the samples per stage, the stage durations and the memory snapshots, in seconds and bytes
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.directory = config.profile_dir
+
+    def path(self, job_id: UUID) -> str:
+        return os.path.join(self.directory, f"{job_id}.profile.zip")
+
+    def save(self, job_id: UUID, profiler: JobProfiler):
+        os.makedirs(self.directory, exist_ok=True)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("stacks.folded", profiler.collapsed_stacks())
+            archive.writestr("summary.json", json.dumps(profiler.summary(), indent=2))
+        with open(self.path(job_id), "wb") as f:
+            f.write(buffer.getvalue())
+        self.logger.info(f"Profile of job {job_id} saved to {self.path(job_id)}")
+
+    def exists(self, job_id: UUID) -> bool:
+        return os.path.isfile(self.path(job_id))
+
+    def delete(self, job_id: UUID):
+        if self.exists(job_id):
+            os.remove(self.path(job_id))
+
+
+@lru_cache
+def get_profile_store(logger: LoggerDependency, config: ConfigDependency):
+    return ProfileStore(logger, config)
+
+
+ProfileStoreDependency = Annotated[ProfileStore, Depends(get_profile_store)]
@@ -1,65 +1,279 @@
-import json
+import asyncio
 import os
+import threading
 import uuid
 from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import FileResponse
 
 from bento_lib.auth.permissions import P_DELETE_DATA, P_INGEST_DATA
 from bento_lib.auth.resources import RESOURCE_EVERYTHING
 
-from bento_etl.authz import authz_middleware
-from bento_etl.config import ConfigDependency
-from bento_etl.db import JobStatusDatabaseDependency
+from bento_etl.authz import dep_public_endpoint, dep_require_permissions_on_resource
+from bento_etl.config import Config, ConfigDependency, get_config
+from bento_etl.db import JobStatusDatabase, JobStatusDatabaseDependency
+from bento_etl.dead_letter import (
+    DeadLetterStore,
+    DeadLetterStoreDependency,
+    get_dead_letter_store,
+)
 from bento_etl.extractors.base import BaseExtractor
-from bento_etl.extractors.dependencies import ExtractorDep, get_extractor
+from bento_etl.extractors.dead_letter_extractor import DeadLetterExtractor
+from bento_etl.extractors.dependencies import get_extractor
+from bento_etl.job_limiter import JobLimiterDependency, job_targets
+from bento_etl.ledger import LoadLedger
 from bento_etl.loaders.base import BaseLoader
-from bento_etl.loaders.dependencies import LoaderDep, get_loader
-from bento_etl.logger import LoggerDependency
-from bento_etl.models import Job, JobStatus, JobStatusType
+from bento_etl.loaders.dependencies import get_loader
+from bento_etl.logger import BoundLogger, LoggerDependency
+from bento_etl.models import (
+    DeadLetterExtractStep,
+    Job,
+    JobGroupStatus,
+    JobStatus,
+    JobStatusType,
+    TransformStep,
+)
+from bento_etl.pipeline import FanOutPipeline, PipelineBranch, StreamingPipeline
+from bento_etl.pipeline_registry import PipelineRegistryDependency
+from bento_etl.profiler import (
+    JobProfiler,
+    ProfileStore,
+    ProfileStoreDependency,
+    get_profile_store,
+)
+from bento_etl.tracing import record_error, span
 from bento_etl.transformers.base import BaseTransformer
-from bento_etl.transformers.dependencies import TransformerDep, get_transformer
+from bento_etl.transformers.dependencies import get_transformer
+from bento_etl.validators.base import BaseValidator
+from bento_etl.validators.dependencies import get_validator
 
-DEPENDENCY_INGEST_DATA = authz_middleware.dep_require_permissions_on_resource(
+DEPENDENCY_INGEST_DATA = dep_require_permissions_on_resource(
     frozenset({P_INGEST_DATA}), RESOURCE_EVERYTHING
 )
-DEPENDENCY_DELETE_DATA = authz_middleware.dep_require_permissions_on_resource(
+DEPENDENCY_DELETE_DATA = dep_require_permissions_on_resource(
     frozenset({P_DELETE_DATA}), RESOURCE_EVERYTHING
 )
 
-__all__ = ["job_router"]
+__all__ = [
+    "job_router",
+    "get_branches",
+    "queue_key",
+    "enqueue_jobs",
+    "enqueue_job",
+    "check_job",
+    "run_job",
+    "run_pipeline",
+]
 
 """
 Jobs router plan:
 /jobs       [GET]       => list submitted jobs
 /jobs       [POST]      => submit a job
+/jobs/bulk  [POST]      => submit a group of jobs, run with bounded concurrency
+/jobs/groups/{ID} [GET] => get the aggregate status of a group of jobs
 /jobs/{ID}  [GET]       => get a specific job
 /jobs/{ID}  [DELETE]    => kill a job if it is running
+/jobs/{ID}/dead-letters [GET]   => download the data a job could not load
+/jobs/{ID}/profile      [GET]   => download the profile of a job submitted with `profile`
+/jobs/{ID}/redrive      [POST]  => load the data a job could not load in a new job (one branch at a time for fan-out jobs)
+/jobs/{ID}/shards       [GET]   => list the shards of a sharded job
+/jobs/{ID}/shards/retry [POST]  => queue the failed shards of a sharded job again
+/jobs/pipeline/{NAME}/watermark [GET]       => get the watermark of a pipeline's incremental extractions
+/jobs/pipeline/{NAME}/watermark [DELETE]    => reset a pipeline's next incremental extraction to a full extraction
 """
 
 
+def get_branches(
+    job: Job, logger: BoundLogger, config: Config
+) -> list[PipelineBranch] | None:
+    # returns the transformer, loader and validator of each branch of a fan-out job, None for other jobs
+    if job.branches is None:
+        return None
+    return [
+        PipelineBranch(
+            name,
+            get_transformer(branch_job, logger),
+            get_loader(branch_job, logger, config),
+            get_validator(branch_job, logger),
+        )
+        for name, branch_job in job.branch_jobs().items()
+    ]
+
+
+def queue_key(job: Job) -> str:
+    # Queued jobs are scheduled fairly between the datasets they load into, see JobStatusDatabase.claim_job
+    return ",".join(job_targets(job))
+
+
+def enqueue_jobs(
+    jobs: list[Job], db: JobStatusDatabase, group_id: uuid.UUID | None = None
+) -> list[uuid.UUID]:
+    """
+    Queues jobs for the workers in a single transaction, returns their IDs.
+    A sharded job is queued as one job per shard, its own status is merged from theirs, see `Job.shard_jobs`.
+    """
+    statuses = db.create_statuses(
+        [job.model_dump(mode="json") for job in jobs],
+        group_id,
+        [queue_key(job) for job in jobs],
+        [
+            [shard.model_dump(mode="json") for shard in job.shard_jobs()]
+            if job.shards
+            else []
+            for job in jobs
+        ],
+    )
+    return [status.id for status in statuses]
+
+
+def enqueue_job(
+    job: Job, db: JobStatusDatabase, group_id: uuid.UUID | None = None
+) -> uuid.UUID:
+    """
+    Queues a job for the workers, returns its ID, see `enqueue_jobs`.
+    """
+    return enqueue_jobs([job], db, group_id)[0]
+
+
+def check_sharding(job: Job, config: Config):
+    if job.shards and not config.job_queue_enabled:
+        raise HTTPException(
+            status_code=400,
+            detail="Sharded jobs are run by the workers, JOB_QUEUE_ENABLED must be set",
+        )
+
+
+def check_job(job: Job, logger: BoundLogger, config: Config):
+    """
+    Fails if a job cannot be run, before it is stored.
+    Its extractor is not created (e.g. the S3 client of an S3 extraction), extractors are created once their job starts.
+    """
+    check_sharding(job, config)
+    get_transformer(job, logger)
+    get_loader(job, logger, config)
+    get_validator(job, logger)
+    get_branches(job, logger, config)
+
+
 async def run_pipeline(
     job_id: uuid.UUID,
     extractor: BaseExtractor,
-    transformer: BaseTransformer,
-    loader: BaseLoader,
+    transformer: BaseTransformer | None,
+    loader: BaseLoader | None,
     db: JobStatusDatabaseDependency,
+    config: Config | None = None,
+    validator: BaseValidator | None = None,
+    dead_letters: DeadLetterStore | None = None,
+    pipeline_name: str | None = None,
+    branches: list[PipelineBranch] | None = None,
+    profile: bool = False,
+    profiles: ProfileStore | None = None,
 ):
     # TODO: completion POST callback if job includes a callback URL (success, errors, warnings)
+    config = config or get_config()
+    dead_letters = dead_letters or get_dead_letter_store(db.logger, config)
+    profiler = JobProfiler(config.profile_sample_interval) if profile else None
+    profiles = profiles or get_profile_store(db.logger, config)
 
-    try:
-        db.update_status(job_id, JobStatusType.EXTRACTING)
-        data = extractor.extract()
+    attributes = {
+        "etl.job.id": str(job_id),
+        "etl.pipeline.name": pipeline_name,
+        "etl.job.branches": [branch.name for branch in branches or []] or None,
+    }
+    with span("etl.job", attributes) as job_span:
+        try:
+            # Incremental extractors only extract what changed since the last successful job of the same pipeline
+            if pipeline_name and extractor.incremental:
+                extractor.watermark = db.get_watermark(pipeline_name)
+
+            if branches:
+                # Fan-out job: the source is extracted once for all the branches
+                pipeline = FanOutPipeline(
+                    job_id,
+                    extractor,
+                    branches,
+                    db,
+                    db.logger,
+                    queue_size=config.pipeline_queue_size,
+                    load_concurrency=config.pipeline_load_concurrency,
+                    progress_interval=config.pipeline_progress_interval,
+                    dead_letters=dead_letters,
+                    ledger=LoadLedger(db.logger, db.engine),
+                    profiler=profiler,
+                )
+            else:
+                pipeline = StreamingPipeline(
+                    job_id,
+                    extractor,
+                    transformer,
+                    loader,
+                    db,
+                    db.logger,
+                    queue_size=config.pipeline_queue_size,
+                    load_concurrency=config.pipeline_load_concurrency,
+                    progress_interval=config.pipeline_progress_interval,
+                    validator=validator,
+                    dead_letters=dead_letters,
+                    ledger=LoadLedger(db.logger, db.engine),
+                    profiler=profiler,
+                )
 
-        if transformer:
-            db.update_status(job_id, JobStatusType.TRANSFORMING)
-            data = transformer.transform(data)
+            # Memory snapshots and the profile archive are made off the event loop, other jobs keep running meanwhile
+            if profiler:
+                await asyncio.to_thread(profiler.start, threading.get_ident())
+            try:
+                await pipeline.run()
+            finally:
+                # Failed jobs are profiled too, they are often the ones worth a look
+                if profiler:
+                    await asyncio.to_thread(profiler.stop)
+                    try:
+                        await asyncio.to_thread(profiles.save, job_id, profiler)
+                    except Exception as e:
+                        db.logger.error(
+                            f"Could not save the profile of job {job_id}: {e}"
+                        )
 
-        db.update_status(job_id, JobStatusType.LOADING)
-        await loader.load(data)
+            # The watermark only moves forward once all the extracted data was loaded
+            if pipeline_name and (watermark := extractor.next_watermark()) is not None:
+                db.set_watermark(pipeline_name, watermark, job_id)
+            db.update_status(job_id, JobStatusType.SUCCESS)
 
-        db.update_status(job_id, JobStatusType.SUCCESS)
+        except Exception as ex:
+            record_error(job_span, ex)
+            db.update_status(job_id, JobStatusType.ERROR, str(ex))
 
-    except Exception as ex:
-        db.update_status(job_id, JobStatusType.ERROR, str(ex))
+
+async def run_job(
+    job_id: uuid.UUID,
+    job: Job,
+    db: JobStatusDatabase,
+    config: Config,
+    dead_letters: DeadLetterStore,
+):
+    # Runs a job checked with check_job, its components are only created once it starts
+    try:
+        extractor = get_extractor(job, db.logger, config)
+        transformer = get_transformer(job, db.logger)
+        loader = get_loader(job, db.logger, config)
+        validator = get_validator(job, db.logger)
+        branches = get_branches(job, db.logger, config)
+    except Exception as e:
+        db.logger.error(f"Could not start job {job_id}: {e}")
+        db.update_status(job_id, JobStatusType.ERROR, str(e))
+        return
+    await run_pipeline(
+        job_id,
+        extractor,
+        transformer,
+        loader,
+        db,
+        config,
+        validator,
+        dead_letters,
+        job.name,
+        branches,
+        job.profile,
+    )
 
 
 job_router = APIRouter(prefix="/jobs")
@@ -67,59 +281,142 @@ job_router = APIRouter(prefix="/jobs")
 
 # TODO replace
 # @job_router.post("", dependencies=[DEPENDENCY_INGEST_DATA])
-@job_router.post("", dependencies=[authz_middleware.dep_public_endpoint()])
+@job_router.post("", dependencies=[dep_public_endpoint()])
 async def submit_job(
     job: Job,
     bt: BackgroundTasks,
-    extractor: ExtractorDep,
-    transformer: TransformerDep,
-    loader: LoaderDep,
     db: JobStatusDatabaseDependency,
+    dead_letters: DeadLetterStoreDependency,
+    logger: LoggerDependency,
+    config: ConfigDependency,
 ):
-    job_id = db.create_status(job.model_dump()).id
-    bt.add_task(run_pipeline, job_id, extractor, transformer, loader, db)
+    check_job(job, logger, config)
+    if config.job_queue_enabled:
+        job_id = enqueue_job(job, db)
+        return {"message": f"Queued ETL job for the workers {job_id}"}
+
+    job_id = db.create_status(job.model_dump(mode="json")).id
+    bt.add_task(run_job, job_id, job, db, config, dead_letters)
     return {"message": f"Running ETL job in the background {job_id}"}
 
 
+# TODO replace
+# @job_router.post("", dependencies=[DEPENDENCY_INGEST_DATA])
+@job_router.post("/bulk", dependencies=[dep_public_endpoint()])
+async def submit_jobs(
+    jobs: list[Job],
+    db: JobStatusDatabaseDependency,
+    dead_letters: DeadLetterStoreDependency,
+    limiter: JobLimiterDependency,
+    logger: LoggerDependency,
+    config: ConfigDependency,
+):
+    if not jobs:
+        raise HTTPException(status_code=400, detail="No jobs to submit")
+
+    # Fails before anything is stored if a job cannot be run
+    for job in jobs:
+        check_job(job, logger, config)
+
+    group_id = uuid.uuid4()
+    if config.job_queue_enabled:
+        # Workers bound the concurrency of all jobs, not only of bulk submissions
+        job_ids = enqueue_jobs(jobs, db, group_id)
+        return {
+            "message": f"Queued {len(jobs)} ETL jobs for the workers, group {group_id}",
+            "group_id": group_id,
+            "job_ids": job_ids,
+        }
+
+    statuses = db.create_statuses(
+        [job.model_dump(mode="json") for job in jobs], group_id
+    )
+    for job, status in zip(jobs, statuses):
+        limiter.submit(
+            job_targets(job), run_job(status.id, job, db, config, dead_letters)
+        )
+    return {
+        "message": f"Running {len(jobs)} ETL jobs in the background, group {group_id}",
+        "group_id": group_id,
+        "job_ids": [status.id for status in statuses],
+    }
+
+
+@job_router.get(
+    "/groups/{group_id}",
+    response_model=JobGroupStatus,
+    dependencies=[dep_public_endpoint()],
+)
+async def get_group_status(
+    group_id: uuid.UUID,
+    db: JobStatusDatabaseDependency,
+):
+    return db.get_group_status(group_id)
+
+
 # TODO replace
 # @job_router.post("", dependencies=[DEPENDENCY_INGEST_DATA])
 @job_router.post(
     "/pipeline/{pipeline_file_name}",
-    dependencies=[authz_middleware.dep_public_endpoint()],
+    dependencies=[dep_public_endpoint()],
 )
 async def run_from_pipeline_file(
     pipeline_file_name: str,
     bt: BackgroundTasks,
     db: JobStatusDatabaseDependency,
+    dead_letters: DeadLetterStoreDependency,
+    pipelines: PipelineRegistryDependency,
     logger: LoggerDependency,
     config: ConfigDependency,
 ):
-    pipeline_file_path = os.path.join(
-        os.getcwd(), f"pipelines/{pipeline_file_name}.json"
-    )
-
     try:
-        with open(pipeline_file_path) as file:
-            file_content = json.load(file)
-            job = Job.model_validate(file_content)
-    except Exception as e:
+        job = pipelines.get(pipeline_file_name)
+    except (KeyError, ValueError) as e:
         raise HTTPException(
             status_code=400, detail=f"Pipeline file not found or malformed: {e}"
         )
 
-    extractor = get_extractor(job, logger, config)
-    transformer = get_transformer(job, logger)
-    loader = get_loader(job, logger, config)
+    check_job(job, logger, config)
+    if config.job_queue_enabled:
+        job_id = enqueue_job(job, db)
+        return {"message": f"Queued ETL job for the workers {job_id}"}
 
-    job_id = db.create_status(job.model_dump()).id
-    bt.add_task(run_pipeline, job_id, extractor, transformer, loader, db)
+    job_id = db.create_status(job.model_dump(mode="json")).id
+    bt.add_task(run_job, job_id, job, db, config, dead_letters)
     return {"message": f"Running ETL job in the background {job_id}"}
 
 
+@job_router.get(
+    "/pipeline/{pipeline_name}/watermark",
+    dependencies=[dep_public_endpoint()],
+)
+async def get_watermark(
+    pipeline_name: str,
+    db: JobStatusDatabaseDependency,
+):
+    watermark = db.get_watermark(pipeline_name)
+    if watermark is None:
+        raise HTTPException(
+            status_code=404, detail=f"No watermark found for pipeline {pipeline_name}"
+        )
+    return watermark
+
+
+@job_router.delete(
+    "/pipeline/{pipeline_name}/watermark", dependencies=[DEPENDENCY_DELETE_DATA]
+)
+async def delete_watermark(
+    pipeline_name: str,
+    db: JobStatusDatabaseDependency,
+):
+    db.delete_watermark(pipeline_name)
+    return {"message": f"Watermark of pipeline {pipeline_name} has been deleted"}
+
+
 @job_router.get(
     "",
     response_model=list[JobStatus],
-    dependencies=[authz_middleware.dep_public_endpoint()],
+    dependencies=[dep_public_endpoint()],
 )
 async def get_all_status(
     db: JobStatusDatabaseDependency,
@@ -130,7 +427,7 @@ async def get_all_status(
 @job_router.get(
     "/{job_id}",
     response_model=JobStatus,
-    dependencies=[authz_middleware.dep_public_endpoint()],
+    dependencies=[dep_public_endpoint()],
 )
 async def get_status(
     job_id: uuid.UUID,
@@ -140,6 +437,152 @@ async def get_status(
 
 
 @job_router.delete("/{job_id}", dependencies=[DEPENDENCY_DELETE_DATA])
-async def delete_status(job_id: uuid.UUID, db: JobStatusDatabaseDependency):
+async def delete_status(
+    job_id: uuid.UUID,
+    db: JobStatusDatabaseDependency,
+    dead_letters: DeadLetterStoreDependency,
+    profiles: ProfileStoreDependency,
+):
     db.delete_status(job_id)
+    dead_letters.delete(job_id)
+    profiles.delete(job_id)
     return {"message": f"Job {job_id} has been deleted"}
+
+
+@job_router.get(
+    "/{job_id}/shards",
+    response_model=list[JobStatus],
+    dependencies=[dep_public_endpoint()],
+)
+async def get_shards(
+    job_id: uuid.UUID,
+    db: JobStatusDatabaseDependency,
+):
+    db.get_status(job_id)
+    return db.get_shards(job_id)
+
+
+# TODO replace
+# @job_router.post("", dependencies=[DEPENDENCY_INGEST_DATA])
+@job_router.post(
+    "/{job_id}/shards/retry",
+    dependencies=[dep_public_endpoint()],
+)
+async def retry_shards(
+    job_id: uuid.UUID,
+    db: JobStatusDatabaseDependency,
+):
+    # Successful shards are kept, only the failed parts of the input are extracted again
+    if not db.get_status(job_id).job_data.get("shards"):
+        raise HTTPException(status_code=400, detail=f"Job {job_id} is not sharded")
+    shard_ids = db.retry_shards(job_id)
+    if not shard_ids:
+        raise HTTPException(
+            status_code=400, detail=f"Job {job_id} has no failed shards"
+        )
+    return {
+        "message": f"Queued {len(shard_ids)} failed shard(s) of job {job_id} again",
+        "job_ids": shard_ids,
+    }
+
+
+@job_router.get(
+    "/{job_id}/dead-letters",
+    dependencies=[dep_public_endpoint()],
+)
+async def get_dead_letters(
+    job_id: uuid.UUID,
+    dead_letters: DeadLetterStoreDependency,
+):
+    if not dead_letters.exists(job_id):
+        raise HTTPException(
+            status_code=404, detail=f"No dead letters found for job {job_id}"
+        )
+    return FileResponse(
+        dead_letters.path(job_id),
+        media_type="application/gzip",
+        filename=os.path.basename(dead_letters.path(job_id)),
+    )
+
+
+@job_router.get(
+    "/{job_id}/profile",
+    dependencies=[dep_public_endpoint()],
+)
+async def get_profile(
+    job_id: uuid.UUID,
+    profiles: ProfileStoreDependency,
+):
+    if not profiles.exists(job_id):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No profile found for job {job_id}, it may not be finished or not submitted with profile",
+        )
+    return FileResponse(
+        profiles.path(job_id),
+        media_type="application/zip",
+        filename=os.path.basename(profiles.path(job_id)),
+    )
+
+
+# TODO replace
+# @job_router.post("", dependencies=[DEPENDENCY_INGEST_DATA])
+@job_router.post(
+    "/{job_id}/redrive",
+    dependencies=[dep_public_endpoint()],
+)
+async def redrive_dead_letters(
+    job_id: uuid.UUID,
+    bt: BackgroundTasks,
+    db: JobStatusDatabaseDependency,
+    dead_letters: DeadLetterStoreDependency,
+    logger: LoggerDependency,
+    config: ConfigDependency,
+    branch: str | None = None,
+):
+    if not dead_letters.exists(job_id):
+        raise HTTPException(
+            status_code=404, detail=f"No dead letters found for job {job_id}"
+        )
+
+    # Dead-lettered payloads are already transformed, only the loader of the original job is reused
+    job = Job.model_validate(db.get_status(job_id).job_data)
+    if job.branches is not None:
+        branch_jobs = job.branch_jobs()
+        if branch not in branch_jobs:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Fan-out jobs are re-driven one branch at a time, branch must be one of {list(branch_jobs)}",
+            )
+        job = branch_jobs[branch]
+    elif branch is not None:
+        raise HTTPException(
+            status_code=400, detail=f"Job {job_id} is not a fan-out job"
+        )
+    job.extractor = DeadLetterExtractStep(dead_letter_job_id=job_id, branch=branch)
+    job.transformer = TransformStep(type="None")
+
+    extractor = DeadLetterExtractor(logger, dead_letters, job_id, branch)
+    transformer = get_transformer(job, logger)
+    loader = get_loader(job, logger, config)
+    validator = get_validator(job, logger)
+
+    job_data = job.model_dump(mode="json", exclude_none=True)
+    if config.job_queue_enabled:
+        redrive_job_id = db.create_status(job_data, queue_key(job)).id
+        return {"message": f"Queued ETL job for the workers {redrive_job_id}"}
+
+    redrive_job_id = db.create_status(job_data).id
+    bt.add_task(
+        run_pipeline,
+        redrive_job_id,
+        extractor,
+        transformer,
+        loader,
+        db,
+        config,
+        validator,
+        dead_letters,
+        profile=job.profile,
+    )
+    return {"message": f"Running ETL job in the background {redrive_job_id}"}
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from bento_etl.ledger import LoadLedgerDependency
+from bento_etl.routers.jobs import DEPENDENCY_DELETE_DATA
+
+__all__ = ["ledger_router"]
+
+ledger_router = APIRouter(prefix="/ledger")
+
+
+@ledger_router.delete("/{dataset_id}", dependencies=[DEPENDENCY_DELETE_DATA])
+async def clear_dataset_ledger(dataset_id: str, ledger: LoadLedgerDependency):
+    """
+    Forgets the records loaded in a dataset, so that the next jobs load them again.
+    """
+    cleared = ledger.clear(dataset_id)
+    return {"message": f"Cleared {cleared} loaded records of dataset {dataset_id}"}
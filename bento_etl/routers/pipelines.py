@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+
+from bento_etl.authz import dep_public_endpoint
+from bento_etl.models import PipelineDefinition
+from bento_etl.pipeline_registry import PipelineRegistryDependency
+
+__all__ = ["pipeline_router"]
+
+pipeline_router = APIRouter(prefix="/pipelines")
+
+
+@pipeline_router.get(
+    "",
+    response_model=list[PipelineDefinition],
+    dependencies=[dep_public_endpoint()],
+)
+async def list_pipelines(pipelines: PipelineRegistryDependency):
+    """
+    Lists the pipeline definitions that can be run at /jobs/pipeline/{name}, with the errors of malformed files.
+    """
+    return pipelines.definitions()
@@ -0,0 +1,172 @@
+import asyncio
+import random
+import uuid
+from contextlib import suppress
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from bento_etl.config import Config, ConfigDependency
+from bento_etl.cron import CronSchedule
+from bento_etl.db import JobStatusDatabase, get_job_status_db
+from bento_etl.dead_letter import DeadLetterStore, get_dead_letter_store
+from bento_etl.extractors.dependencies import get_extractor
+from bento_etl.loaders.dependencies import get_loader
+from bento_etl.logger import BoundLogger, LoggerDependency
+from bento_etl.models import Job, PipelineSchedule, Schedule
+from bento_etl.pipeline_registry import PipelineRegistry, get_pipeline_registry
+from bento_etl.routers.jobs import enqueue_job, get_branches, run_pipeline
+from bento_etl.transformers.dependencies import get_transformer
+from bento_etl.validators.dependencies import get_validator
+
+__all__ = ["PipelineScheduler", "get_pipeline_scheduler"]
+
+
+class PipelineScheduler:
+    """
+    Runs the pipeline definitions of `PIPELINES_DIR` that have a `schedule`, checked every `SCHEDULER_INTERVAL` seconds.
+
+    The next run of each pipeline is stored in the job status database:
+    - New or modified schedules wait for their next occurrence, they do not run right away
+    - Occurrences missed while the service was down are coalesced into a single run, instead of a burst of runs
+    - An occurrence is skipped if `max_concurrent_runs` runs of the pipeline are still running, on any replica
+
+    Scheduled runs are regular jobs named after their pipeline, incremental extractors resume from the
+    watermark of the pipeline's last successful job.
+    With `JOB_QUEUE_ENABLED`, scheduled runs are queued for the workers like submitted jobs. Replicas share the
+    schedules: each due run is claimed in the database by a single replica. Without the job queue, sharded pipelines
+    run as a single job.
+    """
+
+    def __init__(
+        self,
+        logger: BoundLogger,
+        config: Config,
+        db: JobStatusDatabase,
+        dead_letters: DeadLetterStore,
+        pipelines: PipelineRegistry,
+    ):
+        self.logger = logger
+        self.config = config
+        self.db = db
+        self.dead_letters = dead_letters
+        self.pipelines = pipelines
+        # Runs started by this replica, kept until they are done
+        self._runs: dict[str, set[asyncio.Task]] = {}
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _next_run_at(schedule: Schedule, after: datetime) -> datetime:
+        jitter = random.uniform(0, schedule.jitter_seconds)
+        return CronSchedule(schedule.cron).next_after(after) + timedelta(seconds=jitter)
+
+    def _start_run(self, name: str, job: Job) -> uuid.UUID:
+        if self.config.job_queue_enabled:
+            job_id = enqueue_job(job, self.db)
+            self.logger.info(f"Queued scheduled job {job_id} of pipeline {name}")
+            return job_id
+
+        extractor = get_extractor(job, self.logger, self.config)
+        transformer = get_transformer(job, self.logger)
+        loader = get_loader(job, self.logger, self.config)
+        validator = get_validator(job, self.logger)
+        branches = get_branches(job, self.logger, self.config)
+
+        job_id = self.db.create_status(job.model_dump(mode="json")).id
+        task = asyncio.create_task(
+            run_pipeline(
+                job_id,
+                extractor,
+                transformer,
+                loader,
+                self.db,
+                self.config,
+                validator,
+                self.dead_letters,
+                job.name,
+                branches=branches,
+                profile=job.profile,
+            )
+        )
+        running = self._runs.setdefault(name, set())
+        running.add(task)
+        task.add_done_callback(running.discard)
+        self.logger.info(f"Started scheduled job {job_id} of pipeline {name}")
+        return job_id
+
+    def tick(self, now: datetime | None = None) -> list[uuid.UUID]:
+        """
+        Starts the due pipelines, returns the IDs of the started jobs.
+        Must be called from a running event loop, jobs run as tasks of this loop.
+        """
+        now = now or datetime.now()
+        started = []
+        for name, job in self.pipelines.jobs().items():
+            if job.schedule is None:
+                continue
+
+            entry = self.db.get_schedule(name)
+            if entry is None or entry.cron != job.schedule.cron:
+                next_run_at = self._next_run_at(job.schedule, now)
+                self.logger.info(f"Scheduled pipeline {name} to run at {next_run_at}")
+                self.db.save_schedule(
+                    PipelineSchedule(
+                        pipeline_name=name,
+                        cron=job.schedule.cron,
+                        next_run_at=next_run_at,
+                    )
+                )
+                continue
+            if entry.next_run_at > now:
+                continue
+
+            next_run_at = self._next_run_at(job.schedule, now)
+            # Every replica runs the scheduler, only the one claiming the due run starts it
+            if not self.db.claim_schedule(name, entry.next_run_at, next_run_at):
+                continue
+            entry.next_run_at = next_run_at
+            # Runs are counted in the database, they may have been started by other replicas
+            running = self.db.count_unfinished(name)
+            if running >= job.schedule.max_concurrent_runs:
+                self.logger.warning(
+                    f"Skipping scheduled run of pipeline {name}, {running} run(s) still running"
+                )
+            else:
+                try:
+                    entry.last_job_id = self._start_run(name, job)
+                    entry.last_run_at = now
+                    started.append(entry.last_job_id)
+                except Exception as e:
+                    self.logger.error(f"Scheduled run of pipeline {name} failed: {e}")
+            self.db.save_schedule(entry)
+        return started
+
+    async def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"Pipeline scheduler check failed: {e}")
+            await asyncio.sleep(self.config.scheduler_interval)
+
+    def start(self):
+        self.logger.info("Starting pipeline scheduler...")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+
+@lru_cache
+def get_pipeline_scheduler(logger: LoggerDependency, config: ConfigDependency):
+    return PipelineScheduler(
+        logger,
+        config,
+        get_job_status_db(logger, config),  # pyright: ignore[reportArgumentType]
+        get_dead_letter_store(logger, config),  # pyright: ignore[reportArgumentType]
+        get_pipeline_registry(logger, config),  # pyright: ignore[reportArgumentType]
+    )
@@ -0,0 +1,179 @@
+import os
+from contextlib import contextmanager
+from importlib.util import find_spec
+from logging import Logger
+from typing import Any, Iterator, TextIO
+
+from bento_etl.config import Config
+from bento_etl.constants import BENTO_SERVICE_KIND
+
+# OpenTelemetry is optional, without it (or without an exporter) spans are no-ops. It is only imported by
+# configure_tracing, services without tracing do not load it.
+
+__all__ = [
+    "tracing_available",
+    "configure_tracing",
+    "shutdown_tracing",
+    "span",
+    "record_error",
+    "inject_trace_context",
+]
+
+TRACES_EXPORTERS = ("otlp", "file")
+
+_provider = None
+_tracer = None
+# File written by the `file` exporter, closed by shutdown_tracing
+_traces_file: TextIO | None = None
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: dict[str, Any]):
+        pass
+
+    def record_exception(self, exception: BaseException, **kwargs):
+        pass
+
+    def set_status(self, *args, **kwargs):
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def tracing_available() -> bool:
+    return find_spec("opentelemetry") is not None
+
+
+def _file_exporter(path: str):
+    global _traces_file
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    _traces_file = open(path, "a")
+    # One JSON span per line
+    return ConsoleSpanExporter(
+        out=_traces_file,
+        formatter=lambda finished: finished.to_json(indent=None) + os.linesep,
+    )
+
+
+def configure_tracing(config: Config, logger: Logger, exporter=None) -> bool:
+    """
+    Sets up the export of spans with `OTEL_TRACES_EXPORTER`:
+    - `otlp`: to an OTLP collector over HTTP, configured with the standard `OTEL_EXPORTER_OTLP_*` variables
+    - `file`: to `OTEL_TRACES_FILE`, one JSON span per line
+
+    `exporter` replaces the configured exporter, e.g. with an in-memory exporter in tests.
+    Returns whether tracing is enabled.
+    """
+    global _provider, _tracer
+
+    name = config.otel_traces_exporter.lower()
+    if exporter is None and name in ("", "none"):
+        return False
+    if not tracing_available():
+        logger.warning(
+            "OTEL_TRACES_EXPORTER is set but opentelemetry is not installed, tracing is disabled"
+        )
+        return False
+
+    from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    # Closes the file of a previous configuration before opening a new one
+    shutdown_tracing()
+    if exporter is None:
+        if name == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+
+            exporter = OTLPSpanExporter()
+        elif name == "file":
+            exporter = _file_exporter(config.otel_traces_file)
+        else:
+            raise ValueError(
+                f"Unsupported traces exporter {name}, must be one of {TRACES_EXPORTERS}"
+            )
+
+    _provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: f"bento_{BENTO_SERVICE_KIND}"})
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("bento_etl")
+    logger.info(f"Exporting traces with {type(exporter).__name__}")
+    return True
+
+
+def shutdown_tracing():
+    """
+    Exports the pending spans and disables tracing.
+    """
+    global _provider, _tracer, _traces_file
+    if _provider is not None:
+        _provider.shutdown()
+    if _traces_file is not None:
+        _traces_file.close()
+    _provider = None
+    _tracer = None
+    _traces_file = None
+
+
+@contextmanager
+def span(
+    name: str, attributes: dict[str, Any] | None = None, current: bool = True
+) -> Iterator[Any]:
+    """
+    Starts a span, ended when the block exits. Exceptions raised in the block are recorded on the span.
+
+    Spans opened in a generator must not be `current`: the context the span is attached to does not survive the
+    generator's suspension (e.g. each `next` of an extractor runs in a different worker thread context).
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    attributes = {
+        key: value for key, value in (attributes or {}).items() if value is not None
+    }
+    if current:
+        with _tracer.start_as_current_span(name, attributes=attributes) as new_span:
+            yield new_span
+        return
+
+    new_span = _tracer.start_span(name, attributes=attributes)
+    try:
+        yield new_span
+    except Exception as e:
+        record_error(new_span, e)
+        raise
+    finally:
+        new_span.end()
+
+
+def record_error(current_span, error: BaseException):
+    # For errors handled before they reach the end of a span's block
+    if not current_span.is_recording():
+        return
+    from opentelemetry.trace import Status, StatusCode
+
+    current_span.record_exception(error)
+    current_span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def inject_trace_context(headers: dict[str, str]) -> dict[str, str]:
+    """
+    Adds the W3C trace context of the current span to the headers of an outgoing request.
+    """
+    if _tracer is not None:
+        from opentelemetry import propagate
+
+        propagate.inject(headers)
+    return headers
@@ -1,5 +1,8 @@
-import polars as pl
 from logging import Logger
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import polars as pl
 
 __all__ = ["BaseTransformer"]
 
@@ -16,8 +19,8 @@ class BaseTransformer:
         self.logger = logger
 
     def transform(
-        self, raw: pl.DataFrame | pl.LazyFrame
-    ) -> pl.DataFrame | pl.LazyFrame:
+        self, raw: "pl.DataFrame | pl.LazyFrame"
+    ) -> "pl.DataFrame | pl.LazyFrame":
         # TODO: figure out best return type hint
         raise NotImplementedError
 
@@ -14,7 +14,10 @@ def get_transformer(job: Job, logger: LoggerDependency):
     # e.g:
     # if job.transformer.type == "phenopacket.json.pcgl":
     #   return TransformPhenoPCGL(job.transformer)
-    if job.transformer.type == "None":
+    if job.transformer is None:
+        # Fan-out jobs have a transformer per branch
+        return None
+    elif job.transformer.type == "None":
         return None
     else:
         raise NotImplementedError
@@ -0,0 +1,110 @@
+import asyncio
+import importlib.util
+import ssl
+from functools import lru_cache
+from typing import Annotated
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
+
+import httpx
+from fastapi import Depends
+
+from bento_etl.config import Config, ConfigDependency, TransportProfile
+from bento_etl.logger import BoundLogger, LoggerDependency
+
+__all__ = [
+    "ClientPool",
+    "get_client_pool",
+    "ClientPoolDependency",
+]
+
+
+class ClientPool:
+    """
+    HTTP clients of the load targets, one per target host, shared by all the jobs for the life of the process.
+
+    Connections are kept alive between jobs, so that a job does not start with a new connection pool and new TLS
+    handshakes. All the clients share one TLS context, certificates are only loaded once.
+    Each client is configured by the transport profile of its host in `LOAD_TRANSPORT_PROFILES`, or by
+    `LOAD_TRANSPORT` (see `TransportProfile`). HTTP/2 is used when enabled and the h2 package is installed.
+
+    Clients belong to the event loop they were created in, each loop gets its own (e.g. in tests).
+    """
+
+    def __init__(self, logger: BoundLogger, config: Config):
+        self.logger = logger
+        self.config = config
+        self._clients: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]
+        ] = WeakKeyDictionary()
+        self._ssl_context: ssl.SSLContext | None = None
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc or url
+
+    def profile(self, url: str) -> TransportProfile:
+        host = self._host(url)
+        return next(
+            (p for p in self.config.load_transport_profiles if p.host == host),
+            self.config.load_transport,
+        )
+
+    def _verify(self) -> ssl.SSLContext | bool:
+        if not self.config.bento_validate_ssl:
+            return False
+        if self._ssl_context is None:
+            self._ssl_context = httpx.create_ssl_context()
+        return self._ssl_context
+
+    def _create_client(self, host: str, profile: TransportProfile) -> httpx.AsyncClient:
+        http2 = profile.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            self.logger.warning(
+                f"HTTP/2 is enabled for {host} but the h2 package is not installed, using HTTP/1.1"
+            )
+            http2 = False
+        self.logger.info(
+            f"Creating HTTP client for {host} (HTTP/{2 if http2 else 1.1})"
+        )
+        return httpx.AsyncClient(
+            http2=http2,
+            verify=self._verify(),
+            limits=httpx.Limits(
+                max_connections=profile.max_connections,
+                max_keepalive_connections=profile.max_keepalive_connections,
+                keepalive_expiry=profile.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=profile.connect_timeout,
+                read=profile.read_timeout,
+                write=profile.write_timeout,
+                pool=profile.pool_timeout,
+            ),
+        )
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """
+        Returns the client of the target of a URL. Must be called from a running event loop.
+        """
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        host = self._host(url)
+        if host not in clients or clients[host].is_closed:
+            clients[host] = self._create_client(host, self.profile(url))
+        return clients[host]
+
+    async def aclose(self):
+        """
+        Closes the clients of the running event loop, e.g. when the service shuts down.
+        """
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+
+@lru_cache
+def get_client_pool(logger: LoggerDependency, config: ConfigDependency):
+    return ClientPool(logger, config)
+
+
+ClientPoolDependency = Annotated[ClientPool, Depends(get_client_pool)]
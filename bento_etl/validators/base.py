@@ -0,0 +1,78 @@
+from logging import Logger
+from typing import TYPE_CHECKING, Any
+
+from bento_etl.models import RejectedRecord
+
+if TYPE_CHECKING:
+    from jsonschema import Draft202012Validator
+
+__all__ = ["BaseValidator"]
+
+
+class BaseValidator:
+    """
+    Base class for ETL validator implementation.
+
+    Validators run between the Transformer and the Loader of a pipeline, they catch the records that the target
+    service would reject before any upload is attempted.
+    Invalid records are returned separately with the reasons for their rejection, so that valid records keep flowing
+    to the Loader.
+
+    Concrete validators should implement the `validate` function for the data shape of their Loader.
+    """
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+
+    def validate(self, data: Any) -> tuple[Any | None, list[RejectedRecord]]:
+        """
+        Returns the valid part of the data, in the same shape as the input, and the rejected records.
+        The valid part is None when no record is left to load.
+        """
+        raise NotImplementedError
+
+    def _validate_records(
+        self,
+        records: list,
+        schema_validator: "Draft202012Validator",
+        kind: str | None = None,
+    ) -> tuple[list, list[RejectedRecord]]:
+        import polars as pl
+
+        reasons: list[list[str]] = [[] for _ in records]
+
+        # Column-level checks on the whole batch at once
+        ids = pl.Series(
+            "id",
+            [
+                record.get("id") if isinstance(record, dict) else None
+                for record in records
+            ],
+            dtype=pl.String,
+            strict=False,
+        )
+        duplicates = (ids.is_not_null() & ~ids.is_first_distinct()).arg_true()
+        for index in duplicates.to_list():
+            reasons[index].append(f"Duplicate id '{ids[index]}' in batch")
+
+        # Structural checks with the pre-compiled schema
+        for index, record in enumerate(records):
+            for error in schema_validator.iter_errors(record):
+                path = "/".join(str(part) for part in error.absolute_path) or "<root>"
+                reasons[index].append(f"{path}: {error.message}")
+
+        valid = []
+        rejected = []
+        for record, record_reasons in zip(records, reasons):
+            if record_reasons:
+                rejected.append(
+                    RejectedRecord(record=record, reasons=record_reasons, kind=kind)
+                )
+            else:
+                valid.append(record)
+
+        if rejected:
+            self.logger.warning(
+                f"{len(rejected)}/{len(records)} records failed validation"
+            )
+        return valid, rejected
@@ -0,0 +1,33 @@
+from fastapi import Depends
+from typing import Annotated
+
+from bento_etl.logger import LoggerDependency
+from bento_etl.models import Job
+from bento_etl.validators.base import BaseValidator
+
+__all__ = ["get_validator", "ValidatorDep"]
+
+
+def get_validator(job: Job, logger: LoggerDependency) -> BaseValidator | None:
+    # returns the appropriate validator instance for the data type of the job's loader
+    if job.loader is None:
+        # Fan-out jobs have a validator per branch
+        return None
+    elif job.loader.skip_validation:
+        return None
+    # The schemas are compiled when a validator module is first imported, by the first job that needs it
+    elif job.loader.data_type == "phenopackets":
+        from bento_etl.validators.phenopackets_validator import PhenopacketsValidator
+
+        return PhenopacketsValidator(logger)
+    elif job.loader.data_type == "experiments":
+        from bento_etl.validators.experiments_validator import ExperimentsValidator
+
+        return ExperimentsValidator(logger)
+    elif job.loader.data_type == "print":
+        return None
+    else:
+        raise NotImplementedError
+
+
+ValidatorDep = Annotated[BaseValidator | None, Depends(get_validator)]
@@ -0,0 +1,90 @@
+from jsonschema import Draft202012Validator
+
+from bento_etl.models import RejectedRecord
+from bento_etl.validators.base import BaseValidator
+from bento_etl.validators.schemas import EXPERIMENT_SCHEMA, RESOURCE_SCHEMA
+
+# Compiled once and shared by all jobs
+EXPERIMENT_VALIDATOR = Draft202012Validator(EXPERIMENT_SCHEMA)
+RESOURCE_VALIDATOR = Draft202012Validator(RESOURCE_SCHEMA)
+
+# Fields of an experiment holding ontology terms, which refer to the resources of their batch
+ONTOLOGY_FIELDS = ("experiment_ontology", "molecule_ontology")
+
+
+def _resource_prefix(resource) -> str | None:
+    # Invalid resources may lack a namespace prefix, their ID starts with it, e.g. "OBI:2020-12-16"
+    if not isinstance(resource, dict):
+        return None
+    prefix = resource.get("namespace_prefix") or str(resource.get("id") or "")
+    return str(prefix).split(":", 1)[0] or None
+
+
+def _term_prefixes(experiment) -> set[str]:
+    # Ontology terms refer to their resource with the prefix of their ID, e.g. "OBI:0001177"
+    if not isinstance(experiment, dict):
+        return set()
+    return {
+        term["id"].split(":", 1)[0]
+        for field in ONTOLOGY_FIELDS
+        for term in experiment.get(field) or []
+        if isinstance(term, dict) and isinstance(term.get("id"), str)
+    }
+
+
+class ExperimentsValidator(BaseValidator):
+    """
+    Validates the experiments and the resources of a batch.
+
+    Experiments referring to a rejected resource are rejected too, unless a valid resource of the batch has the
+    same prefix. Rejected records are tagged with their kind, "experiment" or "resource".
+    """
+
+    def validate(self, data: dict) -> tuple[dict | None, list[RejectedRecord]]:
+        if not isinstance(data, dict) or not isinstance(data.get("experiments"), list):
+            return None, [
+                RejectedRecord(
+                    record=data,
+                    reasons=["Expected an object with an 'experiments' list"],
+                )
+            ]
+
+        resources, rejected_resources = self._validate_records(
+            data.get("resources", []), RESOURCE_VALIDATOR, "resource"
+        )
+        experiments, rejected = self._validate_records(
+            data["experiments"], EXPERIMENT_VALIDATOR, "experiment"
+        )
+
+        valid_prefixes = {_resource_prefix(resource) for resource in resources}
+        rejected_prefixes = (
+            {
+                _resource_prefix(rejected_resource.record)
+                for rejected_resource in rejected_resources
+            }
+            - valid_prefixes
+            - {None}
+        )
+        if rejected_prefixes:
+            kept = []
+            for experiment in experiments:
+                if missing := sorted(_term_prefixes(experiment) & rejected_prefixes):
+                    rejected.append(
+                        RejectedRecord(
+                            record=experiment,
+                            reasons=[f"Refers to rejected resource(s) {missing}"],
+                            kind="experiment",
+                        )
+                    )
+                else:
+                    kept.append(experiment)
+            experiments = kept
+
+        # Batches with experiments are not loaded once all of them were rejected, re-driven resources are loaded
+        if not experiments and (data["experiments"] or not resources):
+            return None, rejected_resources + rejected
+        # Rejected resources first, they are re-driven before the experiments referring to them
+        return (
+            {"experiments": experiments, "resources": resources},
+            rejected_resources + rejected,
+        )
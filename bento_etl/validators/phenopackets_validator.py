@@ -0,0 +1,20 @@
+from jsonschema import Draft202012Validator
+
+from bento_etl.models import RejectedRecord
+from bento_etl.validators.base import BaseValidator
+from bento_etl.validators.schemas import PHENOPACKET_SCHEMA
+
+# Compiled once and shared by all jobs
+PHENOPACKET_VALIDATOR = Draft202012Validator(PHENOPACKET_SCHEMA)
+
+
+class PhenopacketsValidator(BaseValidator):
+    def validate(
+        self, data: list[dict]
+    ) -> tuple[list[dict] | None, list[RejectedRecord]]:
+        if not isinstance(data, list):
+            return None, [
+                RejectedRecord(record=data, reasons=["Expected a list of phenopackets"])
+            ]
+        phenopackets, rejected = self._validate_records(data, PHENOPACKET_VALIDATOR)
+        return phenopackets or None, rejected
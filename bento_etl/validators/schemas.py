@@ -0,0 +1,146 @@
+"""
+JSON schemas of the data accepted by Katsu's ingestion endpoints.
+
+These schemas cover the structure Katsu requires to ingest a record (required fields, types and enums),
+they are not a full copy of the Phenopackets V2 and Katsu experiment schemas.
+"""
+
+__all__ = [
+    "ONTOLOGY_CLASS_SCHEMA",
+    "RESOURCE_SCHEMA",
+    "PHENOPACKET_SCHEMA",
+    "EXPERIMENT_SCHEMA",
+]
+
+NON_EMPTY_STRING = {"type": "string", "minLength": 1}
+
+ONTOLOGY_CLASS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": NON_EMPTY_STRING,
+        "label": {"type": "string"},
+    },
+    "required": ["id", "label"],
+}
+
+RESOURCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": NON_EMPTY_STRING,
+        "name": {"type": "string"},
+        "namespace_prefix": NON_EMPTY_STRING,
+        "url": {"type": "string"},
+        "version": {"type": "string"},
+        "iri_prefix": {"type": "string"},
+    },
+    "required": ["id", "namespace_prefix"],
+}
+
+PHENOPACKET_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "properties": {
+        "id": NON_EMPTY_STRING,
+        "subject": {
+            "type": "object",
+            "properties": {
+                "id": NON_EMPTY_STRING,
+                "sex": {"enum": ["UNKNOWN_SEX", "FEMALE", "MALE", "OTHER_SEX"]},
+                "karyotypic_sex": {
+                    "enum": [
+                        "UNKNOWN_KARYOTYPE",
+                        "XX",
+                        "XY",
+                        "XO",
+                        "XXY",
+                        "XXX",
+                        "XXYY",
+                        "XXXY",
+                        "XXXX",
+                        "XYY",
+                        "OTHER_KARYOTYPE",
+                    ]
+                },
+                "taxonomy": ONTOLOGY_CLASS_SCHEMA,
+                "extra_properties": {"type": "object"},
+            },
+            "required": ["id"],
+        },
+        "phenotypic_features": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"type": ONTOLOGY_CLASS_SCHEMA},
+                "required": ["type"],
+            },
+        },
+        "biosamples": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": NON_EMPTY_STRING},
+                "required": ["id"],
+            },
+        },
+        "diseases": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"term": ONTOLOGY_CLASS_SCHEMA},
+                "required": ["term"],
+            },
+        },
+        "measurements": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"assay": ONTOLOGY_CLASS_SCHEMA},
+                "required": ["assay"],
+            },
+        },
+        "medical_actions": {"type": "array", "items": {"type": "object"}},
+        "interpretations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": NON_EMPTY_STRING},
+                "required": ["id", "progress_status"],
+            },
+        },
+        "meta_data": {
+            "type": "object",
+            "properties": {
+                "created_by": NON_EMPTY_STRING,
+                "phenopacket_schema_version": {"type": "string"},
+                "resources": {"type": "array", "items": RESOURCE_SCHEMA},
+            },
+            "required": ["created_by"],
+        },
+    },
+    "required": ["id", "subject", "meta_data"],
+}
+
+EXPERIMENT_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "properties": {
+        "id": NON_EMPTY_STRING,
+        "study_type": {"type": "string"},
+        "experiment_type": NON_EMPTY_STRING,
+        "experiment_ontology": {"type": "array", "items": ONTOLOGY_CLASS_SCHEMA},
+        "molecule_ontology": {"type": "array", "items": ONTOLOGY_CLASS_SCHEMA},
+        "biosample": {"type": "string"},
+        "experiment_results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "identifier": {"type": "string"},
+                    "filename": {"type": "string"},
+                    "url": {"type": "string"},
+                },
+            },
+        },
+    },
+    "required": ["id", "experiment_type"],
+}
@@ -0,0 +1,251 @@
+import asyncio
+import os
+import signal
+import socket
+import threading
+import uuid
+from contextlib import suppress
+
+from bento_etl.config import Config, get_config
+from bento_etl.db import JobStatusDatabase, get_job_status_db
+from bento_etl.dead_letter import DeadLetterStore, get_dead_letter_store
+from bento_etl.extractors.dependencies import get_extractor
+from bento_etl.loaders.dependencies import get_loader
+from bento_etl.logger import BoundLogger, get_logger
+from bento_etl.models import DeadLetterExtractStep, Job, JobStatus, JobStatusType
+from bento_etl.profiler import ProfileStore, get_profile_store
+from bento_etl.routers.jobs import get_branches, run_pipeline
+from bento_etl.tracing import configure_tracing, shutdown_tracing
+from bento_etl.transport import get_client_pool
+from bento_etl.transformers.dependencies import get_transformer
+from bento_etl.validators.dependencies import get_validator
+
+__all__ = ["JobWorker", "main"]
+
+
+class JobWorker:
+    """
+    Runs the jobs queued in the job status database, when `JOB_QUEUE_ENABLED` is set.
+
+    API replicas only store the submitted jobs, any number of workers (`python -m bento_etl.worker`, on one or
+    several nodes) share the queue through the database:
+    - A worker claims up to `WORKER_CONCURRENCY` jobs, the datasets with the fewest running jobs first (see
+      `JobStatusDatabase.claim_job`), at most `JOB_MAX_CONCURRENCY_PER_TARGET` jobs per dataset across all workers
+    - Claimed jobs are leased for `WORKER_LEASE_SECONDS`, leases are renewed every `WORKER_POLL_INTERVAL` seconds
+      by a heartbeat thread, jobs keeping the event loop busy (e.g. transforming a large batch) keep their leases
+    - Jobs of a worker that stopped renewing its leases (e.g. it crashed) are claimed again by other workers,
+      up to `WORKER_MAX_ATTEMPTS` times
+
+    Dead letters and profiles are written by the workers, their directories must be shared with the API replicas.
+    """
+
+    def __init__(
+        self,
+        logger: BoundLogger,
+        config: Config,
+        db: JobStatusDatabase,
+        dead_letters: DeadLetterStore,
+        profiles: ProfileStore,
+        worker_id: str | None = None,
+    ):
+        self.logger = logger
+        self.config = config
+        self.db = db
+        self.dead_letters = dead_letters
+        self.profiles = profiles
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self._jobs: dict[uuid.UUID, asyncio.Task] = {}
+        self._job_finished = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> list[uuid.UUID]:
+        return list(self._jobs)
+
+    def _start_job(self, status: JobStatus) -> asyncio.Task:
+        job = Job.model_validate(status.job_data)
+        # Re-driven jobs and shards do not move the watermark of the pipeline they come from
+        pipeline_name = (
+            None
+            if isinstance(job.extractor, DeadLetterExtractStep)
+            or getattr(job.extractor, "shard", None) is not None
+            else job.name
+        )
+        task = asyncio.create_task(
+            run_pipeline(
+                status.id,
+                get_extractor(job, self.logger, self.config),
+                get_transformer(job, self.logger),
+                get_loader(job, self.logger, self.config),
+                self.db,
+                self.config,
+                get_validator(job, self.logger),
+                self.dead_letters,
+                pipeline_name,
+                get_branches(job, self.logger, self.config),
+                job.profile,
+                self.profiles,
+            )
+        )
+        self._jobs[status.id] = task
+        task.add_done_callback(lambda _: self._finish_job(status.id))
+        return task
+
+    def _finish_job(self, job_id: uuid.UUID):
+        self._jobs.pop(job_id, None)
+        self._job_finished.set()
+
+    def claim(self) -> list[uuid.UUID]:
+        """
+        Starts queued jobs until the worker is full or no job can be claimed, returns the IDs of the started jobs.
+        Must be called from a running event loop, jobs run as tasks of this loop.
+        """
+        started = []
+        while len(self._jobs) < self.config.worker_concurrency:
+            status = self.db.claim_job(
+                self.worker_id,
+                self.config.worker_lease_seconds,
+                self.config.job_max_concurrency_per_target,
+            )
+            if status is None:
+                break
+
+            if status.attempts > self.config.worker_max_attempts:
+                self.logger.error(
+                    f"Job {status.id} was claimed {status.attempts - 1} times without finishing"
+                )
+                self.db.update_status(
+                    status.id,
+                    JobStatusType.ERROR,
+                    f"Job abandoned after {status.attempts - 1} attempts, its workers stopped while running it",
+                )
+                continue
+
+            try:
+                self._start_job(status)
+            except Exception as e:
+                # E.g. a job queued by a newer version of the service
+                self.logger.error(f"Could not start job {status.id}: {e}")
+                self.db.update_status(status.id, JobStatusType.ERROR, str(e))
+                continue
+            self.logger.info(
+                f"Worker {self.worker_id} started job {status.id} (attempt {status.attempts})"
+            )
+            started.append(status.id)
+        return started
+
+    def heartbeat(self):
+        """
+        Renews the leases of the running jobs, the jobs claimed by another worker in the meantime are cancelled.
+        Must be called from the event loop thread, the heartbeat thread of a started worker renews them on its own.
+        """
+        self._cancel_lost(self._renew_leases())
+
+    def _renew_leases(self) -> list[uuid.UUID]:
+        return self.db.renew_leases(
+            self.worker_id, self.running, self.config.worker_lease_seconds
+        )
+
+    def _cancel_lost(self, lost: list[uuid.UUID]):
+        for job_id in lost:
+            self.logger.warning(
+                f"Worker {self.worker_id} lost the lease of job {job_id}, cancelling it"
+            )
+            if task := self._jobs.get(job_id):
+                task.cancel()
+
+    def _heartbeat_loop(self, loop: asyncio.AbstractEventLoop):
+        # Not on the event loop, which the jobs' synchronous work may keep busy for longer than a lease
+        while not self._heartbeat_stop.wait(self.config.worker_poll_interval):
+            try:
+                lost = self._renew_leases()
+            except Exception as e:
+                self.logger.error(f"Worker {self.worker_id} heartbeat failed: {e}")
+                continue
+            if lost:
+                loop.call_soon_threadsafe(self._cancel_lost, lost)
+
+    async def _run(self):
+        while True:
+            self._job_finished.clear()
+            try:
+                self.claim()
+            except Exception as e:
+                self.logger.error(f"Worker {self.worker_id} check failed: {e}")
+            # A finished job frees a slot, queued jobs are claimed without waiting for the next check
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._job_finished.wait(), self.config.worker_poll_interval
+                )
+
+    def start(self):
+        self.logger.info(f"Starting worker {self.worker_id}...")
+        self._task = asyncio.create_task(self._run())
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop,
+            args=(asyncio.get_running_loop(),),
+            name=f"heartbeat-{self.worker_id}",
+            daemon=True,
+        )
+        self._heartbeat_thread.start()
+
+    async def stop(self):
+        """
+        Stops claiming jobs and cancels the running ones, which are released for other workers.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._heartbeat_thread is not None:
+            self._heartbeat_stop.set()
+            await asyncio.to_thread(self._heartbeat_thread.join)
+            self._heartbeat_thread = None
+
+        jobs = list(self._jobs.items())
+        for _, task in jobs:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in jobs), return_exceptions=True)
+        self.db.release_jobs(self.worker_id, [job_id for job_id, _ in jobs])
+
+
+async def _serve():
+    config = get_config()
+    logger = get_logger(config)  # pyright: ignore[reportArgumentType]
+    db = get_job_status_db(logger, config)  # pyright: ignore[reportArgumentType]
+    db.setup()
+    configure_tracing(config, logger)
+
+    worker = JobWorker(
+        logger,
+        config,
+        db,
+        get_dead_letter_store(logger, config),  # pyright: ignore[reportArgumentType]
+        get_profile_store(logger, config),  # pyright: ignore[reportArgumentType]
+    )
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    worker.start()
+    await stopping.wait()
+    logger.info(f"Stopping worker {worker.worker_id}...")
+    await worker.stop()
+    await get_client_pool(logger, config).aclose()  # pyright: ignore[reportArgumentType]
+    shutdown_tracing()
+    db.engine.dispose()
+
+
+def main():
+    asyncio.run(_serve())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-export ASGI_APP="bento_etl.main:app"
+export ASGI_APP="bento_etl.main:create_app"
 
 # Set default internal port to 5000
 : "${INTERNAL_PORT:=5000}"
@@ -10,4 +10,5 @@ uvicorn \
   --loop uvloop \
   --host 0.0.0.0 \
   --port "${INTERNAL_PORT}" \
+  --factory \
   "${ASGI_APP}"
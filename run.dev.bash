@@ -2,7 +2,7 @@
 
 /poetry_user_install_dev.bash
 
-export ASGI_APP="bento_etl.main:app"
+export ASGI_APP="bento_etl.main:create_app"
 
 : "${INTERNAL_PORT:=5000}"
 
@@ -11,5 +11,6 @@ python -Xfrozen_modules=off -m debugpy --listen 0.0.0.0:5678 -m \
   uvicorn \
   --host 0.0.0.0 \
   --port "${INTERNAL_PORT}" \
+  --factory \
   --reload \
   "${ASGI_APP}"
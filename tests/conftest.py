@@ -1,5 +1,7 @@
 import httpx
 import pytest
+from contextlib import contextmanager
+from typing import Callable
 import os
 import json
 import boto3
@@ -8,11 +10,15 @@ from moto import mock_aws
 from aioresponses import aioresponses
 from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, create_engine
-from sqlmodel.pool import StaticPool
 
 
 from bento_etl.db import JobStatusDatabase, get_job_status_db
+from bento_etl.dead_letter import DeadLetterStore, get_dead_letter_store
+from bento_etl.extract_cache import ExtractCache
+from bento_etl.load_controller import get_load_controller
+from bento_etl.transport import get_client_pool
 from bento_etl.logger import get_logger, BoundLogger
+from bento_etl.profiler import ProfileStore, get_profile_store
 from bento_etl.models import Job, LoadStep, TransformStep, ApiFetchExtractStep
 
 os.environ["BENTO_DEBUG"] = "true"
@@ -25,9 +31,11 @@ os.environ["BENTO_AUTHZ_SERVICE_URL"] = "https://authz.local"
 os.environ["AUTHZ_ENABLED"] = "False"
 
 from bento_etl.config import Config, get_config
-from bento_etl.main import app
+from bento_etl.main import create_app
 from bento_etl import authz
 
+app = create_app()
+
 
 @pytest.fixture
 def config() -> Config:
@@ -40,12 +48,9 @@ def logger(config: Config) -> BoundLogger:
 
 
 @pytest.fixture()
-def engine():
-    eng = create_engine(
-        "sqlite+pysqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def engine(tmp_path):
+    # A connection per thread, pipelines query the database from worker threads as well as from the event loop
+    eng = create_engine(f"sqlite+pysqlite:///{tmp_path / 'bento_etl.db'}")
     SQLModel.metadata.create_all(eng)
     yield eng
     eng.dispose()
@@ -57,8 +62,32 @@ def job_status_database(logger, config, engine) -> JobStatusDatabase:
 
 
 @pytest.fixture
-def test_client(job_status_database):
+def dead_letter_store(logger, config, tmp_path) -> DeadLetterStore:
+    store = DeadLetterStore(logger, config)
+    store.directory = str(tmp_path / "dead_letters")
+    return store
+
+
+@pytest.fixture
+def profile_store(logger, config, tmp_path) -> ProfileStore:
+    store = ProfileStore(logger, config)
+    store.directory = str(tmp_path / "profiles")
+    return store
+
+
+@pytest.fixture
+def extract_cache(logger, config, tmp_path) -> ExtractCache:
+    cache = ExtractCache(logger, config)
+    cache.directory = str(tmp_path / "extract_cache")
+    cache.ttl = 60.0
+    return cache
+
+
+@pytest.fixture
+def test_client(job_status_database, dead_letter_store, profile_store):
     app.dependency_overrides[get_job_status_db] = lambda: job_status_database
+    app.dependency_overrides[get_dead_letter_store] = lambda: dead_letter_store
+    app.dependency_overrides[get_profile_store] = lambda: profile_store
 
     with TestClient(app) as client:
         yield client
@@ -81,6 +110,17 @@ def mocked_job_dict():
     yield Job(extractor=extractor, transformer=tranformer, loader=loader).model_dump()
 
 
+@pytest.fixture(autouse=True)
+def shared_load_state():
+    # Throttling and open circuits of a test do not hold back the uploads of the next ones,
+    # and clients are not shared between the event loops of different tests
+    get_load_controller.cache_clear()
+    get_client_pool.cache_clear()
+    yield
+    get_load_controller.cache_clear()
+    get_client_pool.cache_clear()
+
+
 @pytest.fixture(autouse=True)
 def mock_bearer_token(monkeypatch):
     def mock_get_bearer_token(*args, **kwargs):
@@ -116,7 +156,15 @@ def load_experiment_data() -> dict:
 
 
 #### EXTRACTOR MOCKS
-EXTRACTOR_REQUEST_PATH = "bento_etl.extractors.api_fetch_extractor.httpx.request"
+EXTRACTOR_REQUEST_PATH = "bento_etl.extractors.api_fetch_extractor.httpx.stream"
+
+
+def mock_extractor_stream(make_response: Callable[[], httpx.Response]):
+    @contextmanager
+    def mock_stream(*args, **kwargs):
+        yield make_response()
+
+    return mock_stream
 
 
 @pytest.fixture
@@ -124,21 +172,21 @@ def mock_extractor_success_call(monkeypatch, load_phenopacket_data):
     phenopacket_content = json.dumps(load_phenopacket_data).encode("utf-8")
     monkeypatch.setattr(
         EXTRACTOR_REQUEST_PATH,
-        lambda *args, **kwargs: httpx.Response(200, content=phenopacket_content),
+        mock_extractor_stream(lambda: httpx.Response(200, content=phenopacket_content)),
     )
 
 
 @pytest.fixture
 def mock_extractor_bad_status_code(monkeypatch):
     monkeypatch.setattr(
-        EXTRACTOR_REQUEST_PATH, lambda *args, **kwargs: httpx.Response(400)
+        EXTRACTOR_REQUEST_PATH, mock_extractor_stream(lambda: httpx.Response(400))
     )
 
 
 @pytest.fixture
 def mock_extractor_valid_empty_response(monkeypatch):
     monkeypatch.setattr(
-        EXTRACTOR_REQUEST_PATH, lambda *args, **kwargs: httpx.Response(200)
+        EXTRACTOR_REQUEST_PATH, mock_extractor_stream(lambda: httpx.Response(200))
     )
 
 
@@ -236,6 +284,25 @@ def mock_loader_valid_post(monkeypatch):
     monkeypatch.setattr(LOADER_POST_REQUEST_PATH, mock_valid_post)
 
 
+@pytest.fixture
+def mock_loader_poison_record_post(monkeypatch) -> list:
+    """
+    Rejects any upload containing a record with the id "poison", returns the list of accepted uploads.
+    """
+    accepted = []
+
+    async def mock_poison_post(*args, **kwargs):
+        body = kwargs["json"]
+        records = body["experiments"] if isinstance(body, dict) else body
+        if any(record.get("id") == "poison" for record in records):
+            return httpx.Response(400)
+        accepted.append(body)
+        return httpx.Response(204)
+
+    monkeypatch.setattr(LOADER_POST_REQUEST_PATH, mock_poison_post)
+    return accepted
+
+
 @pytest.fixture
 def mock_loader_invalid_post(monkeypatch):
     async def mock_invalid_post(*args, **kwargs):
@@ -0,0 +1,196 @@
+import gzip
+import json
+
+import polars as pl
+import pytest
+from fastapi.testclient import TestClient
+
+from bento_etl.formats import read_batches
+from bento_etl.validators.experiments_validator import EXPERIMENT_VALIDATOR
+from bento_etl.validators.phenopackets_validator import PHENOPACKET_VALIDATOR
+from benchmarks.datagen import DatasetGenerator
+from benchmarks.datasets import FORMATS, write_dataset
+from benchmarks.fake_katsu import FakeKatsu
+from benchmarks.run import percentile
+from benchmarks.startup import compare, summarize
+
+
+def depth(value) -> int:
+    if isinstance(value, dict):
+        return 1 + max((depth(v) for v in value.values()), default=0)
+    if isinstance(value, list):
+        return 1 + max((depth(v) for v in value), default=0)
+    return 0
+
+
+class TestDatasetGenerator:
+    def test_deterministic(self):
+        records = list(DatasetGenerator(seed=3).records("phenopackets", 20))
+        assert list(DatasetGenerator(seed=3).records("phenopackets", 20)) == records
+        assert list(DatasetGenerator(seed=4).records("phenopackets", 20)) != records
+        # Any slice of a dataset can be generated on its own
+        sliced = DatasetGenerator(seed=3).records("phenopackets", 5, 10)
+        assert list(sliced) == records[10:15]
+
+    def test_phenopackets(self):
+        records = list(DatasetGenerator().records("phenopackets", 200))
+        assert not [e for r in records for e in PHENOPACKET_VALIDATOR.iter_errors(r)]
+        assert len({record["id"] for record in records}) == 200
+        assert len({record["subject"]["id"] for record in records}) == 200
+        biosample_ids = [b["id"] for r in records for b in r["biosamples"]]
+        assert len(set(biosample_ids)) == len(biosample_ids)
+
+        # Record sizes and nesting depths vary
+        assert len({len(json.dumps(record)) for record in records}) > 100
+        assert len({depth(record) for record in records}) > 2
+
+    def test_limits(self):
+        generator = DatasetGenerator(max_items=2, max_depth=0)
+        for record in generator.records("phenopackets", 50):
+            assert 1 <= len(record["biosamples"]) <= 2
+            assert "details" not in record["subject"]["extra_properties"]
+
+    def test_experiments(self):
+        generator = DatasetGenerator(experiments_per_phenopacket=2)
+        experiments = list(generator.records("experiments", 40))
+        assert not [e for r in experiments for e in EXPERIMENT_VALIDATOR.iter_errors(r)]
+        assert len({experiment["id"] for experiment in experiments}) == 40
+        for index, experiment in enumerate(experiments):
+            phenopacket = generator.phenopacket(index // 2)
+            assert experiment["biosample"] in {
+                b["id"] for b in phenopacket["biosamples"]
+            }
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            DatasetGenerator(max_items=0)
+        with pytest.raises(ValueError):
+            list(DatasetGenerator().records("variants", 1))
+        with pytest.raises(ValueError):
+            DatasetGenerator().write("/tmp/dataset.csv", 1)
+
+    @pytest.mark.parametrize("file_format", FORMATS)
+    def test_write_phenopackets(self, tmp_path, file_format):
+        generator = DatasetGenerator()
+        path = generator.write(str(tmp_path / f"dataset.{file_format}"), 30)
+        with open(path, "rb") as f:
+            batches = list(read_batches(f, path, 10))
+        assert sum(len(batch) for batch in batches) == 30
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_write_experiments_json(self, tmp_path):
+        generator = DatasetGenerator()
+        path = generator.write(str(tmp_path / "experiments.json"), 15, "experiments")
+        with open(path) as f:
+            data = json.load(f)
+        assert len(data["experiments"]) == 15
+        assert data["resources"] == generator.resources
+
+    def test_write_experiments_parquet(self, tmp_path):
+        path = DatasetGenerator().write(
+            str(tmp_path / "experiments.parquet"), 15, "experiments"
+        )
+        assert pl.read_parquet(path).height == 15
+
+
+class TestDatasets:
+    @pytest.mark.parametrize("file_format", FORMATS)
+    def test_write_dataset(self, tmp_path, file_format):
+        path = write_dataset(str(tmp_path), 30, file_format)
+        with open(path, "rb") as f:
+            batches = list(read_batches(f, path, 10))
+        assert sum(len(batch) for batch in batches) == 30
+
+    def test_write_dataset_reused(self, tmp_path):
+        path = write_dataset(str(tmp_path), 5, "jsonl")
+        with open(path, "w") as f:
+            f.write("kept")
+        assert write_dataset(str(tmp_path), 5, "jsonl") == path
+        with open(path) as f:
+            assert f.read() == "kept"
+
+    def test_write_dataset_unsupported(self, tmp_path):
+        with pytest.raises(ValueError):
+            write_dataset(str(tmp_path), 5, "csv")
+
+    def test_parquet_dataset(self, tmp_path):
+        path = write_dataset(str(tmp_path), 12, "parquet")
+        assert pl.read_parquet(path).height == 12
+
+
+class TestFakeKatsu:
+    def test_ingest(self, tmp_path):
+        katsu = FakeKatsu(str(tmp_path))
+        client = TestClient(katsu.app)
+        response = client.post(
+            "/ingest/dataset/phenopackets_json", json=[{"id": "1"}, {"id": "2"}]
+        )
+        assert response.status_code == 204
+        response = client.post(
+            "/ingest/dataset/experiments_json", json={"experiments": [{"id": "1"}]}
+        )
+        assert response.status_code == 204
+        stats = client.get("/_stats").json()
+        assert stats["requests"] == 2
+        assert stats["records"] == 3
+        assert stats["errors"] == 0
+
+    def test_errors_seeded(self, tmp_path):
+        katsu = FakeKatsu(str(tmp_path), error_rate=0.5, error_status=503, seed=1)
+        client = TestClient(katsu.app)
+
+        def statuses():
+            return [
+                client.post("/ingest/dataset/phenopackets_json", json=[]).status_code
+                for _ in range(20)
+            ]
+
+        first = statuses()
+        assert set(first) == {204, 503}
+        assert client.get("/_stats").json()["errors"] == first.count(503)
+
+        client.post("/_stats/reset")
+        assert statuses() == first
+
+    def test_token(self, tmp_path):
+        katsu = FakeKatsu(str(tmp_path))
+        client = TestClient(katsu.app)
+        assert "token_endpoint" in client.get("/openid-configuration").json()
+        assert client.post("/token").json()["access_token"]
+
+    def test_data_content_encoding(self, tmp_path):
+        records = [{"id": "1"}]
+        with gzip.open(tmp_path / "data.jsonl.gz", "wt") as f:
+            f.write(json.dumps(records[0]) + "\n")
+        katsu = FakeKatsu(str(tmp_path))
+        client = TestClient(katsu.app)
+
+        response = client.get("/data/data.jsonl", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert json.loads(response.text) == records[0]
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_startup_summary():
+    runs = [
+        {"import_ms": ms, "ready_ms": ms + 50, "modules": 900, "heavy_modules": []}
+        for ms in (300.0, 100.0, 200.0)
+    ]
+    runs[1]["heavy_modules"] = ["polars"]
+    result = summarize(runs)
+    assert result["import_ms"] == 200.0
+    assert result["ready_ms"] == 250.0
+    assert result["heavy_modules"] == ["polars"]
+
+    changes = compare(result, {"import_ms": 100.0, "ready_ms": 0})
+    # Metrics missing from the baseline are not compared
+    assert changes == {"import_ms": 100.0}
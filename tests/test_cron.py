@@ -0,0 +1,50 @@
+from datetime import datetime
+import pytest
+
+from bento_etl.cron import CronSchedule
+
+
+class TestCronSchedule:
+    @pytest.mark.parametrize(
+        "expression",
+        [
+            "* * * *",
+            "60 * * * *",
+            "* 24 * * *",
+            "5-1 * * * *",
+            "*/0 * * * *",
+            "a * * * *",
+        ],
+    )
+    def test_invalid_expression(self, expression):
+        with pytest.raises(ValueError):
+            CronSchedule(expression)
+
+    @pytest.mark.parametrize(
+        "expression, after, expected",
+        [
+            ("* * * * *", datetime(2024, 1, 1, 0, 0, 30), datetime(2024, 1, 1, 0, 1)),
+            ("*/15 * * * *", datetime(2024, 1, 1, 0, 15), datetime(2024, 1, 1, 0, 30)),
+            ("0 2 * * *", datetime(2024, 1, 1, 2, 0), datetime(2024, 1, 2, 2, 0)),
+            (
+                "30 1-3/2 * * *",
+                datetime(2024, 1, 1, 1, 45),
+                datetime(2024, 1, 1, 3, 30),
+            ),
+            ("0 0 1 */3 *", datetime(2024, 2, 10), datetime(2024, 4, 1)),
+            # 2024-01-06 is a Saturday, 7 is Sunday like 0
+            ("0 0 * * 7", datetime(2024, 1, 3), datetime(2024, 1, 7)),
+            ("0 0 * * 1,3", datetime(2024, 1, 3), datetime(2024, 1, 8)),
+            # Restricted day of month and day of week match on either
+            ("0 0 15 * 1", datetime(2024, 1, 9), datetime(2024, 1, 15)),
+            ("0 0 20 * 1", datetime(2024, 1, 9), datetime(2024, 1, 15)),
+            ("0 0 29 2 *", datetime(2024, 3, 1), datetime(2028, 2, 29)),
+            ("0 0 31 12 *", datetime(2024, 12, 31, 12), datetime(2025, 12, 31)),
+        ],
+    )
+    def test_next_after(self, expression, after, expected):
+        assert CronSchedule(expression).next_after(after) == expected
+
+    def test_never_matches(self):
+        with pytest.raises(ValueError, match="never matches"):
+            CronSchedule("0 0 31 2 *").next_after(datetime(2024, 1, 1))
@@ -3,6 +3,8 @@ import uuid
 
 from fastapi import HTTPException
 import pytest
+from sqlalchemy import inspect, text
+from sqlmodel import create_engine
 from bento_etl.db import JobStatusDatabase
 from bento_etl.models import JobStatusType
 
@@ -99,3 +101,88 @@ def test_delete_status_invalid(job_status_database: JobStatusDatabase):
     inexistant_job_id = uuid.uuid4()
     with pytest.raises(HTTPException):
         job_status_database.delete_status(inexistant_job_id)
+
+
+def test_set_watermark(
+    job_status_database: JobStatusDatabase, mocked_job_dict: dict[str, Any]
+):
+    assert job_status_database.get_watermark("some_pipeline") is None
+
+    first_job = job_status_database.create_status(mocked_job_dict)
+    job_status_database.set_watermark("some_pipeline", {"etags": {}}, first_job.id)
+    second_job = job_status_database.create_status(mocked_job_dict)
+    entry = job_status_database.set_watermark(
+        "some_pipeline", {"etags": {"a.json": "1"}}, second_job.id
+    )
+
+    assert entry.job_id == second_job.id
+    assert job_status_database.get_watermark("some_pipeline") == {
+        "etags": {"a.json": "1"}
+    }
+
+
+def test_delete_watermark(
+    job_status_database: JobStatusDatabase, mocked_job_dict: dict[str, Any]
+):
+    job = job_status_database.create_status(mocked_job_dict)
+    job_status_database.set_watermark("some_pipeline", {"etags": {}}, job.id)
+    job_status_database.delete_watermark("some_pipeline")
+
+    assert job_status_database.get_watermark("some_pipeline") is None
+    with pytest.raises(HTTPException):
+        job_status_database.delete_watermark("some_pipeline")
+
+
+def test_create_statuses_group(
+    job_status_database: JobStatusDatabase, mocked_job_dict: dict[str, Any]
+):
+    group_id = uuid.uuid4()
+    jobs = job_status_database.create_statuses([mocked_job_dict] * 3, group_id)
+    assert [job.group_id for job in jobs] == [group_id] * 3
+
+    job_status_database.update_status(jobs[0].id, JobStatusType.SUCCESS)
+    group = job_status_database.get_group_status(group_id)
+    assert group.total == 3
+    assert group.statuses == {JobStatusType.SUCCESS: 1, JobStatusType.SUBMITTED: 2}
+    assert not group.completed
+
+    job_status_database.update_status(jobs[1].id, JobStatusType.SUCCESS)
+    job_status_database.update_status(jobs[2].id, JobStatusType.ERROR)
+    assert job_status_database.get_group_status(group_id).completed
+
+
+def test_get_group_status_invalid(job_status_database: JobStatusDatabase):
+    with pytest.raises(HTTPException):
+        job_status_database.get_group_status(uuid.uuid4())
+
+
+def test_setup_adds_missing_columns(logger, config, tmp_path):
+    # A database created before the job queue columns were added
+    old_id = uuid.uuid4()
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE jobstatus (id CHAR(32) PRIMARY KEY, status VARCHAR(7), job_data JSON, "
+                "created_at DATETIME NOT NULL, completed_at DATETIME, error_at DATETIME, error_message VARCHAR)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO jobstatus (id, status, job_data, created_at) "
+                "VALUES (:id, 'SUCCESS', '{}', '2024-01-01 00:00:00')"
+            ),
+            {"id": old_id.hex},
+        )
+    db = JobStatusDatabase(logger, config, engine)
+    db.setup()
+    # Idempotent
+    db.setup()
+
+    columns = {column["name"] for column in inspect(engine).get_columns("jobstatus")}
+    assert {"group_id", "queue_key", "worker_id", "attempts"} <= columns
+    assert db.get_status(old_id).attempts == 0
+    assert db.get_status(old_id).queue_key is None
+    status = db.create_status({"extractor": {}}, "dataset")
+    assert db.get_status(status.id).queue_key == "dataset"
+    engine.dispose()
@@ -0,0 +1,50 @@
+import uuid
+
+from bento_etl.dead_letter import DeadLetterStore
+
+
+def test_add_and_read_entries(dead_letter_store: DeadLetterStore):
+    job_id = uuid.uuid4()
+    dead_letter_store.add(job_id, "validation", ["some reason"], [{"id": "1"}])
+    dead_letter_store.add(job_id, "load", ["other reason"], [{"id": "2"}])
+
+    entries = list(dead_letter_store.entries(job_id))
+    assert [e["stage"] for e in entries] == ["validation", "load"]
+    assert [e["payload"] for e in entries] == [[{"id": "1"}], [{"id": "2"}]]
+    assert entries[0]["reasons"] == ["some reason"]
+    assert entries[0]["rejected_at"]
+
+
+def test_entries_are_indexed_by_job(dead_letter_store: DeadLetterStore):
+    job_id, other_job_id = uuid.uuid4(), uuid.uuid4()
+    dead_letter_store.add(job_id, "load", [], [])
+
+    assert dead_letter_store.exists(job_id)
+    assert not dead_letter_store.exists(other_job_id)
+    assert list(dead_letter_store.entries(other_job_id)) == []
+
+
+def test_delete(dead_letter_store: DeadLetterStore):
+    job_id = uuid.uuid4()
+    dead_letter_store.add(job_id, "load", [], [])
+    dead_letter_store.delete(job_id)
+
+    assert not dead_letter_store.exists(job_id)
+    dead_letter_store.delete(job_id)  # no-op when absent
+
+
+def test_writer_keeps_file_open(dead_letter_store: DeadLetterStore):
+    job_id = uuid.uuid4()
+    writer = dead_letter_store.writer(job_id)
+    assert not dead_letter_store.exists(job_id)
+
+    for index in range(3):
+        writer.write("load", [f"reason {index}"], [{"id": str(index)}], "branch")
+    file = writer._file
+    writer.close()
+
+    # A single gzip member for the whole job
+    assert file is not None and file.closed
+    entries = list(dead_letter_store.entries(job_id))
+    assert [e["payload"] for e in entries] == [[{"id": str(i)}] for i in range(3)]
+    assert all(e["branch"] == "branch" for e in entries)
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from bento_etl.extract_cache import ExtractCache
+
+
+def write(content: bytes, info: dict | None = None):
+    def download(file):
+        file.write(content)
+        return info or {}
+
+    return download
+
+
+def read(entry) -> bytes:
+    with open(entry.path, "rb") as f:
+        return f.read()
+
+
+def test_fetch_downloads_once(extract_cache: ExtractCache):
+    first = extract_cache.fetch("source", write(b"data", {"name": "a.json"}))
+    second = extract_cache.fetch("source", write(b"other"))
+
+    assert read(second) == b"data"
+    assert second.path == first.path
+    assert second.info == {"name": "a.json"}
+
+
+def test_fetch_new_version(extract_cache: ExtractCache):
+    extract_cache.fetch("source", write(b"v1"), version="etag-1")
+    assert read(extract_cache.fetch("source", write(b"v1"), "etag-1")) == b"v1"
+    assert read(extract_cache.fetch("source", write(b"v2"), "etag-2")) == b"v2"
+
+
+def test_get_expired(extract_cache: ExtractCache, monkeypatch):
+    extract_cache.fetch("source", write(b"data"))
+    assert extract_cache.get("source") is not None
+
+    now = time.time()
+    monkeypatch.setattr(
+        "bento_etl.extract_cache.time.time", lambda: now + extract_cache.ttl + 1
+    )
+    assert extract_cache.get("source") is None
+
+
+def test_evicts_least_recently_used(extract_cache: ExtractCache):
+    extract_cache.max_bytes = 10
+    a = extract_cache.fetch("a", write(b"aaaa"))
+    extract_cache.fetch("b", write(b"bbbb"))
+    # Makes "a" the most recently used entry, "b" is evicted first
+    time.sleep(0.01)
+    extract_cache.get("a")
+    extract_cache.fetch("c", write(b"cccc"))
+
+    assert extract_cache.get("a").path == a.path
+    assert extract_cache.get("b") is None
+    assert extract_cache.get("c") is not None
+
+
+def test_failed_download_is_not_cached(extract_cache: ExtractCache):
+    def download(file):
+        file.write(b"partial")
+        raise Exception("connection reset")
+
+    with pytest.raises(Exception, match="connection reset"):
+        extract_cache.fetch("source", download)
+    assert extract_cache.get("source") is None
+    assert read(extract_cache.fetch("source", write(b"data"))) == b"data"
+
+
+def test_concurrent_fetches_share_download(extract_cache: ExtractCache):
+    downloads = []
+
+    def download(file):
+        downloads.append(1)
+        time.sleep(0.1)
+        file.write(b"data")
+        return {}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(read(extract_cache.fetch("source", download)))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(downloads) == 1
+    assert results == [b"data"] * 4
+
+
+def test_does_not_evict_entries_being_read(extract_cache: ExtractCache):
+    extract_cache.max_bytes = 6
+    a = extract_cache.fetch("a", write(b"aaaa"))
+    time.sleep(0.01)
+    # "a" is the least recently used entry, but it is still being read
+    extract_cache.fetch("b", write(b"bbbb"))
+    assert read(a) == b"aaaa"
+
+    a.release()
+    extract_cache.fetch("c", write(b"cc"))
+    assert extract_cache.get("a") is None
+    assert extract_cache.get("b") is not None
+
+
+def test_download_locks_are_dropped(extract_cache: ExtractCache):
+    def download(file):
+        raise Exception("connection reset")
+
+    extract_cache.fetch("source", write(b"data"))
+    with pytest.raises(Exception, match="connection reset"):
+        extract_cache.fetch("other", download)
+    assert extract_cache._downloads == {}
@@ -1,7 +1,18 @@
+import boto3
+import gzip
+import httpx
+import io
+import json
+import polars as pl
 import pytest
+from pydantic import ValidationError
 from unittest.mock import MagicMock
 
+import uuid
+
 from bento_etl.extractors.api_fetch_extractor import ApiPollExtractor
+from bento_etl.extractors.dead_letter_extractor import DeadLetterExtractor
+from bento_etl.extractors.local_file_extractor import LocalFileExtractor
 from bento_etl.extractors.s3_extractor import S3Extractor
 from bento_etl.extractors.base import BaseExtractor
 from bento_etl.extractors.dependencies import get_extractor
@@ -11,6 +22,9 @@ from bento_etl.models import (
     TransformStep,
     ApiFetchExtractStep,
     S3ExtractStep,
+    LocalFileExtractStep,
+    DeadLetterExtractStep,
+    Shard,
 )
 from bento_etl.config import Config
 
@@ -47,6 +61,24 @@ class TestExtractorDependencies:
         extractor = get_extractor(job, logger, config)
         assert isinstance(extractor, S3Extractor)
 
+    def test_get_extractor_local_file(self, logger, config: Config):
+        job = Job(
+            extractor=LocalFileExtractStep(path="*.jsonl"),
+            transformer=TransformStep(type="None"),
+            loader=LoadStep(dataset_id="some_id", batch_size=0, data_type="print"),
+        )
+        extractor = get_extractor(job, logger, config)
+        assert isinstance(extractor, LocalFileExtractor)
+
+    def test_get_extractor_dead_letter(self, logger, config: Config):
+        job = Job(
+            extractor=DeadLetterExtractStep(dead_letter_job_id=uuid.uuid4()),
+            transformer=TransformStep(type="None"),
+            loader=LoadStep(dataset_id="some_id", batch_size=0, data_type="print"),
+        )
+        extractor = get_extractor(job, logger, config)
+        assert isinstance(extractor, DeadLetterExtractor)
+
     def test_get_extractor_invalid_type(self, logger, config: Config):
         """Test that get_extractor raises NotImplementedError for invalid extractor type."""
         job = MagicMock()
@@ -88,6 +120,139 @@ class TestApiFetchExtractor:
         with pytest.raises(Exception):
             extractor.extract()
 
+    def test_extract_incremental(self, logger, monkeypatch):
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.return_value = httpx.Response(200, json=[])
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+        extractor = ApiPollExtractor(logger, "http://valid_url", incremental=True)
+
+        # First extraction is a full extraction
+        extractor.extract()
+        assert mock_request.call_args.kwargs["params"] is None
+        watermark = extractor.next_watermark()
+        assert watermark["extracted_at"]
+
+        extractor.watermark = watermark
+        extractor.extract()
+        assert mock_request.call_args.kwargs["params"] == {
+            "updated_since": watermark["extracted_at"]
+        }
+
+    def test_extract_incremental_without_extraction_time(self, logger, monkeypatch):
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.return_value = httpx.Response(200, json=[])
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+        extractor = ApiPollExtractor(logger, "http://valid_url", incremental=True)
+        # Watermark of a pipeline that only used conditional requests so far
+        extractor.watermark = {"etag": '"v1"'}
+
+        # Full extraction, the next job fetches the updates
+        extractor.extract()
+        assert mock_request.call_args.kwargs["params"] is None
+        assert extractor.next_watermark()["extracted_at"]
+
+    def test_next_watermark_not_incremental(self, logger, mock_extractor_success_call):
+        extractor = ApiPollExtractor(logger, "http://valid_url")
+        extractor.extract()
+        assert extractor.next_watermark() is None
+
+    def test_extract_conditional(self, logger, monkeypatch):
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.return_value = httpx.Response(
+            200,
+            json=[{"id": "1"}],
+            headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"},
+        )
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+        extractor = ApiPollExtractor(logger, "http://valid_url", conditional=True)
+        assert extractor.incremental
+
+        assert extractor.extract() == [{"id": "1"}]
+        assert "If-None-Match" not in mock_request.call_args.kwargs["headers"]
+        watermark = extractor.next_watermark()
+        assert watermark == {
+            "etag": '"v1"',
+            "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+        }
+
+        # Unchanged resource: nothing is extracted and the watermark is kept
+        mock_request.return_value.__enter__.return_value = httpx.Response(304)
+        extractor = ApiPollExtractor(logger, "http://valid_url", conditional=True)
+        extractor.watermark = watermark
+        assert extractor.extract() == []
+        headers = mock_request.call_args.kwargs["headers"]
+        assert headers["If-None-Match"] == '"v1"'
+        assert headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        assert mock_request.call_args.kwargs["params"] is None
+        assert extractor.next_watermark() == watermark
+
+    def test_extract_gzip_response(self, logger, monkeypatch, load_phenopacket_data):
+        body = gzip.compress(json.dumps(load_phenopacket_data).encode("utf-8"))
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.return_value = httpx.Response(
+            200,
+            stream=httpx.ByteStream(body),
+            headers={"Content-Encoding": "gzip"},
+        )
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+
+        extractor = ApiPollExtractor(logger, "http://valid_url")
+        assert extractor.extract() == load_phenopacket_data
+        headers = mock_request.call_args.kwargs["headers"]
+        assert "gzip" in headers["Accept-Encoding"]
+
+    def test_extract_cached(self, logger, monkeypatch, extract_cache):
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.side_effect = lambda: httpx.Response(
+            200,
+            stream=httpx.ByteStream(b'{"id": "1"}\n'),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+
+        for _ in range(2):
+            extractor = ApiPollExtractor(
+                logger, "http://valid_url", cache=extract_cache
+            )
+            assert extractor.extract() == [{"id": "1"}]
+        assert mock_request.call_count == 1
+
+        # Incremental extractions always fetch the latest data
+        extractor = ApiPollExtractor(
+            logger, "http://valid_url", incremental=True, cache=extract_cache
+        )
+        extractor.extract()
+        assert mock_request.call_count == 2
+
+    def test_extract_batches_ndjson_response(
+        self, logger, monkeypatch, load_phenopacket_data
+    ):
+        body = "".join(json.dumps(item) + "\n" for item in load_phenopacket_data)
+        mock_request = MagicMock()
+        mock_request.return_value.__enter__.return_value = httpx.Response(
+            200,
+            stream=httpx.ByteStream(body.encode("utf-8")),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        monkeypatch.setattr(
+            "bento_etl.extractors.api_fetch_extractor.httpx.stream", mock_request
+        )
+
+        extractor = ApiPollExtractor(logger, "http://valid_url", batch_size=4)
+        batches = list(extractor.extract_batches())
+        assert [len(batch) for batch in batches] == [4, 2]
+        assert [item for batch in batches for item in batch] == load_phenopacket_data
+
 
 class TestS3Extractor:
     def test_extract_valid_json(
@@ -134,3 +299,310 @@ class TestS3Extractor:
         )
         with pytest.raises(Exception):
             extractor.extract()
+
+    def test_extract_batches_jsonl(
+        self, logger, config, load_phenopacket_data, mock_s3_extractor_pheno_jsonl
+    ):
+        extractor = S3Extractor(
+            logger, config, S3ExtractStep(object_key="phenopackets.jsonl")
+        )
+        extractor.batch_size = 4
+
+        batches = list(extractor.extract_batches())
+        assert [len(batch) for batch in batches] == [4, 2]
+        assert [item for batch in batches for item in batch] == load_phenopacket_data
+
+    def test_extract_batches_json(
+        self, logger, config, load_phenopacket_data, mock_s3_extractor_pheno_json
+    ):
+        extractor = S3Extractor(
+            logger, config, S3ExtractStep(object_key="phenopackets.json")
+        )
+        assert list(extractor.extract_batches()) == [load_phenopacket_data]
+
+    def test_extract_compressed_object(
+        self, logger, config, load_phenopacket_data, mocked_s3
+    ):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        body = json.dumps(load_phenopacket_data).encode("utf-8")
+        s3.put_object(Bucket="test", Key="pheno.json.gz", Body=gzip.compress(body))
+
+        extractor = S3Extractor(
+            logger, config, S3ExtractStep(object_key="pheno.json.gz")
+        )
+        assert extractor.extract() == load_phenopacket_data
+
+    def test_extract_content_encoding(
+        self, logger, config, load_phenopacket_data, mocked_s3
+    ):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        body = "".join(json.dumps(item) + "\n" for item in load_phenopacket_data)
+        s3.put_object(
+            Bucket="test",
+            Key="pheno.jsonl",
+            Body=gzip.compress(body.encode("utf-8")),
+            ContentEncoding="gzip",
+        )
+
+        extractor = S3Extractor(logger, config, S3ExtractStep(object_key="pheno.jsonl"))
+        assert extractor.extract() == load_phenopacket_data
+
+    def test_extract_cached(self, logger, config, mocked_s3, extract_cache):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        body = gzip.compress(b'{"id": "1"}\n')
+        s3.put_object(
+            Bucket="test", Key="data.jsonl", Body=body, ContentEncoding="gzip"
+        )
+        step = S3ExtractStep(object_key="data.jsonl")
+
+        extractor = S3Extractor(logger, config, step, cache=extract_cache)
+        assert extractor.extract() == [{"id": "1"}]
+
+        # Served from the cache while the object's ETag is unchanged
+        extractor = S3Extractor(logger, config, step, cache=extract_cache)
+        extractor.s3_client = MagicMock(wraps=extractor.s3_client)
+        assert extractor.extract() == [{"id": "1"}]
+        extractor.s3_client.get_object.assert_not_called()
+
+        s3.put_object(Bucket="test", Key="data.jsonl", Body=b'{"id": "2"}\n')
+        extractor = S3Extractor(logger, config, step, cache=extract_cache)
+        assert extractor.extract() == [{"id": "2"}]
+
+
+class TestS3ExtractorShards:
+    def test_extract_object_byte_ranges(
+        self, logger, config, load_phenopacket_data, mocked_s3
+    ):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        body = "".join(json.dumps(item) + "\n" for item in load_phenopacket_data)
+        s3.put_object(Bucket="test", Key="pheno.jsonl", Body=body.encode("utf-8"))
+
+        records = []
+        for index in range(4):
+            step = S3ExtractStep(
+                object_key="pheno.jsonl", shard=Shard(index=index, count=4)
+            )
+            extractor = S3Extractor(logger, config, step)
+            extractor.s3_client = MagicMock(wraps=extractor.s3_client)
+            records.extend(extractor.extract())
+            # Only the shard's range is downloaded
+            assert extractor.s3_client.get_object.call_args.kwargs["Range"].startswith(
+                "bytes="
+            )
+        assert records == load_phenopacket_data
+
+    def test_extract_encoded_object(self, logger, config, mocked_s3):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        body = "".join(json.dumps({"id": str(i)}) + "\n" for i in range(5))
+        s3.put_object(
+            Bucket="test",
+            Key="data.jsonl",
+            Body=gzip.compress(body.encode("utf-8")),
+            ContentEncoding="gzip",
+        )
+
+        step = S3ExtractStep(object_key="data.jsonl", shard=Shard(index=1, count=2))
+        extractor = S3Extractor(logger, config, step)
+        assert extractor.extract() == [{"id": "1"}, {"id": "3"}]
+
+    def test_extract_prefix_objects(self, logger, config, mocked_s3):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        s3.put_object(
+            Bucket="test", Key="data/a.json", Body=b'[{"id": "a"}, {"id": "aa"}]'
+        )
+        s3.put_object(Bucket="test", Key="data/b.jsonl", Body=b'{"id": "b"}\n')
+        s3.put_object(Bucket="test", Key="data/c.jsonl", Body=b'{"id": "c"}\n')
+
+        shards = [
+            S3Extractor(
+                logger,
+                config,
+                S3ExtractStep(prefix="data/", shard=Shard(index=index, count=2)),
+            ).extract()
+            for index in range(2)
+        ]
+        # Whole objects, the largest one alone
+        assert shards == [[{"id": "a"}, {"id": "aa"}], [{"id": "b"}, {"id": "c"}]]
+
+
+class TestDeadLetterExtractor:
+    def test_extract_batches(self, logger, dead_letter_store):
+        job_id = uuid.uuid4()
+        dead_letter_store.add(job_id, "validation", ["reason"], [{"id": "1"}])
+        dead_letter_store.add(job_id, "load", ["reason"], [{"id": "2"}, {"id": "3"}])
+
+        extractor = DeadLetterExtractor(logger, dead_letter_store, job_id)
+        assert list(extractor.extract_batches()) == [
+            [{"id": "1"}],
+            [{"id": "2"}, {"id": "3"}],
+        ]
+
+    def test_extract_batches_branch(self, logger, dead_letter_store):
+        job_id = uuid.uuid4()
+        dead_letter_store.add(job_id, "load", [], [{"id": "1"}], "phenopackets")
+        dead_letter_store.add(job_id, "load", [], [{"id": "2"}], "experiments")
+
+        extractor = DeadLetterExtractor(
+            logger, dead_letter_store, job_id, "experiments"
+        )
+        assert list(extractor.extract_batches()) == [[{"id": "2"}]]
+
+    def test_extract_batches_no_dead_letters(self, logger, dead_letter_store):
+        extractor = DeadLetterExtractor(logger, dead_letter_store, uuid.uuid4())
+        with pytest.raises(Exception, match="No dead letters"):
+            list(extractor.extract_batches())
+
+    def test_extract_batches_parquet(self, logger, config, mocked_s3):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        buffer = io.BytesIO()
+        pl.DataFrame({"id": ["1", "2", "3"], "value": [1, 2, 3]}).write_parquet(buffer)
+        s3.put_object(Bucket="test", Key="records.parquet", Body=buffer.getvalue())
+
+        step = S3ExtractStep(object_key="records.parquet", columns=["id"])
+        extractor = S3Extractor(logger, config, step)
+        extractor.batch_size = 2
+        batches = list(extractor.extract_batches())
+        assert [batch.height for batch in batches] == [2, 1]
+        assert extractor.extract() == [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+
+
+class TestS3ExtractorIncremental:
+    def test_step_requires_object_key_or_prefix(self):
+        with pytest.raises(ValidationError):
+            S3ExtractStep()
+        with pytest.raises(ValidationError):
+            S3ExtractStep(object_key="a.json", prefix="data/")
+
+    def test_extract_batches_prefix(self, logger, config, mocked_s3):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        s3.put_object(Bucket="test", Key="data/a.json", Body=b'[{"id": "a"}]')
+        s3.put_object(Bucket="test", Key="data/b.jsonl", Body=b'{"id": "b"}\n')
+        s3.put_object(Bucket="test", Key="data/README.md", Body=b"")
+        s3.put_object(Bucket="test", Key="other/c.json", Body=b'[{"id": "c"}]')
+
+        extractor = S3Extractor(logger, config, S3ExtractStep(prefix="data/"))
+        assert list(extractor.extract_batches()) == [[{"id": "a"}], [{"id": "b"}]]
+        assert extractor.extract() == [{"id": "a"}, {"id": "b"}]
+        assert extractor.next_watermark() is None
+
+    def test_extract_batches_incremental(self, logger, config, mocked_s3):
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test")
+        s3.put_object(Bucket="test", Key="data/a.json", Body=b'[{"id": "a"}]')
+        s3.put_object(Bucket="test", Key="data/b.json", Body=b'[{"id": "b"}]')
+        step = S3ExtractStep(prefix="data/", incremental=True)
+
+        extractor = S3Extractor(logger, config, step)
+        assert list(extractor.extract_batches()) == [[{"id": "a"}], [{"id": "b"}]]
+        watermark = extractor.next_watermark()
+        assert set(watermark["etags"]) == {"data/a.json", "data/b.json"}
+
+        # Only the updated object is extracted again
+        s3.put_object(Bucket="test", Key="data/b.json", Body=b'[{"id": "b2"}]')
+        extractor = S3Extractor(logger, config, step)
+        extractor.watermark = watermark
+        assert list(extractor.extract_batches()) == [[{"id": "b2"}]]
+
+    def test_extract_incremental_unchanged_object(
+        self, logger, config, load_phenopacket_data, mock_s3_extractor_pheno_json
+    ):
+        step = S3ExtractStep(object_key="phenopackets.json", incremental=True)
+        extractor = S3Extractor(logger, config, step)
+        assert extractor.extract() == load_phenopacket_data
+
+        watermark = extractor.next_watermark()
+
+        extractor = S3Extractor(logger, config, step)
+        extractor.watermark = watermark
+        assert extractor.extract() == []
+        assert extractor.next_watermark() == watermark
+
+
+@pytest.fixture
+def local_files(tmp_path, load_phenopacket_data):
+    root = tmp_path / "data"
+    (root / "nested").mkdir(parents=True)
+    with open(root / "phenopackets.json", "w") as f:
+        json.dump(load_phenopacket_data, f)
+    with open(root / "nested" / "phenopackets.jsonl", "w") as f:
+        f.writelines(json.dumps(p) + "\n" for p in load_phenopacket_data)
+    pl.DataFrame({"id": ["1", "2", "3"], "value": [1, None, 3]}).write_parquet(
+        root / "nested" / "records.parquet"
+    )
+    (root / "nested" / "README.md").write_text("")
+    (tmp_path / "outside.json").write_text("[]")
+    return root
+
+
+class TestLocalFileExtractor:
+    def make_extractor(self, logger, config, local_files, path):
+        config = config.model_copy(
+            update={"local_extract_dir": str(local_files), "extract_batch_size": 4}
+        )
+        return LocalFileExtractor(logger, config, LocalFileExtractStep(path=path))
+
+    def test_extract_json(self, logger, config, local_files, load_phenopacket_data):
+        extractor = self.make_extractor(logger, config, local_files, "*.json")
+        assert list(extractor.extract_batches()) == [load_phenopacket_data]
+
+    def test_extract_batches_jsonl(
+        self, logger, config, local_files, load_phenopacket_data
+    ):
+        extractor = self.make_extractor(logger, config, local_files, "**/*.jsonl")
+        batches = list(extractor.extract_batches())
+        assert [len(batch) for batch in batches] == [4, 2]
+        assert [item for batch in batches for item in batch] == load_phenopacket_data
+
+    def test_extract_batches_parquet(self, logger, config, local_files):
+        extractor = self.make_extractor(logger, config, local_files, "**/*.parquet")
+        batches = list(extractor.extract_batches())
+        assert all(isinstance(batch, pl.DataFrame) for batch in batches)
+        assert [batch.height for batch in batches] == [3]
+
+        # Columnar data is converted to JSON records, without the null fields
+        assert extractor.extract() == [
+            {"id": "1", "value": 1},
+            {"id": "2"},
+            {"id": "3", "value": 3},
+        ]
+
+    def test_extract_glob(self, logger, config, local_files, load_phenopacket_data):
+        extractor = self.make_extractor(logger, config, local_files, "**/*")
+        # Unsupported files are skipped
+        assert len(extractor.extract()) == 2 * len(load_phenopacket_data) + 3
+
+    def test_extract_shards(self, logger, config, local_files, load_phenopacket_data):
+        config = config.model_copy(update={"local_extract_dir": str(local_files)})
+
+        def extract(path: str, index: int, count: int) -> list:
+            step = LocalFileExtractStep(
+                path=path, shard=Shard(index=index, count=count)
+            )
+            return LocalFileExtractor(logger, config, step).extract()
+
+        # A single file is split, several files are assigned to the shards
+        records = [r for index in range(3) for r in extract("**/*.jsonl", index, 3)]
+        assert records == load_phenopacket_data
+        shards = [extract("**/*", index, 2) for index in range(2)]
+        assert [len(records) for records in shards] == [
+            len(load_phenopacket_data),
+            len(load_phenopacket_data) + 3,
+        ]
+
+    def test_extract_outside_root(self, logger, config, local_files):
+        extractor = self.make_extractor(logger, config, local_files, "../*.json")
+        with pytest.raises(Exception, match="outside"):
+            extractor.extract()
+
+    def test_extract_no_match(self, logger, config, local_files):
+        extractor = self.make_extractor(logger, config, local_files, "*.csv")
+        with pytest.raises(Exception, match="No files match"):
+            extractor.extract()
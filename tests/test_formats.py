@@ -0,0 +1,211 @@
+import gzip
+import io
+import json
+import polars as pl
+import pytest
+
+from bento_etl.formats import (
+    compression_from_encoding,
+    decompress,
+    detect_format,
+    is_supported,
+    iter_stream,
+    read_batches,
+    read_line_range,
+    shard_files,
+    shard_range,
+    to_records,
+)
+
+RECORDS = [{"id": str(i), "value": i, "extra": "x"} for i in range(5)]
+
+
+def zstd_compress(data: bytes) -> bytes:
+    try:
+        from compression import zstd
+    except ImportError:
+        zstd = pytest.importorskip("backports.zstd")
+    return zstd.compress(data)
+
+
+@pytest.fixture
+def jsonl_bytes() -> bytes:
+    return "".join(json.dumps(r) + "\n" for r in RECORDS).encode("utf-8")
+
+
+@pytest.fixture
+def parquet_bytes() -> bytes:
+    buffer = io.BytesIO()
+    pl.DataFrame(RECORDS).write_parquet(buffer, row_group_size=2)
+    return buffer.getvalue()
+
+
+class TestDetectFormat:
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            ("a.json", ("json", None)),
+            ("dir/a.JSONL", ("jsonl", None)),
+            ("a.ndjson", ("jsonl", None)),
+            ("a.jsonl.gz", ("jsonl", "gzip")),
+            ("a.jsonl.zst", ("jsonl", "zstd")),
+            ("a.json.gz", ("json", "gzip")),
+            ("a.parquet", ("parquet", None)),
+            ("a.arrow", ("ipc", None)),
+            ("a.feather", ("ipc", None)),
+        ],
+    )
+    def test_detect_format(self, name, expected):
+        assert detect_format(name) == expected
+        assert is_supported(name)
+
+    @pytest.mark.parametrize("name", ["a.pdf", "a.parquet.gz", "a.gz", "a"])
+    def test_unsupported(self, name):
+        assert not is_supported(name)
+        with pytest.raises(Exception, match="No parsing method"):
+            detect_format(name)
+
+
+class TestDecompress:
+    def test_gzip(self, jsonl_bytes):
+        stream = decompress(io.BytesIO(gzip.compress(jsonl_bytes)), "gzip")
+        assert stream.read() == jsonl_bytes
+
+    def test_zstd(self, jsonl_bytes):
+        stream = decompress(io.BytesIO(zstd_compress(jsonl_bytes)), "zstd")
+        assert stream.read() == jsonl_bytes
+
+    def test_none(self, jsonl_bytes):
+        stream = io.BytesIO(jsonl_bytes)
+        assert decompress(stream, None) is stream
+
+    @pytest.mark.parametrize(
+        "encoding, expected",
+        [("gzip", "gzip"), ("X-GZIP", "gzip"), ("zstd", "zstd"), ("identity", None)],
+    )
+    def test_compression_from_encoding(self, encoding, expected):
+        assert compression_from_encoding(encoding) == expected
+        assert compression_from_encoding(None) is None
+
+    def test_compression_from_unsupported_encoding(self):
+        with pytest.raises(Exception, match="Unsupported content encoding"):
+            compression_from_encoding("br")
+
+    def test_iter_stream(self, jsonl_bytes):
+        # Compressed chunks, split at arbitrary offsets as in an HTTP body
+        compressed = gzip.compress(jsonl_bytes)
+        chunks = (compressed[i : i + 7] for i in range(0, len(compressed), 7))
+        batches = list(
+            read_batches(decompress(iter_stream(chunks), "gzip"), "a.jsonl", 5)
+        )
+        assert batches == [RECORDS]
+
+
+class TestReadBatches:
+    def test_jsonl_stream(self, jsonl_bytes):
+        batches = list(read_batches(io.BytesIO(jsonl_bytes), "a.jsonl", 2))
+        assert batches == [RECORDS[0:2], RECORDS[2:4], RECORDS[4:]]
+
+    def test_jsonl_compressed(self, jsonl_bytes, tmp_path):
+        path = tmp_path / "a.jsonl.gz"
+        path.write_bytes(gzip.compress(jsonl_bytes))
+        assert list(read_batches(str(path), path.name, 10)) == [RECORDS]
+
+        stream = io.BytesIO(zstd_compress(jsonl_bytes))
+        assert list(read_batches(stream, "a.jsonl.zst", 10)) == [RECORDS]
+
+    def test_jsonl_columns(self, jsonl_bytes):
+        batches = list(read_batches(io.BytesIO(jsonl_bytes), "a.jsonl", 10, ["id"]))
+        assert batches == [[{"id": r["id"]} for r in RECORDS]]
+
+    def test_json(self):
+        stream = io.BytesIO(json.dumps(RECORDS).encode("utf-8"))
+        assert list(read_batches(stream, "a.json", 2)) == [RECORDS]
+
+    def test_parquet(self, parquet_bytes, tmp_path):
+        path = tmp_path / "a.parquet"
+        path.write_bytes(parquet_bytes)
+
+        for source in (str(path), io.BytesIO(parquet_bytes)):
+            batches = list(read_batches(source, path.name, 2, ["id", "value"]))
+            assert [batch.height for batch in batches] == [2, 2, 1]
+            assert batches[0].columns == ["id", "value"]
+            assert to_records(pl.concat(batches)) == [
+                {"id": r["id"], "value": r["value"]} for r in RECORDS
+            ]
+
+    def test_arrow_ipc(self, tmp_path):
+        path = tmp_path / "a.arrow"
+        pl.DataFrame(RECORDS).write_ipc(path)
+        batches = list(read_batches(str(path), path.name, 3))
+        assert [batch.height for batch in batches] == [3, 2]
+
+
+class TestShards:
+    def test_shard_range(self):
+        ranges = [shard_range(10, (index, 3)) for index in range(3)]
+        assert ranges == [(0, 3), (3, 6), (6, 10)]
+
+    def test_shard_files(self):
+        sizes = {"a": 10, "b": 6, "c": 5, "d": 4, "e": 1}
+        shards = [shard_files(sizes, (index, 2)) for index in range(2)]
+        assert shards == [["a", "d"], ["b", "c", "e"]]
+
+    @pytest.mark.parametrize("count", [1, 2, 3, 7, 200])
+    def test_jsonl_byte_ranges(self, count, tmp_path):
+        # Lines of different lengths, so that ranges start anywhere in a line
+        records = [{"id": str(i), "padding": "x" * (i * 7 % 13)} for i in range(20)]
+        path = tmp_path / "a.jsonl"
+        path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+        shards = [
+            list(read_batches(str(path), path.name, 3, shard=(index, count)))
+            for index in range(count)
+        ]
+        # Every line is read by exactly one shard, in order
+        assert [r for batches in shards for batch in batches for r in batch] == records
+
+    def test_read_line_range(self, jsonl_bytes):
+        line = len(jsonl_bytes) // len(RECORDS)
+        # From the byte before the range, which starts on the second line
+        stream = io.BytesIO(jsonl_bytes[line - 1 :])
+        batches = list(read_line_range(stream, line, 3 * line, 10, ["id"]))
+        assert batches == [[{"id": "1"}, {"id": "2"}]]
+
+    def test_parquet_row_ranges(self, parquet_bytes):
+        shards = [
+            list(
+                read_batches(
+                    io.BytesIO(parquet_bytes), "a.parquet", 10, ["id"], (index, 2)
+                )
+            )
+            for index in range(2)
+        ]
+        assert [to_records(batches[0]) for batches in shards] == [
+            [{"id": "0"}, {"id": "1"}],
+            [{"id": "2"}, {"id": "3"}, {"id": "4"}],
+        ]
+
+    def test_every_nth_record(self, jsonl_bytes):
+        stream = io.BytesIO(gzip.compress(jsonl_bytes))
+        assert list(read_batches(stream, "a.jsonl.gz", 10, ["id"], (1, 2))) == [
+            [{"id": "1"}, {"id": "3"}]
+        ]
+
+        data = json.dumps(RECORDS).encode("utf-8")
+        assert list(read_batches(io.BytesIO(data), "a.json", 10, ["id"], (0, 2))) == [
+            [{"id": "0"}, {"id": "2"}, {"id": "4"}]
+        ]
+
+
+class TestToRecords:
+    def test_dataframe(self):
+        frame = pl.DataFrame({"id": ["1", "2"], "nested": [{"a": 1}, {"a": None}]})
+        assert to_records(frame) == [
+            {"id": "1", "nested": {"a": 1}},
+            {"id": "2", "nested": {}},
+        ]
+        assert to_records(frame.lazy()) == to_records(frame)
+
+    def test_records_unchanged(self):
+        assert to_records(RECORDS) is RECORDS
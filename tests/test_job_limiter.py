@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from bento_etl.config import Config
+from bento_etl.job_limiter import JobLimiter, job_targets
+from bento_etl.models import Job
+
+
+class ConcurrencyProbe:
+    def __init__(self):
+        self.running: dict[str, int] = {}
+        self.max_running: dict[str, int] = {}
+
+    async def job(self, *targets: str):
+        for target in ("*", *targets):
+            self.running[target] = self.running.get(target, 0) + 1
+            self.max_running[target] = max(
+                self.max_running.get(target, 0), self.running[target]
+            )
+        await asyncio.sleep(0.01)
+        for target in ("*", *targets):
+            self.running[target] -= 1
+
+
+@pytest.fixture
+def limiter(config: Config) -> JobLimiter:
+    return JobLimiter(
+        config.model_copy(
+            update={"job_max_concurrency": 3, "job_max_concurrency_per_target": 2}
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_limits_concurrency(limiter: JobLimiter):
+    probe = ConcurrencyProbe()
+    tasks = [limiter.submit(["a"], probe.job("a")) for _ in range(5)] + [
+        limiter.submit(["b"], probe.job("b")) for _ in range(5)
+    ]
+    await asyncio.gather(*tasks)
+
+    assert probe.max_running == {"*": 3, "a": 2, "b": 2}
+
+
+@pytest.mark.asyncio
+async def test_several_targets(limiter: JobLimiter):
+    probe = ConcurrencyProbe()
+    tasks = [
+        limiter.submit(["a", "b"], probe.job("a", "b")),
+        limiter.submit(["b", "a"], probe.job("a", "b")),
+        limiter.submit(["b", "a"], probe.job("a", "b")),
+        limiter.submit(["a"], probe.job("a")),
+    ]
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+
+    assert probe.max_running["a"] == 2
+
+
+def test_job_targets():
+    loader = {"batch_size": 0, "data_type": "phenopackets"}
+    job = Job.model_validate(
+        {
+            "extractor": {"path": "*.json"},
+            "branches": [
+                {
+                    "name": name,
+                    "transformer": {"type": "None"},
+                    "loader": {**loader, "dataset_id": dataset_id},
+                }
+                for name, dataset_id in [("a", "ds-2"), ("b", "ds-1"), ("c", "ds-2")]
+            ],
+        }
+    )
+    assert job_targets(job) == ["ds-1", "ds-2"]
@@ -1,14 +1,21 @@
 import json
+import threading
 import time
+import httpx
 from typing import Any
 import uuid
+import zipfile
 from unittest.mock import MagicMock
 import pytest
 from fastapi.testclient import TestClient
 
 from bento_etl.db import JobStatusDatabase
+from bento_etl.job_limiter import JobLimiter, get_job_limiter
+from bento_etl.dead_letter import DeadLetterStore
+from bento_etl.profiler import JobProfiler, ProfileStore
 from bento_etl.routers.jobs import run_pipeline
 from bento_etl.models import JobStatusType
+from tests.conftest import app
 
 AUTHZ_HEADER = {"Authorization": "Token bearer"}
 
@@ -50,6 +57,94 @@ def test_post_submit_job_valid(
     assert response_body[0]["status"] == "success"
 
 
+def test_post_submit_fan_out_job(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    mock_authz,
+    mock_extractor_success_call,
+    mock_loader_valid_post,
+):
+    job = {
+        "extractor": DEFAULT_JOB_SCHEMA["extractor"],
+        "branches": [
+            {
+                "name": "phenopackets",
+                "transformer": {"type": "None"},
+                "loader": DEFAULT_JOB_SCHEMA["loader"],
+            },
+            {
+                "name": "debug",
+                "transformer": {"type": "None"},
+                "loader": {"dataset_id": "", "batch_size": 0, "data_type": "print"},
+            },
+        ],
+    }
+    response = test_client.post("/jobs", content=json.dumps(job), headers=AUTHZ_HEADER)
+    assert response.status_code == 200
+    time.sleep(1)
+
+    job_status = test_client.get("/jobs").json()[0]
+    assert job_status["status"] == "success"
+    branches = job_status["progress"]["branches"]
+    assert {name: branch["status"] for name, branch in branches.items()} == {
+        "phenopackets": "success",
+        "debug": "success",
+    }
+    assert branches["phenopackets"]["completed_batches"] == 1
+
+
+def test_post_submit_job_loader_and_branches(test_client: TestClient):
+    job = {
+        **DEFAULT_JOB_SCHEMA,
+        "branches": [
+            {
+                "name": "phenopackets",
+                "transformer": {"type": "None"},
+                "loader": DEFAULT_JOB_SCHEMA["loader"],
+            }
+        ],
+    }
+    response = test_client.post("/jobs", content=json.dumps(job), headers=AUTHZ_HEADER)
+    assert response.status_code == 400
+
+
+def test_post_submit_jobs_bulk(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    config,
+    mock_extractor_success_call,
+    mock_loader_valid_post,
+):
+    app.dependency_overrides[get_job_limiter] = lambda: JobLimiter(config)
+    response = test_client.post(
+        "/jobs/bulk", content=json.dumps([DEFAULT_JOB_SCHEMA] * 3)
+    )
+    assert response.status_code == 200
+    group_id = response.json()["group_id"]
+    assert len(response.json()["job_ids"]) == 3
+    assert len(job_status_database.get_all_status()) == 3
+    time.sleep(1)
+
+    response = test_client.get(f"/jobs/groups/{group_id}")
+    assert response.status_code == 200
+    assert response.json() == {
+        "group_id": group_id,
+        "total": 3,
+        "statuses": {"success": 3},
+        "completed": True,
+    }
+
+
+def test_post_submit_jobs_bulk_empty(test_client: TestClient):
+    response = test_client.post("/jobs/bulk", content=json.dumps([]))
+    assert response.status_code == 400
+
+
+def test_get_group_status_not_found(test_client: TestClient):
+    response = test_client.get(f"/jobs/groups/{uuid.uuid4()}")
+    assert response.status_code == 404
+
+
 def test_post_submit_job_invalid_bad_extractor(
     test_client: TestClient,
     job_status_database: JobStatusDatabase,
@@ -222,6 +317,73 @@ def test_run_from_pipeline_file_experiments(
     assert len(job_status_database.get_all_status()) == 1
 
 
+def test_get_dead_letters(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    dead_letter_store: DeadLetterStore,
+    mocked_job_dict: dict[str, Any],
+):
+    status = job_status_database.create_status(mocked_job_dict)
+    assert test_client.get(f"/jobs/{status.id}/dead-letters").status_code == 404
+
+    dead_letter_store.add(status.id, "load", ["some reason"], [{"id": "1"}])
+    response = test_client.get(f"/jobs/{status.id}/dead-letters")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+
+
+def test_redrive_dead_letters(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    dead_letter_store: DeadLetterStore,
+    load_phenopacket_data,
+    mock_authz,
+    mock_extractor_success_call,
+    mock_loader_invalid_post,
+    monkeypatch,
+):
+    response = test_client.post(
+        "/jobs", content=json.dumps(DEFAULT_JOB_SCHEMA), headers=AUTHZ_HEADER
+    )
+    assert response.status_code == 200
+    time.sleep(1)
+
+    failed_job = test_client.get("/jobs").json()[0]
+    assert failed_job["status"] == "error"
+    failed_job_id = uuid.UUID(failed_job["id"])
+    assert dead_letter_store.exists(failed_job_id)
+
+    # Katsu is back up, the failed batch is re-driven without extracting it again
+    async def mock_valid_post(*args, **kwargs):
+        return httpx.Response(204)
+
+    monkeypatch.setattr(
+        "bento_etl.loaders.base.httpx.AsyncClient.post", mock_valid_post
+    )
+    monkeypatch.setattr(
+        "bento_etl.extractors.api_fetch_extractor.httpx.stream",
+        MagicMock(side_effect=Exception("Source should not be extracted again")),
+    )
+    response = test_client.post(f"/jobs/{failed_job_id}/redrive", headers=AUTHZ_HEADER)
+    assert response.status_code == 200
+    time.sleep(1)
+
+    redrive_job = next(
+        job
+        for job in test_client.get("/jobs").json()
+        if job["id"] != str(failed_job_id)
+    )
+    assert redrive_job["status"] == "success"
+    assert redrive_job["job_data"]["extractor"] == {
+        "dead_letter_job_id": str(failed_job_id)
+    }
+
+
+def test_redrive_dead_letters_not_found(test_client: TestClient, mock_authz):
+    response = test_client.post(f"/jobs/{uuid.uuid4()}/redrive", headers=AUTHZ_HEADER)
+    assert response.status_code == 404
+
+
 @pytest.mark.asyncio
 async def test_run_pipeline_with_transformer(
     job_status_database: JobStatusDatabase,
@@ -230,19 +392,21 @@ async def test_run_pipeline_with_transformer(
     """Test run_pipeline with a transformer."""
     # Create a mock extractor
     mock_extractor = MagicMock()
-    mock_extractor.extract.return_value = {"data": "test"}
+    mock_extractor.extract_batches.return_value = iter([{"data": "test"}])
 
     # Create a mock transformer (non-None)
     mock_transformer = MagicMock()
     mock_transformer.transform.return_value = {"data": "transformed"}
 
-    # Create a mock loader with async load method
+    # Create a mock loader with async load_batch method
     mock_loader = MagicMock()
+    mock_loader.dataset_id = None
+    mock_loader._create_data_batches = lambda data: [data]
 
-    async def mock_load(data):
-        return None
+    async def mock_load_batch(client, batch):
+        return []
 
-    mock_loader.load = mock_load
+    mock_loader.load_batch = mock_load_batch
 
     # Create a job status
     job_status = job_status_database.create_status(mocked_job_dict)
@@ -262,3 +426,156 @@ async def test_run_pipeline_with_transformer(
     # Verify the job completed successfully
     updated_status = job_status_database.get_status(job_status.id)
     assert updated_status.status == JobStatusType.SUCCESS
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_profiled(
+    job_status_database: JobStatusDatabase,
+    profile_store: ProfileStore,
+    mocked_job_dict: dict[str, Any],
+    monkeypatch,
+):
+    save = profile_store.save
+    saved_from = []
+
+    def recording_save(job_id, profiler):
+        saved_from.append(threading.get_ident())
+        save(job_id, profiler)
+
+    monkeypatch.setattr(profile_store, "save", recording_save)
+    mock_extractor = MagicMock()
+    mock_extractor.incremental = False
+    mock_extractor.extract_batches.return_value = iter([[{"id": "1"}], [{"id": "2"}]])
+    mock_loader = MagicMock()
+    mock_loader.dataset_id = None
+    mock_loader._create_data_batches = lambda data: [data]
+
+    async def mock_load_batch(client, batch):
+        return []
+
+    mock_loader.load_batch = mock_load_batch
+
+    job_status = job_status_database.create_status(mocked_job_dict)
+    await run_pipeline(
+        job_status.id,
+        mock_extractor,
+        None,
+        mock_loader,
+        job_status_database,
+        profile=True,
+        profiles=profile_store,
+    )
+
+    assert job_status_database.get_status(job_status.id).status == (
+        JobStatusType.SUCCESS
+    )
+    with zipfile.ZipFile(profile_store.path(job_status.id)) as archive:
+        summary = json.loads(archive.read("summary.json"))
+        assert "stacks.folded" in archive.namelist()
+    assert set(summary["stages"]) == {"extract", "transform", "load"}
+    assert [snapshot["label"] for snapshot in summary["memory"]][0] == "start"
+    # The archive is written off the event loop
+    assert saved_from and saved_from[0] != threading.get_ident()
+
+
+def test_get_profile(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    profile_store: ProfileStore,
+    mocked_job_dict: dict[str, Any],
+):
+    status = job_status_database.create_status(mocked_job_dict)
+    assert test_client.get(f"/jobs/{status.id}/profile").status_code == 404
+
+    profile_store.save(status.id, JobProfiler())
+    response = test_client.get(f"/jobs/{status.id}/profile")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_incremental_watermark(
+    job_status_database: JobStatusDatabase,
+    mocked_job_dict: dict[str, Any],
+):
+    mock_extractor = MagicMock()
+    mock_extractor.incremental = True
+    mock_extractor.extract_batches.return_value = iter([])
+    mock_extractor.next_watermark.return_value = {"extracted_at": "2024-01-01"}
+    mock_loader = MagicMock()
+    mock_loader.dataset_id = None
+
+    job_status_database.set_watermark(
+        "some_pipeline", {"extracted_at": "2023-01-01"}, uuid.uuid4()
+    )
+    job_status = job_status_database.create_status(mocked_job_dict)
+    await run_pipeline(
+        job_status.id,
+        mock_extractor,
+        None,
+        mock_loader,
+        job_status_database,
+        pipeline_name="some_pipeline",
+    )
+
+    # The extractor received the previous watermark and its new one is stored
+    assert mock_extractor.watermark == {"extracted_at": "2023-01-01"}
+    assert job_status_database.get_watermark("some_pipeline") == {
+        "extracted_at": "2024-01-01"
+    }
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_failed_keeps_watermark(
+    job_status_database: JobStatusDatabase,
+    mocked_job_dict: dict[str, Any],
+):
+    mock_extractor = MagicMock()
+    mock_extractor.incremental = True
+    mock_extractor.extract_batches.side_effect = Exception("Extraction failed")
+    mock_extractor.next_watermark.return_value = {"extracted_at": "2024-01-01"}
+
+    job_status = job_status_database.create_status(mocked_job_dict)
+    await run_pipeline(
+        job_status.id,
+        mock_extractor,
+        None,
+        MagicMock(),
+        job_status_database,
+        pipeline_name="some_pipeline",
+    )
+
+    assert job_status_database.get_status(job_status.id).status == JobStatusType.ERROR
+    assert job_status_database.get_watermark("some_pipeline") is None
+
+
+def test_get_watermark(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+):
+    url = "/jobs/pipeline/some_pipeline/watermark"
+    assert test_client.get(url).status_code == 404
+
+    job_status_database.set_watermark("some_pipeline", {"etags": {}}, uuid.uuid4())
+    response = test_client.get(url)
+    assert response.status_code == 200
+    assert response.json() == {"etags": {}}
+
+
+def test_delete_watermark(
+    test_client: TestClient,
+    job_status_database: JobStatusDatabase,
+    mock_authz,
+):
+    url = "/jobs/pipeline/some_pipeline/watermark"
+    job_status_database.set_watermark("some_pipeline", {"etags": {}}, uuid.uuid4())
+
+    assert test_client.delete(url, headers=AUTHZ_HEADER).status_code == 200
+    assert test_client.get(url).status_code == 404
+
+
+def test_delete_watermark_not_found(test_client: TestClient, mock_authz):
+    response = test_client.delete(
+        "/jobs/pipeline/some_pipeline/watermark", headers=AUTHZ_HEADER
+    )
+    assert response.status_code == 404
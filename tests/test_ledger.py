@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+
+from bento_etl.ledger import LoadLedger, record_hash
+
+AUTHZ_HEADER = {"Authorization": "Token bearer"}
+
+
+def test_record_hash_ignores_key_order():
+    assert record_hash({"id": "1", "a": [1, 2]}) == record_hash(
+        {"a": [1, 2], "id": "1"}
+    )
+    assert record_hash({"id": "1", "a": [1, 2]}) != record_hash(
+        {"id": "1", "a": [2, 1]}
+    )
+
+
+def test_filter_loaded(logger, engine):
+    ledger = LoadLedger(logger, engine)
+    ledger.add_loaded("dataset", "phenopackets", [{"id": "1"}, {"id": "2"}])
+
+    records = [{"id": "1"}, {"id": "2", "changed": True}, {"id": "3"}, {"no_id": True}]
+    assert ledger.filter_loaded("dataset", "phenopackets", records) == records[1:]
+
+
+def test_filter_loaded_is_scoped_by_dataset_and_type(logger, engine):
+    ledger = LoadLedger(logger, engine)
+    ledger.add_loaded("dataset", "phenopackets", [{"id": "1"}])
+
+    records = [{"id": "1"}]
+    assert ledger.filter_loaded("other_dataset", "phenopackets", records) == records
+    assert ledger.filter_loaded("dataset", "experiments", records) == records
+
+
+def test_add_loaded_updates_hash(logger, engine):
+    ledger = LoadLedger(logger, engine)
+    ledger.add_loaded("dataset", "phenopackets", [{"id": "1"}])
+    ledger.add_loaded("dataset", "phenopackets", [{"id": "1", "changed": True}])
+
+    assert ledger.filter_loaded("dataset", "phenopackets", [{"id": "1"}]) == [
+        {"id": "1"}
+    ]
+    assert (
+        ledger.filter_loaded("dataset", "phenopackets", [{"id": "1", "changed": True}])
+        == []
+    )
+
+
+def test_add_loaded_many_records(logger, engine):
+    ledger = LoadLedger(logger, engine)
+    records = [{"id": str(i)} for i in range(1200)]
+    ledger.add_loaded("dataset", "phenopackets", records)
+    ledger.add_loaded("dataset", "phenopackets", records + [{"id": "new"}])
+
+    assert ledger.filter_loaded("dataset", "phenopackets", records) == []
+    assert ledger.clear("dataset") == 1201
+
+
+def test_clear(logger, engine):
+    ledger = LoadLedger(logger, engine)
+    ledger.add_loaded("dataset", "phenopackets", [{"id": "1"}, {"id": "2"}])
+    ledger.add_loaded("other_dataset", "phenopackets", [{"id": "1"}])
+
+    assert ledger.clear("dataset") == 2
+    assert ledger.filter_loaded("dataset", "phenopackets", [{"id": "1"}]) == [
+        {"id": "1"}
+    ]
+    assert ledger.filter_loaded("other_dataset", "phenopackets", [{"id": "1"}]) == []
+
+
+def test_clear_dataset_ledger_endpoint(
+    test_client: TestClient, job_status_database, logger, mock_authz
+):
+    LoadLedger(logger, job_status_database.engine).add_loaded(
+        "dataset", "phenopackets", [{"id": "1"}]
+    )
+    response = test_client.delete("/ledger/dataset", headers=AUTHZ_HEADER)
+    assert response.status_code == 200
+    assert "Cleared 1" in response.json()["message"]
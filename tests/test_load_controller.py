@@ -0,0 +1,209 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from bento_etl.config import Config
+from bento_etl.load_controller import (
+    CircuitOpenError,
+    LoadController,
+    TargetController,
+    parse_retry_after,
+)
+from bento_etl.loaders.base import BaseLoader, LoadError
+
+URL = "http://katsu.local/ingest/dataset/phenopackets_json"
+
+
+@pytest.fixture
+def control_config(config: Config) -> Config:
+    return config.model_copy(
+        update={
+            "load_min_concurrency": 1,
+            "load_max_concurrency": 4,
+            "load_latency_threshold": 0.05,
+            "load_throttle_pause": 0.01,
+            "load_breaker_failures": 2,
+            "load_breaker_cooldown": 0.05,
+            "load_breaker_max_wait": 1.0,
+        }
+    )
+
+
+@pytest.fixture
+def target(logger, control_config) -> TargetController:
+    return LoadController(logger, control_config).target(URL)
+
+
+async def respond(target: TargetController, status_code: int, headers=None):
+    async with target.slot() as slot:
+        slot.record(httpx.Response(status_code, headers=headers))
+    return slot
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 28 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+
+
+def test_targets_by_host(logger, control_config):
+    controller = LoadController(logger, control_config)
+    other_dataset = "http://katsu.local/ingest/other/experiments_json"
+    assert controller.target(URL) is controller.target(other_dataset)
+    assert controller.target(URL) is not controller.target("http://drs.local/ingest")
+
+
+class TestAimd:
+    @pytest.mark.asyncio
+    async def test_throttling_decreases_once_per_round(self, target):
+        # Two uploads sent before the target started throttling
+        first = await target._acquire()
+        second = await target._acquire()
+        for slot in (first, second):
+            slot.status_code = 429
+            target._release(slot, False)
+        assert target.limit == 2
+
+        await asyncio.sleep(0.01)
+        await respond(target, 503)
+        assert target.limit == 1
+
+    @pytest.mark.asyncio
+    async def test_additive_increase(self, target):
+        target.limit = 1
+        for _ in range(3):
+            await respond(target, 204)
+        # One more upload per round of uploads
+        assert 2 < target.limit < 3
+
+        for _ in range(20):
+            await respond(target, 204)
+        assert target.limit == 4
+
+    @pytest.mark.asyncio
+    async def test_slow_responses_decrease(self, target):
+        async with target.slot() as slot:
+            await asyncio.sleep(0.06)
+            slot.record(httpx.Response(204))
+        assert target.limit == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, target):
+        target.limit = 2
+        running = 0
+        max_running = 0
+
+        async def upload():
+            nonlocal running, max_running
+            async with target.slot() as slot:
+                running += 1
+                max_running = max(max_running, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                slot.record(httpx.Response(204))
+
+        await asyncio.gather(*(upload() for _ in range(6)))
+        assert max_running == 2
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_uploads(self, target):
+        await respond(target, 429, {"Retry-After": "0.1"})
+        start = asyncio.get_running_loop().time()
+        await respond(target, 204)
+        assert asyncio.get_running_loop().time() - start >= 0.09
+
+
+class TestCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_opens_and_resumes(self, target):
+        await respond(target, 500)
+        assert not target.circuit_open
+        await respond(target, 502)
+        assert target.circuit_open
+
+        # Uploads wait for the cooldown, the first one is the probe which closes the circuit
+        start = asyncio.get_running_loop().time()
+        slot = await respond(target, 204)
+        assert slot.probe
+        assert asyncio.get_running_loop().time() - start >= 0.04
+        assert not target.circuit_open
+
+    @pytest.mark.asyncio
+    async def test_failed_probe_reopens(self, target):
+        for _ in range(2):
+            await respond(target, 500)
+        opened_at = target.opened_at
+
+        async def failing():
+            async with target.slot():
+                raise httpx.ConnectError("Connection refused")
+
+        with pytest.raises(httpx.ConnectError):
+            await failing()
+        assert target.opened_at > opened_at
+
+    @pytest.mark.asyncio
+    async def test_max_wait(self, logger, control_config):
+        config = control_config.model_copy(
+            update={"load_breaker_cooldown": 10, "load_breaker_max_wait": 0.05}
+        )
+        target = LoadController(logger, config).target(URL)
+        for _ in range(2):
+            await respond(target, 500)
+        with pytest.raises(CircuitOpenError):
+            await respond(target, 204)
+
+
+@pytest.mark.asyncio
+async def test_loader_retries_throttled_uploads(logger, control_config, monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(204),
+    ]
+    sent = []
+
+    async def mock_post(*args, **kwargs):
+        sent.append(kwargs["json"])
+        return responses.pop(0)
+
+    monkeypatch.setattr("bento_etl.loaders.base.httpx.AsyncClient.post", mock_post)
+    loader = BaseLoader(logger, control_config, URL, "katsu", 204)
+    async with loader.client() as client:
+        assert await loader.load_batch(client, [{"id": "1"}]) == []
+    assert len(sent) == 3
+    # Cut twice, then raised by the successful upload
+    assert loader.controller.target(URL).limit == 2
+
+
+@pytest.mark.asyncio
+async def test_loader_circuit_open(logger, control_config, monkeypatch):
+    async def mock_post(*args, **kwargs):
+        return httpx.Response(500)
+
+    monkeypatch.setattr("bento_etl.loaders.base.httpx.AsyncClient.post", mock_post)
+    config = control_config.model_copy(
+        update={"load_breaker_cooldown": 10, "load_breaker_max_wait": 0.05}
+    )
+    loader = BaseLoader(logger, config, URL, "katsu", 204)
+    async with loader.client() as client:
+        for _ in range(2):
+            with pytest.raises(LoadError, match="500"):
+                await loader.load_batch(client, [{"id": "1"}])
+        with pytest.raises(LoadError, match="circuit is open"):
+            await loader.load_batch(client, [{"id": "1"}])
+
+
+@pytest.mark.asyncio
+async def test_disabled(logger, control_config):
+    controller = LoadController(
+        logger, control_config.model_copy(update={"load_control_enabled": False})
+    )
+    async with controller.slot(URL) as slot:
+        slot.record(httpx.Response(429))
+    assert controller._targets == {}
@@ -1,13 +1,20 @@
 import asyncio
+import json
 import uuid
 import httpx
 import pytest
 from unittest.mock import MagicMock
-from bento_etl.loaders.base import BaseLoader
+from bento_etl.loaders.base import (
+    BaseLoader,
+    LoadError,
+    PartialLoadError,
+    stream_json,
+)
 from bento_etl.loaders.dependencies import get_loader
 from bento_etl.loaders.experiments_loader import ExperimentsLoader
 from bento_etl.loaders.phenopackets_loader import PhenopacketsLoader
 from bento_etl.models import Job, LoadStep, TransformStep, ApiFetchExtractStep
+from tests.conftest import LOADER_POST_REQUEST_PATH
 
 
 async def mock_long_task():
@@ -113,6 +120,213 @@ class TestBaseLoader:
         await asyncio.sleep(0.5)  # Sleep a bit to allow for the cancels to take affect
         assert all(request.done() for request in requests)
 
+    @pytest.mark.asyncio
+    async def test_load_batch_valid(self, logger, config, mock_loader_valid_post):
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        async with loader.client() as client:
+            assert await loader.load_batch(client, [{"id": "1"}]) == []
+
+    @pytest.mark.asyncio
+    async def test_load_batch_bisects_rejected_batch(
+        self, logger, config, mock_loader_poison_record_post
+    ):
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        batch = [{"id": str(i)} for i in range(8)]
+        batch[2] = batch[3] = {"id": "poison"}
+
+        async with loader.client() as client:
+            rejected = await loader.load_batch(client, batch)
+
+        assert [r.record for r in rejected] == [{"id": "poison"}, {"id": "poison"}]
+        assert "400" in rejected[0].reasons[0]
+        loaded = [
+            record for upload in mock_loader_poison_record_post for record in upload
+        ]
+        assert sorted(loaded, key=lambda r: int(r["id"])) == [
+            r for r in batch if r["id"] != "poison"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_load_batch_all_rejected_raises(
+        self, logger, config, mock_loader_invalid_post
+    ):
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        async with loader.client() as client:
+            with pytest.raises(LoadError, match="400"):
+                await loader.load_batch(client, [{"id": "1"}, {"id": "2"}])
+
+    @pytest.mark.asyncio
+    async def test_load_batch_all_parts_rejected_raises(
+        self, logger, config, mock_loader_poison_record_post, monkeypatch
+    ):
+        posts = []
+        post = httpx.AsyncClient.post
+
+        async def counting_post(*args, **kwargs):
+            posts.append(kwargs["json"])
+            return await post(*args, **kwargs)
+
+        monkeypatch.setattr(LOADER_POST_REQUEST_PATH, counting_post)
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        # E.g. an unknown dataset, every record is rejected
+        batch = [{"id": "poison"} for _ in range(512)]
+
+        async with loader.client() as client:
+            with pytest.raises(LoadError, match="400"):
+                await loader.load_batch(client, batch)
+
+        # The batch and its bisections, instead of a request per record
+        assert len(posts) <= 1 + config.load_bisect_max_requests
+
+    @pytest.mark.asyncio
+    async def test_load_batch_bisects_rejected_halves(
+        self, logger, config, mock_loader_poison_record_post
+    ):
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        batch = [{"id": str(i)} for i in range(8)]
+        # One rejected record in each half
+        batch[1] = batch[6] = {"id": "poison"}
+
+        async with loader.client() as client:
+            rejected = await loader.load_batch(client, batch)
+
+        assert [r.record for r in rejected] == [{"id": "poison"}, {"id": "poison"}]
+        loaded = [
+            record for upload in mock_loader_poison_record_post for record in upload
+        ]
+        assert sorted(loaded, key=lambda r: int(r["id"])) == [
+            r for r in batch if r["id"] != "poison"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_load_batch_failure_while_bisecting(
+        self, logger, config, mock_loader_poison_record_post, monkeypatch
+    ):
+        post = httpx.AsyncClient.post
+
+        async def unavailable_post(*args, **kwargs):
+            ids = {record["id"] for record in kwargs["json"]}
+            if "unavailable" in ids and "poison" not in ids:
+                return httpx.Response(503)
+            return await post(*args, **kwargs)
+
+        monkeypatch.setattr(LOADER_POST_REQUEST_PATH, unavailable_post)
+        config = config.model_copy(update={"load_throttle_pause": 0})
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        batch = [{"id": str(i)} for i in range(8)]
+        batch[4] = {"id": "poison"}
+        batch[7] = {"id": "unavailable"}
+
+        async with loader.client() as client:
+            with pytest.raises(PartialLoadError, match="503") as e:
+                await loader.load_batch(client, batch)
+
+        # The first half was loaded before a quarter of the second one failed
+        assert e.value.loaded == batch[:4]
+        assert e.value.rejected == []
+        assert e.value.unsent == batch[4:]
+        assert mock_loader_poison_record_post == [batch[:4]]
+
+    @pytest.mark.asyncio
+    async def test_load_batch_bisection_max_requests(
+        self, logger, config, mock_loader_poison_record_post
+    ):
+        config = config.model_copy(update={"load_bisect_max_requests": 4})
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        batch = [{"id": str(i)} for i in range(16)]
+        batch[0] = {"id": "poison"}
+
+        async with loader.client() as client:
+            rejected = await loader.load_batch(client, batch)
+
+        # Halves of 8, then of 4: the rejected quarter is not bisected further
+        assert [r.record for r in rejected] == batch[:4]
+        assert "LOAD_BISECT_MAX_REQUESTS" in rejected[0].reasons[0]
+        loaded = [
+            record for upload in mock_loader_poison_record_post for record in upload
+        ]
+        assert sorted(loaded, key=lambda r: int(r["id"])) == batch[4:]
+
+    @pytest.mark.asyncio
+    async def test_load_batch_server_error_raises(self, logger, config, monkeypatch):
+        async def mock_server_error_post(*args, **kwargs):
+            return httpx.Response(503)
+
+        monkeypatch.setattr(
+            "bento_etl.loaders.base.httpx.AsyncClient.post", mock_server_error_post
+        )
+        # Retried without pause, until the retries are exhausted
+        config = config.model_copy(update={"load_throttle_pause": 0})
+        loader = BaseLoader(logger, config, "some_url", "some_service", 204)
+        async with loader.client() as client:
+            with pytest.raises(LoadError, match="503"):
+                await loader.load_batch(client, [{"id": "1"}, {"id": "2"}])
+
+
+class TestStreamedUploads:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "value",
+        [
+            [{"id": str(i), "name": "é" * i, "values": [i, None]} for i in range(2000)],
+            {"experiments": [{"id": "1"}, {"id": "2"}], "resources": [], "extra": 1.5},
+            [],
+        ],
+    )
+    async def test_stream_json(self, value):
+        sent = [0]
+        chunks = [chunk async for chunk in stream_json(value, sent)]
+        body = httpx.Request("POST", "http://katsu.local", json=value).read()
+        # Same body as a `json=` request, sent in bounded chunks
+        assert b"".join(chunks) == body
+        assert sent[0] == len(body)
+        assert all(len(chunk) < 2 * 64 * 1024 for chunk in chunks)
+
+    @pytest.mark.asyncio
+    async def test_large_uploads_are_streamed(
+        self, logger, config, load_experiment_data
+    ):
+        requests = []
+
+        async def handler(request: httpx.Request):
+            await request.aread()
+            requests.append(request)
+            return httpx.Response(204)
+
+        config = config.model_copy(update={"load_stream_min_records": 2})
+        loader = ExperimentsLoader(logger, config, uuid.uuid4())
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await loader.load_batch(client, load_experiment_data)
+            await loader.load_batch(
+                client, {**load_experiment_data, "experiments": [{"id": "1"}]}
+            )
+
+        streamed, small = requests
+        assert streamed.headers["Transfer-Encoding"] == "chunked"
+        assert streamed.headers["Content-Type"] == "application/json"
+        assert json.loads(streamed.content) == load_experiment_data
+        assert small.headers["Content-Length"] == str(len(small.content))
+
+    @pytest.mark.asyncio
+    async def test_batched_uploads_are_not_streamed(
+        self, logger, config, load_experiment_data
+    ):
+        requests = []
+
+        async def handler(request: httpx.Request):
+            await request.aread()
+            requests.append(request)
+            return httpx.Response(204)
+
+        config = config.model_copy(update={"load_stream_min_records": 2})
+        loader = ExperimentsLoader(logger, config, uuid.uuid4(), batch_size=20)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await loader.load_batch(client, load_experiment_data)
+
+        (request,) = requests
+        assert "Transfer-Encoding" not in request.headers
+        assert request.headers["Content-Length"] == str(len(request.content))
+
 
 class TestPhenopacketsLoader:
     def test_constructor_invalid_dataset_id(self, logger, config):
@@ -175,6 +389,25 @@ class TestExperimentsLoader:
         assert len(batches) == 1
         assert batches[0] == load_experiment_data
 
+    @pytest.mark.asyncio
+    async def test_load_batch_bisects_experiments(
+        self, logger, config, load_experiment_data, mock_loader_poison_record_post
+    ):
+        loader = ExperimentsLoader(logger, config, uuid.uuid4())
+        batch = {
+            "experiments": load_experiment_data["experiments"] + [{"id": "poison"}],
+            "resources": load_experiment_data["resources"],
+        }
+        async with loader.client() as client:
+            rejected = await loader.load_batch(client, batch)
+
+        assert [r.record for r in rejected] == [{"id": "poison"}]
+        # Resources are sent with every bisected upload
+        assert all(
+            upload["resources"] == load_experiment_data["resources"]
+            for upload in mock_loader_poison_record_post
+        )
+
     @pytest.mark.asyncio
     async def test_valid_load_no_batches(
         self, logger, config, load_experiment_data, mock_loader_valid_post
@@ -1,5 +1,10 @@
+import subprocess
+import sys
+
 from fastapi.testclient import TestClient
 
+from benchmarks.startup import HEAVY_MODULES
+
 AUTHZ_HEADER = {"Authorization": "Token bearer"}
 
 
@@ -25,3 +30,17 @@ def test_openapi_docs_available(test_client: TestClient):
     """Test that OpenAPI docs are available."""
     response = test_client.get("/docs")
     assert response.status_code == 200
+
+
+def test_startup_does_not_import_heavy_backends():
+    """Test that building the app leaves the heavy backends to the jobs that use them."""
+    code = "import sys, bento_etl.main; bento_etl.main.create_app(); print(' '.join(sys.modules))"
+    # A fresh interpreter, the tests' process has imported everything already
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    modules = set(result.stdout.split())
+    assert "bento_etl.routers.jobs" in modules
+    assert not modules & set(HEAVY_MODULES)
+    # OpenTelemetry is only imported when tracing is configured
+    assert "opentelemetry" not in modules
@@ -0,0 +1,549 @@
+import asyncio
+import threading
+import polars as pl
+from contextlib import asynccontextmanager
+from typing import Any
+import pytest
+
+from bento_etl.db import JobStatusDatabase
+from bento_etl.dead_letter import DeadLetterStore
+from bento_etl.extractors.dead_letter_extractor import DeadLetterExtractor
+from bento_etl.ledger import LoadLedger
+from bento_etl.loaders.base import PartialLoadError
+from bento_etl.loaders.experiments_loader import ExperimentsLoader
+from bento_etl.extractors.base import BaseExtractor
+from bento_etl.models import BatchStage, JobStatusType, RejectedRecord
+from bento_etl.pipeline import (
+    FanOutPipeline,
+    PipelineBranch,
+    PipelineProgress,
+    StreamingPipeline,
+)
+from bento_etl.validators.experiments_validator import ExperimentsValidator
+from bento_etl.validators.phenopackets_validator import PhenopacketsValidator
+
+
+class ListExtractor(BaseExtractor):
+    def __init__(self, logger, batches: list):
+        self.batches = batches
+        self.extracted = 0
+        super().__init__(logger)
+
+    def extract_batches(self):
+        for batch in self.batches:
+            self.extracted += 1
+            yield batch
+
+
+class BlockingTransformer:
+    """
+    Blocks its thread on the transform of the second batch until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.transformed = 0
+
+    def transform(self, data):
+        self.transformed += 1
+        if self.transformed == 2 and not self.release.wait(timeout=2):
+            raise Exception("Transform of the second batch was never released")
+        return data
+
+
+class RecordingLoader:
+    dataset_id = "some_dataset_id"
+    data_type = "phenopackets"
+    skip_loaded_records = True
+
+    def __init__(self, fail_on: Any = None, delay: float = 0):
+        self.loaded = []
+        self.fail_on = fail_on
+        self.delay = delay
+
+    @asynccontextmanager
+    async def client(self):
+        yield None
+
+    def _create_data_batches(self, data):
+        return [data]
+
+    def _batch_records(self, batch):
+        return batch
+
+    def _replace_batch_records(self, batch, records):
+        return records
+
+    def _dead_letter_payloads(self, batch, rejected):
+        return [([r.record for r in rejected], rejected)]
+
+    async def load_batch(self, client, batch):
+        await asyncio.sleep(self.delay)
+        if batch == self.fail_on:
+            raise Exception("Upload to katsu failed")
+        self.loaded.append(batch)
+        return []
+
+
+def make_pipeline(
+    job_status_database, logger, mocked_job_dict, extractor, loader, **kwargs
+):
+    job_id = job_status_database.create_status(mocked_job_dict).id
+    return StreamingPipeline(
+        job_id, extractor, None, loader, job_status_database, logger, **kwargs
+    )
+
+
+class TestPipelineProgress:
+    def test_as_dict(self):
+        progress = PipelineProgress()
+        progress.set_stage(0, BatchStage.LOADING)
+        progress.set_stage(1, BatchStage.TRANSFORMING)
+        progress.complete(0)
+
+        assert progress.as_dict() == {
+            "queue_depths": {"transform": 0, "load": 0},
+            "active_batches": {"1": "transforming"},
+            "completed_batches": 1,
+            "rejected_records": 0,
+            "failed_uploads": 0,
+            "skipped_records": 0,
+        }
+
+
+class TestStreamingPipeline:
+    def test_constructor_invalid_queue_size(
+        self, logger, job_status_database, mocked_job_dict
+    ):
+        with pytest.raises(ValueError):
+            make_pipeline(
+                job_status_database,
+                logger,
+                mocked_job_dict,
+                ListExtractor(logger, []),
+                RecordingLoader(),
+                queue_size=0,
+            )
+
+    @pytest.mark.asyncio
+    async def test_run_loads_all_batches(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        batches = [[{"id": i}] for i in range(10)]
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, batches),
+            loader,
+            queue_size=2,
+        )
+        await pipeline.run()
+
+        assert sorted(loader.loaded, key=lambda b: b[0]["id"]) == batches
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.status == JobStatusType.LOADING
+        assert status.progress["completed_batches"] == 10
+        assert status.progress["active_batches"] == {}
+
+    @pytest.mark.asyncio
+    async def test_run_applies_backpressure(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        extractor = ListExtractor(logger, [[{"id": i}] for i in range(20)])
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            extractor,
+            RecordingLoader(delay=0.05),
+            queue_size=1,
+            load_concurrency=1,
+        )
+        task = asyncio.create_task(pipeline.run())
+        await asyncio.sleep(0.2)
+
+        # A slow loader blocks the extractor after a few batches in flight
+        assert extractor.extracted < 10
+        await task
+        assert extractor.extracted == 20
+
+    @pytest.mark.asyncio
+    async def test_run_loads_while_transforming(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        transformer = BlockingTransformer()
+
+        class ReleasingLoader(RecordingLoader):
+            async def load_batch(self, client, batch):
+                # The first upload waits for the transform of the second batch, which waits for the upload
+                while transformer.transformed < 2:
+                    await asyncio.sleep(0.01)
+                transformer.release.set()
+                return await super().load_batch(client, batch)
+
+        loader = ReleasingLoader()
+        job_id = job_status_database.create_status(mocked_job_dict).id
+        pipeline = StreamingPipeline(
+            job_id,
+            ListExtractor(logger, [[{"id": 0}], [{"id": 1}]]),
+            transformer,
+            loader,
+            job_status_database,
+            logger,
+        )
+        await pipeline.run()
+        assert sorted(loader.loaded, key=lambda b: b[0]["id"]) == [
+            [{"id": 0}],
+            [{"id": 1}],
+        ]
+
+    @pytest.mark.asyncio
+    async def test_run_failed_load_raises(
+        self,
+        logger,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        dead_letter_store: DeadLetterStore,
+    ):
+        batches = [[{"id": i}] for i in range(5)]
+        loader = RecordingLoader(fail_on=batches[2])
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, batches),
+            loader,
+            dead_letters=dead_letter_store,
+        )
+        with pytest.raises(Exception, match="Upload to katsu failed"):
+            await pipeline.run()
+
+        # Other batches are still loaded, the failed one is dead-lettered
+        assert len(loader.loaded) == 4
+        entries = list(dead_letter_store.entries(pipeline.job_id))
+        assert len(entries) == 1
+        assert entries[0]["stage"] == "load"
+        assert entries[0]["payload"] == batches[2]
+
+    @pytest.mark.asyncio
+    async def test_run_dead_letters_invalid_records(
+        self,
+        logger,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        load_phenopacket_data,
+        dead_letter_store: DeadLetterStore,
+    ):
+        invalid = {"id": "invalid-phenopacket"}
+        other_invalid = {"id": "other-invalid-phenopacket"}
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(
+                logger, [load_phenopacket_data + [invalid, other_invalid], [invalid]]
+            ),
+            loader,
+            validator=PhenopacketsValidator(logger),
+            dead_letters=dead_letter_store,
+        )
+        await pipeline.run()
+
+        # Valid records keep flowing, batches without valid records are not uploaded
+        assert loader.loaded == [load_phenopacket_data]
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.progress["rejected_records"] == 3
+        assert status.progress["completed_batches"] == 2
+        # One dead letter per batch, with the reasons of each record
+        entries = list(dead_letter_store.entries(pipeline.job_id))
+        assert [e["payload"] for e in entries] == [[invalid, other_invalid], [invalid]]
+        assert all(e["stage"] == "validation" for e in entries)
+        assert entries[0]["reasons"][0].startswith("invalid-phenopacket: ")
+        assert entries[0]["reasons"][-1].startswith("other-invalid-phenopacket: ")
+
+    @pytest.mark.asyncio
+    async def test_redrive_rejected_resource(
+        self,
+        logger,
+        config,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        load_experiment_data,
+        dead_letter_store: DeadLetterStore,
+        mock_loader_poison_record_post,
+    ):
+        invalid_resource = {"id": "BAD:1", "name": "No namespace prefix"}
+        referring = {
+            "id": "referring-experiment",
+            "experiment_type": "Other",
+            "experiment_ontology": [{"id": "BAD:0001", "label": "Bad term"}],
+        }
+        batch = {
+            "experiments": load_experiment_data["experiments"] + [referring],
+            "resources": load_experiment_data["resources"] + [invalid_resource],
+        }
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, [batch]),
+            ExperimentsLoader(logger, config, "some_dataset_id"),
+            validator=ExperimentsValidator(logger),
+            dead_letters=dead_letter_store,
+        )
+        await pipeline.run()
+
+        # The experiment referring to the invalid resource is held back with it
+        assert mock_loader_poison_record_post == [load_experiment_data]
+        payloads = [e["payload"] for e in dead_letter_store.entries(pipeline.job_id)]
+        assert payloads == [
+            {"experiments": [], "resources": [invalid_resource]},
+            {"experiments": [referring], "resources": batch["resources"]},
+        ]
+
+        # Re-driven without validation, e.g. once Katsu accepts the resource
+        mock_loader_poison_record_post.clear()
+        redrive = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            DeadLetterExtractor(logger, dead_letter_store, pipeline.job_id),
+            ExperimentsLoader(logger, config, "some_dataset_id"),
+        )
+        await redrive.run()
+        assert mock_loader_poison_record_post == payloads
+
+    @pytest.mark.asyncio
+    async def test_run_skips_loaded_records(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        ledger = LoadLedger(logger, job_status_database.engine)
+        batches = [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]]
+
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, batches),
+            loader,
+            ledger=ledger,
+        )
+        await pipeline.run()
+        assert sorted(loader.loaded, key=lambda b: b[0]["id"]) == batches
+
+        # Re-run with one changed record and one new record
+        batches = [
+            [{"id": "1"}, {"id": "2", "changed": True}],
+            [{"id": "3"}, {"id": "4"}],
+        ]
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, batches),
+            loader,
+            ledger=ledger,
+        )
+        await pipeline.run()
+        assert sorted(loader.loaded, key=lambda b: b[0]["id"]) == [
+            [{"id": "2", "changed": True}],
+            [{"id": "4"}],
+        ]
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.progress["skipped_records"] == 2
+
+    @pytest.mark.asyncio
+    async def test_run_ledger_failure_keeps_upload(
+        self,
+        logger,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        dead_letter_store: DeadLetterStore,
+    ):
+        class FailingLedger(LoadLedger):
+            def add_loaded(self, dataset_id, data_type, records):
+                raise RuntimeError("ledger unavailable")
+
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, [[{"id": "1"}]]),
+            loader,
+            ledger=FailingLedger(logger, job_status_database.engine),
+            dead_letters=dead_letter_store,
+        )
+        await pipeline.run()
+
+        # The records were loaded, they are neither counted as a failed upload nor dead-lettered
+        assert loader.loaded == [[{"id": "1"}]]
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.progress["failed_uploads"] == 0
+        assert not dead_letter_store.exists(pipeline.job_id)
+
+    @pytest.mark.asyncio
+    async def test_run_partial_load_dead_letters_unsent_records(
+        self,
+        logger,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        dead_letter_store: DeadLetterStore,
+    ):
+        batch = [{"id": str(i)} for i in range(4)]
+
+        class PartiallyFailingLoader(RecordingLoader):
+            async def load_batch(self, client, batch):
+                rejected = [RejectedRecord(record=batch[1], reasons=["invalid"])]
+                raise PartialLoadError(
+                    "Upload to katsu failed", [batch[0]], rejected, batch[2:]
+                )
+
+        ledger = LoadLedger(logger, job_status_database.engine)
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, [batch]),
+            PartiallyFailingLoader(),
+            ledger=ledger,
+            dead_letters=dead_letter_store,
+        )
+        with pytest.raises(Exception, match="Upload to katsu failed"):
+            await pipeline.run()
+
+        # The loaded record is recorded in the ledger and not re-driven
+        entries = list(dead_letter_store.entries(pipeline.job_id))
+        assert [(e["stage"], e["payload"]) for e in entries] == [
+            ("load", batch[2:]),
+            ("load", [batch[1]]),
+        ]
+        changed = ledger.filter_loaded("some_dataset_id", "phenopackets", batch)
+        assert changed == batch[1:]
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.progress["failed_uploads"] == 1
+        assert status.progress["rejected_records"] == 1
+
+    @pytest.mark.asyncio
+    async def test_run_converts_columnar_batches(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        loader = RecordingLoader()
+        pipeline = make_pipeline(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, [pl.DataFrame({"id": ["1", "2"]})]),
+            loader,
+        )
+        await pipeline.run()
+        assert loader.loaded == [[{"id": "1"}, {"id": "2"}]]
+
+
+class TestFanOutPipeline:
+    def make_fan_out(
+        self, job_status_database, logger, mocked_job_dict, extractor, loaders, **kwargs
+    ):
+        job_id = job_status_database.create_status(mocked_job_dict).id
+        branches = [
+            PipelineBranch(name, None, loader) for name, loader in loaders.items()
+        ]
+        return FanOutPipeline(
+            job_id, extractor, branches, job_status_database, logger, **kwargs
+        )
+
+    def test_constructor_no_branches(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        with pytest.raises(ValueError):
+            self.make_fan_out(
+                job_status_database,
+                logger,
+                mocked_job_dict,
+                ListExtractor(logger, []),
+                {},
+            )
+
+    @pytest.mark.asyncio
+    async def test_run_extracts_once_for_all_branches(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        batches = [[{"id": i}] for i in range(10)]
+        extractor = ListExtractor(logger, batches)
+        loaders = {"phenopackets": RecordingLoader(), "experiments": RecordingLoader()}
+        pipeline = self.make_fan_out(
+            job_status_database, logger, mocked_job_dict, extractor, loaders
+        )
+        await pipeline.run()
+
+        assert extractor.extracted == 10
+        for loader in loaders.values():
+            assert sorted(loader.loaded, key=lambda b: b[0]["id"]) == batches
+
+        status = job_status_database.get_status(pipeline.job_id)
+        assert status.status == JobStatusType.LOADING
+        for name in loaders:
+            branch = status.progress["branches"][name]
+            assert branch["status"] == "success"
+            assert branch["completed_batches"] == 10
+
+    @pytest.mark.asyncio
+    async def test_run_branches_progress_independently(
+        self, logger, job_status_database: JobStatusDatabase, mocked_job_dict
+    ):
+        extractor = ListExtractor(logger, [[{"id": i}] for i in range(20)])
+        fast, slow = RecordingLoader(), RecordingLoader(delay=0.05)
+        pipeline = self.make_fan_out(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            extractor,
+            {"fast": fast, "slow": slow},
+            queue_size=1,
+            load_concurrency=1,
+        )
+        task = asyncio.create_task(pipeline.run())
+        await asyncio.sleep(0.2)
+
+        # The slow branch holds back the extraction, but not the fast branch's loads
+        assert extractor.extracted < 10
+        assert len(fast.loaded) > len(slow.loaded)
+        await task
+        assert len(fast.loaded) == len(slow.loaded) == 20
+
+    @pytest.mark.asyncio
+    async def test_run_failed_branch_raises(
+        self,
+        logger,
+        job_status_database: JobStatusDatabase,
+        mocked_job_dict,
+        dead_letter_store: DeadLetterStore,
+    ):
+        batches = [[{"id": i}] for i in range(5)]
+        loaders = {"ok": RecordingLoader(), "failing": RecordingLoader(batches[2])}
+        pipeline = self.make_fan_out(
+            job_status_database,
+            logger,
+            mocked_job_dict,
+            ListExtractor(logger, batches),
+            loaders,
+            dead_letters=dead_letter_store,
+        )
+        with pytest.raises(Exception, match="failing: 1 upload"):
+            await pipeline.run()
+
+        # The other branch loaded everything, the failed upload is dead-lettered with its branch
+        assert len(loaders["ok"].loaded) == 5
+        assert len(loaders["failing"].loaded) == 4
+        entries = list(dead_letter_store.entries(pipeline.job_id))
+        assert [(e["branch"], e["payload"]) for e in entries] == [
+            ("failing", batches[2])
+        ]
+        progress = job_status_database.get_status(pipeline.job_id).progress
+        assert progress["branches"]["ok"]["status"] == "success"
+        assert progress["branches"]["failing"]["status"] == "error"
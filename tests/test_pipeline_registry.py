@@ -0,0 +1,85 @@
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+from bento_etl.config import Config
+from bento_etl.pipeline_registry import PipelineRegistry
+
+PIPELINE = {
+    "extractor": {"extract_url": "some_url", "type": "api-fetch"},
+    "transformer": {"type": "None"},
+    "loader": {"dataset_id": "some_dataset_id", "batch_size": 0, "data_type": "print"},
+}
+
+
+def write_pipeline(directory, name: str, content: dict | str, mtime_ns: int):
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, "w") as f:
+        f.write(content if isinstance(content, str) else json.dumps(content))
+    # Explicit modification times, file systems can have a coarse mtime resolution
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def registry(logger, config: Config, tmp_path) -> PipelineRegistry:
+    write_pipeline(tmp_path, "valid", PIPELINE, 1)
+    write_pipeline(tmp_path, "malformed", "{", 1)
+    config = config.model_copy(update={"pipelines_dir": str(tmp_path)})
+    return PipelineRegistry(logger, config)
+
+
+class TestPipelineRegistry:
+    def test_definitions(self, registry: PipelineRegistry):
+        definitions = registry.definitions()
+        assert [d.name for d in definitions] == ["malformed", "valid"]
+        assert definitions[0].job is None and definitions[0].error
+        # Pipelines are named after their file
+        assert definitions[1].job.name == "valid"
+        assert list(registry.errors()) == ["malformed"]
+        assert list(registry.jobs()) == ["valid"]
+
+    def test_get(self, registry: PipelineRegistry):
+        job = registry.get("valid")
+        assert job.loader.data_type == "print"
+
+        # Returned jobs are copies of the cached ones
+        job.name = "modified"
+        assert registry.get("valid").name == "valid"
+
+        with pytest.raises(ValueError, match="malformed"):
+            registry.get("malformed")
+        with pytest.raises(KeyError):
+            registry.get("not_a_pipeline")
+
+    def test_reload_changed_files(self, registry: PipelineRegistry, monkeypatch):
+        registry.reload()
+        loaded = []
+        load = registry._load
+        monkeypatch.setattr(
+            registry, "_load", lambda name: loaded.append(name) or load(name)
+        )
+
+        # Unchanged files are not read again
+        registry.get("valid")
+        assert loaded == []
+
+        write_pipeline(registry.directory, "malformed", PIPELINE, 2)
+        write_pipeline(registry.directory, "new", PIPELINE, 1)
+        os.remove(os.path.join(registry.directory, "valid.json"))
+
+        assert sorted(registry.jobs()) == ["malformed", "new"]
+        assert sorted(loaded) == ["malformed", "new"]
+        assert registry.errors() == {}
+
+    def test_missing_directory(self, logger, config: Config, tmp_path):
+        config = config.model_copy(update={"pipelines_dir": str(tmp_path / "none")})
+        assert PipelineRegistry(logger, config).definitions() == []
+
+
+def test_list_pipelines(test_client: TestClient):
+    response = test_client.get("/pipelines")
+    assert response.status_code == 200
+    pipelines = {p["name"]: p for p in response.json()}
+    assert pipelines["test_phenopackets"]["job"]["name"] == "test_phenopackets"
+    assert pipelines["test_phenopackets"]["error"] is None
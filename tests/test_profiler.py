@@ -0,0 +1,108 @@
+import json
+import threading
+import tracemalloc
+import uuid
+import zipfile
+
+from bento_etl.profiler import JobProfiler, ProfileStore
+
+
+def extract_batches(event: threading.Event):
+    # Named like the extractors' method, its frames are attributed to the extract stage
+    event.wait()
+
+
+def sample_from_thread(profiler: JobProfiler):
+    # The sampler never samples its own thread
+    thread = threading.Thread(target=profiler.sample)
+    thread.start()
+    thread.join()
+
+
+def test_samples_attributed_to_stages():
+    profiler = JobProfiler()
+    profiler.start()
+    event = threading.Event()
+    extraction = threading.Thread(target=extract_batches, args=(event,))
+    extraction.start()
+    try:
+        sample_from_thread(profiler)
+    finally:
+        event.set()
+        extraction.join()
+        profiler.stop()
+
+    stacks = profiler.collapsed_stacks().splitlines()
+    assert any(
+        line.startswith("extract;")
+        and "extract_batches (tests/test_profiler.py" in line
+        for line in stacks
+    )
+    # The thread that started the profiler is the event loop thread, sampled even outside of stages
+    assert any(line.startswith("idle;") for line in stacks)
+    for line in stacks:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) >= 1
+
+    summary = profiler.summary()
+    assert summary["samples"]["extract"] >= 1
+    assert summary["samples"]["idle"] >= 1
+
+
+def test_stage_durations_and_memory():
+    profiler = JobProfiler()
+    profiler.start()
+    profiler.stage_started("transform")
+    profiler.stage_started("load")
+    profiler.stage_started("load")
+    profiler.stage_finished("transform")
+    profiler.stage_finished("load")
+    # Still one load worker running
+    assert "duration" not in profiler.stages["load"]
+    data = [bytearray(1024) for _ in range(100)]
+    profiler.stage_finished("load")
+    profiler.stop()
+
+    assert profiler.stages["transform"]["duration"] >= 0
+    assert profiler.stages["load"]["duration"] >= 0
+    labels = [snapshot["label"] for snapshot in profiler.memory]
+    assert labels == ["start", "transform finished", "load finished", "end"]
+    assert profiler.memory[2]["traced_peak"] > 0
+    # Allocation sites are only compared at the end of the job, off the event loop
+    assert profiler.memory[2]["top_allocations"] == []
+    assert any(
+        "test_profiler.py" in allocation["location"]
+        for allocation in profiler.memory[3]["top_allocations"]
+    )
+    assert not tracemalloc.is_tracing()
+    del data
+
+
+def test_tracing_left_on_when_started_elsewhere():
+    tracemalloc.start()
+    try:
+        profiler = JobProfiler()
+        profiler.start()
+        profiler.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_store(profile_store: ProfileStore):
+    job_id = uuid.uuid4()
+    assert not profile_store.exists(job_id)
+
+    profiler = JobProfiler()
+    profiler.stacks["load;main;upload"] = 3
+    profile_store.save(job_id, profiler)
+    assert profile_store.exists(job_id)
+
+    with zipfile.ZipFile(profile_store.path(job_id)) as archive:
+        assert archive.read("stacks.folded").decode() == "load;main;upload 3\n"
+        summary = json.loads(archive.read("summary.json"))
+    assert summary["samples"] == {"load": 3}
+
+    profile_store.delete(job_id)
+    assert not profile_store.exists(job_id)
+    profile_store.delete(job_id)  # no-op when absent
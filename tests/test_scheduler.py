@@ -0,0 +1,196 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+import pytest
+import pytest_asyncio
+
+from bento_etl.config import Config
+from bento_etl.db import JobStatusDatabase
+from bento_etl.models import JobStatusType, Schedule
+from bento_etl.pipeline_registry import PipelineRegistry
+from bento_etl.scheduler import PipelineScheduler
+
+SCHEDULED_JOB = {
+    "extractor": {"extract_url": "some_url", "type": "api-fetch", "incremental": True},
+    "transformer": {"type": "None"},
+    "loader": {"dataset_id": "some_dataset_id", "batch_size": 0, "data_type": "print"},
+    "schedule": {"cron": "0 * * * *"},
+}
+
+NOW = datetime(2024, 1, 1, 12, 30)
+
+
+@pytest.fixture
+def pipelines_dir(tmp_path):
+    with open(tmp_path / "hourly.json", "w") as f:
+        json.dump(SCHEDULED_JOB, f)
+    with open(tmp_path / "manual.json", "w") as f:
+        json.dump({k: v for k, v in SCHEDULED_JOB.items() if k != "schedule"}, f)
+    with open(tmp_path / "malformed.json", "w") as f:
+        f.write("{")
+    return tmp_path
+
+
+@pytest.fixture
+def scheduler(
+    logger, config: Config, job_status_database, dead_letter_store, pipelines_dir
+):
+    config = config.model_copy(update={"pipelines_dir": str(pipelines_dir)})
+    return PipelineScheduler(
+        logger,
+        config,
+        job_status_database,
+        dead_letter_store,
+        PipelineRegistry(logger, config),
+    )
+
+
+@pytest_asyncio.fixture
+async def runs(monkeypatch, scheduler: PipelineScheduler):
+    # Scheduled runs stay running until the end of the test
+    runs = []
+    done = asyncio.Event()
+
+    async def mock_run_pipeline(job_id, *args, **kwargs):
+        runs.append((job_id, args[-1]))
+        await done.wait()
+
+    monkeypatch.setattr("bento_etl.scheduler.run_pipeline", mock_run_pipeline)
+    yield runs
+    done.set()
+    await asyncio.gather(*(t for tasks in scheduler._runs.values() for t in tasks))
+
+
+class TestPipelineScheduler:
+    @pytest.mark.asyncio
+    async def test_new_schedule_waits_next_occurrence(
+        self, scheduler: PipelineScheduler, job_status_database: JobStatusDatabase
+    ):
+        assert scheduler.tick(NOW) == []
+
+        schedule = job_status_database.get_schedule("hourly")
+        assert schedule.next_run_at == datetime(2024, 1, 1, 13, 0)
+        assert job_status_database.get_schedule("manual") is None
+
+    @pytest.mark.asyncio
+    async def test_due_pipeline_runs(
+        self,
+        scheduler: PipelineScheduler,
+        job_status_database: JobStatusDatabase,
+        runs: list,
+    ):
+        scheduler.tick(NOW)
+        started = scheduler.tick(NOW + timedelta(minutes=31))
+        await asyncio.sleep(0)
+
+        # Scheduled jobs are named after their pipeline, for incremental extractions
+        assert len(started) == 1
+        assert runs == [(started[0], "hourly")]
+        schedule = job_status_database.get_schedule("hourly")
+        assert schedule.last_job_id == started[0]
+        assert schedule.next_run_at == datetime(2024, 1, 1, 14, 0)
+
+    @pytest.mark.asyncio
+    async def test_missed_runs_are_coalesced(
+        self, scheduler: PipelineScheduler, runs: list
+    ):
+        scheduler.tick(NOW)
+        # Service was down for a day, a single run catches up
+        assert len(scheduler.tick(NOW + timedelta(days=1))) == 1
+        assert scheduler.tick(NOW + timedelta(days=1, minutes=1)) == []
+
+    @pytest.mark.asyncio
+    async def test_skips_if_running(self, scheduler: PipelineScheduler, runs: list):
+        scheduler.tick(NOW)
+        assert len(scheduler.tick(NOW + timedelta(hours=1))) == 1
+        await asyncio.sleep(0)
+
+        # The first run is still running, the next occurrence is skipped
+        assert scheduler.tick(NOW + timedelta(hours=2)) == []
+        assert len(runs) == 1
+
+    @pytest.mark.asyncio
+    async def test_queued_runs(
+        self,
+        scheduler: PipelineScheduler,
+        job_status_database: JobStatusDatabase,
+        runs: list,
+    ):
+        scheduler.config = scheduler.config.model_copy(
+            update={"job_queue_enabled": True}
+        )
+        scheduler.tick(NOW)
+        (job_id,) = scheduler.tick(NOW + timedelta(hours=1))
+        # Left to the workers
+        assert runs == []
+        assert job_status_database.get_status(job_id).queue_key == "some_dataset_id"
+
+        # Skipped until the queued run is finished
+        assert scheduler.tick(NOW + timedelta(hours=2)) == []
+        job_status_database.update_status(job_id, JobStatusType.SUCCESS)
+        assert len(scheduler.tick(NOW + timedelta(hours=3))) == 1
+
+    @pytest.mark.asyncio
+    async def test_replicas_start_run_once(
+        self,
+        monkeypatch,
+        scheduler: PipelineScheduler,
+        job_status_database: JobStatusDatabase,
+        runs: list,
+    ):
+        replica = PipelineScheduler(
+            scheduler.logger,
+            scheduler.config,
+            job_status_database,
+            scheduler.dead_letters,
+            scheduler.pipelines,
+        )
+        scheduler.tick(NOW)
+        assert replica.tick(NOW) == []
+
+        # Both replicas see the due run, the first claiming it starts it
+        entry = job_status_database.get_schedule("hourly")
+        monkeypatch.setattr(
+            job_status_database, "get_schedule", lambda name: entry.model_copy()
+        )
+        assert len(scheduler.tick(NOW + timedelta(hours=1))) == 1
+        assert replica.tick(NOW + timedelta(hours=1)) == []
+        await asyncio.sleep(0)
+        assert len(runs) == 1
+
+    @pytest.mark.asyncio
+    async def test_skips_if_running_on_other_replica(
+        self,
+        scheduler: PipelineScheduler,
+        job_status_database: JobStatusDatabase,
+        runs: list,
+    ):
+        replica = PipelineScheduler(
+            scheduler.logger,
+            scheduler.config,
+            job_status_database,
+            scheduler.dead_letters,
+            scheduler.pipelines,
+        )
+        scheduler.tick(NOW)
+        (job_id,) = scheduler.tick(NOW + timedelta(hours=1))
+        await asyncio.sleep(0)
+
+        # The replica claims the next occurrence while the first run is still running
+        assert replica.tick(NOW + timedelta(hours=2)) == []
+        assert len(runs) == 1
+
+        job_status_database.update_status(job_id, JobStatusType.SUCCESS)
+        assert len(replica.tick(NOW + timedelta(hours=3))) == 1
+
+    def test_jitter(self, scheduler: PipelineScheduler):
+        schedule = Schedule(cron="0 * * * *", jitter_seconds=60)
+        next_run_at = scheduler._next_run_at(schedule, NOW)
+        assert datetime(2024, 1, 1, 13, 0) <= next_run_at <= datetime(2024, 1, 1, 13, 1)
+
+    @pytest.mark.asyncio
+    async def test_start_stop(self, scheduler: PipelineScheduler):
+        scheduler.start()
+        await asyncio.sleep(0)
+        await scheduler.stop()
+        assert scheduler._task is None
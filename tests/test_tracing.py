@@ -0,0 +1,158 @@
+import json
+
+import httpx
+import pytest
+
+from bento_etl import tracing
+from bento_etl.loaders.base import BaseLoader
+from bento_etl.pipeline import StreamingPipeline
+from bento_etl.routers.jobs import run_pipeline
+from bento_etl.tracing import configure_tracing, inject_trace_context, span
+from tests.test_pipeline import ListExtractor, RecordingLoader
+
+in_memory = pytest.importorskip(
+    "opentelemetry.sdk.trace.export.in_memory_span_exporter"
+)
+
+
+@pytest.fixture
+def span_exporter(config, logger):
+    exporter = in_memory.InMemorySpanExporter()
+    assert configure_tracing(config, logger, exporter)
+    yield exporter
+    tracing.shutdown_tracing()
+
+
+def finished_spans(exporter) -> list:
+    # Exports the spans still waiting in the batch processor first
+    tracing.shutdown_tracing()
+    return list(exporter.get_finished_spans())
+
+
+def test_disabled(config, logger):
+    assert not configure_tracing(config, logger)
+    with span("etl.job", {"etl.job.id": "1"}) as noop_span:
+        noop_span.set_attribute("etl.records", 1)
+        assert not noop_span.is_recording()
+    assert inject_trace_context({"a": "b"}) == {"a": "b"}
+
+
+def test_unsupported_exporter(config, logger):
+    with pytest.raises(ValueError):
+        configure_tracing(
+            config.model_copy(update={"otel_traces_exporter": "zipkin"}), logger
+        )
+
+
+def test_file_exporter(config, logger, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    file_config = config.model_copy(
+        update={"otel_traces_exporter": "file", "otel_traces_file": str(path)}
+    )
+    assert configure_tracing(file_config, logger)
+    traces_file = tracing._traces_file
+    with span("etl.job", {"etl.job.id": "1"}):
+        with span("etl.stage extract"):
+            pass
+    tracing.shutdown_tracing()
+    assert traces_file.closed
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [s["name"] for s in spans] == ["etl.stage extract", "etl.job"]
+    assert spans[1]["attributes"] == {"etl.job.id": "1"}
+
+
+def test_span_records_errors(span_exporter):
+    with pytest.raises(ValueError):
+        with span("etl.extract.file", current=False):
+            raise ValueError("unreadable file")
+
+    (failed,) = finished_spans(span_exporter)
+    assert not failed.status.is_ok
+    assert failed.events[0].name == "exception"
+
+
+def test_inject_trace_context(span_exporter):
+    with span("etl.job") as job_span:
+        headers = inject_trace_context({})
+    trace_id = format(job_span.get_span_context().trace_id, "032x")
+    assert trace_id in headers["traceparent"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_spans(
+    span_exporter, job_status_database, logger, mocked_job_dict
+):
+    job_id = job_status_database.create_status(mocked_job_dict).id
+    extractor = ListExtractor(logger, [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]])
+    await run_pipeline(job_id, extractor, None, RecordingLoader(), job_status_database)
+
+    exported = finished_spans(span_exporter)
+    by_name = {}
+    for exported_span in exported:
+        by_name.setdefault(exported_span.name, []).append(exported_span)
+
+    job_span = by_name["etl.job"][0]
+    assert job_span.attributes["etl.job.id"] == str(job_id)
+    assert {s.name for s in exported} >= {
+        "etl.stage extract",
+        "etl.stage transform",
+        "etl.stage load",
+        "etl.extract.batch",
+        "etl.transform.batch",
+    }
+    # Every span belongs to the job's trace
+    assert {s.context.trace_id for s in exported} == {job_span.context.trace_id}
+    extracted = sorted(
+        s.attributes.get("etl.records", 0) for s in by_name["etl.extract.batch"]
+    )
+    assert extracted == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_load_spans_and_propagation(
+    span_exporter, job_status_database, logger, config, mocked_job_dict, monkeypatch
+):
+    sent_headers = []
+
+    async def mock_poison_post(*args, **kwargs):
+        sent_headers.append(kwargs["headers"])
+        if any(record["id"] == "poison" for record in kwargs["json"]):
+            return httpx.Response(400)
+        return httpx.Response(204)
+
+    monkeypatch.setattr(
+        "bento_etl.loaders.base.httpx.AsyncClient.post", mock_poison_post
+    )
+    loader = BaseLoader(logger, config, "http://katsu.local/ingest", "katsu", 204)
+    job_id = job_status_database.create_status(mocked_job_dict).id
+    pipeline = StreamingPipeline(
+        job_id,
+        ListExtractor(logger, [[{"id": "1"}, {"id": "poison"}]]),
+        None,
+        loader,
+        job_status_database,
+        logger,
+    )
+    await pipeline.run()
+    exported = finished_spans(span_exporter)
+
+    batch_span = next(s for s in exported if s.name == "etl.load.batch")
+    assert batch_span.attributes["etl.records"] == 2
+    assert batch_span.attributes["etl.records.rejected"] == 1
+    # The rejected batch, then both of its halves
+    assert batch_span.attributes["etl.load.requests"] == 3
+    assert batch_span.attributes["etl.load.retries"] == 2
+
+    requests = [s for s in exported if s.name == "POST"]
+    assert len(requests) == 3
+    assert sorted(s.attributes["http.response.status_code"] for s in requests) == [
+        204,
+        400,
+        400,
+    ]
+    assert all(s.parent.span_id == batch_span.context.span_id for s in requests)
+
+    # Katsu receives the context of each request's span
+    sent_span_ids = {headers["traceparent"].split("-")[2] for headers in sent_headers}
+    assert sent_span_ids == {format(s.context.span_id, "016x") for s in requests}
@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+
+from bento_etl.config import Config, TransportProfile
+from bento_etl.loaders.base import BaseLoader
+from bento_etl.transport import ClientPool
+
+URL = "http://katsu.local/ingest/dataset/phenopackets_json"
+
+
+@pytest.fixture
+def transport_config(config: Config) -> Config:
+    return config.model_copy(
+        update={
+            "load_transport": TransportProfile(read_timeout=None),
+            "load_transport_profiles": (
+                TransportProfile(host="katsu.local", read_timeout=600, http2=True),
+            ),
+        }
+    )
+
+
+def test_profiles_by_host(logger, transport_config):
+    pool = ClientPool(logger, transport_config)
+    assert pool.profile(URL).read_timeout == 600
+    assert pool.profile("http://drs.local/ingest").read_timeout is None
+
+
+@pytest.mark.asyncio
+async def test_clients_shared_by_target(logger, transport_config):
+    pool = ClientPool(logger, transport_config)
+    client = pool.client(URL)
+    assert pool.client("http://katsu.local/ingest/other/experiments_json") is client
+    assert pool.client("http://drs.local/ingest") is not client
+    assert client.timeout.read == 600
+    assert client.timeout.connect == 10
+
+    await pool.aclose()
+    assert client.is_closed
+    # A new client once closed
+    assert pool.client(URL) is not client
+    await pool.aclose()
+
+
+def test_clients_per_event_loop(logger, transport_config):
+    pool = ClientPool(logger, transport_config)
+
+    async def get_client():
+        return pool.client(URL)
+
+    assert asyncio.run(get_client()) is not asyncio.run(get_client())
+
+
+@pytest.mark.asyncio
+async def test_http2_without_h2(logger, transport_config, monkeypatch):
+    monkeypatch.setattr("bento_etl.transport.importlib.util.find_spec", lambda _: None)
+    pool = ClientPool(logger, transport_config)
+    # Falls back to HTTP/1.1 instead of failing every upload
+    assert isinstance(pool.client(URL), httpx.AsyncClient)
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_loaders_share_connections(logger, config, monkeypatch):
+    sent = []
+
+    async def mock_post(client, url, **kwargs):
+        sent.append((client, kwargs["headers"]))
+        return httpx.Response(204)
+
+    monkeypatch.setattr("bento_etl.loaders.base.httpx.AsyncClient.post", mock_post)
+    pool = ClientPool(logger, config)
+    # Two jobs loading into different datasets of the same Katsu
+    for dataset in ("first", "second"):
+        loader = BaseLoader(
+            logger,
+            config,
+            f"http://katsu.local/ingest/{dataset}",
+            "katsu",
+            204,
+            clients=pool,
+        )
+        async with loader.client() as client:
+            await loader.load_batch(client, [{"id": "1"}])
+
+    assert sent[0][0] is sent[1][0]
+    assert all(headers["Authorization"] == "MockedToken" for _, headers in sent)
+    await pool.aclose()
@@ -0,0 +1,135 @@
+import copy
+import pytest
+from unittest.mock import MagicMock
+
+from bento_etl.models import Job, LoadStep, TransformStep, ApiFetchExtractStep
+from bento_etl.validators.base import BaseValidator
+from bento_etl.validators.dependencies import get_validator
+from bento_etl.validators.experiments_validator import ExperimentsValidator
+from bento_etl.validators.phenopackets_validator import PhenopacketsValidator
+
+
+def mock_job_with_loader(data_type: str, skip_validation: bool = False):
+    return Job(
+        extractor=ApiFetchExtractStep(extract_url="some_url", type="api-fetch"),
+        transformer=TransformStep(type="None"),
+        loader=LoadStep(
+            dataset_id="some_id",
+            batch_size=0,
+            data_type=data_type,
+            skip_validation=skip_validation,
+        ),
+    )
+
+
+class TestValidatorDependencies:
+    def test_get_validator_phenopackets(self, logger):
+        validator = get_validator(mock_job_with_loader("phenopackets"), logger)
+        assert type(validator) is PhenopacketsValidator
+
+    def test_get_validator_experiments(self, logger):
+        validator = get_validator(mock_job_with_loader("experiments"), logger)
+        assert type(validator) is ExperimentsValidator
+
+    def test_get_validator_print(self, logger):
+        assert get_validator(mock_job_with_loader("print"), logger) is None
+
+    def test_get_validator_skip_validation(self, logger):
+        job = mock_job_with_loader("phenopackets", skip_validation=True)
+        assert get_validator(job, logger) is None
+
+    def test_get_validator_invalid_type(self, logger):
+        job = MagicMock()
+        job.loader.skip_validation = False
+        job.loader.data_type = "invalid-type"
+
+        with pytest.raises(NotImplementedError):
+            get_validator(job, logger)
+
+
+class TestBaseValidator:
+    def test_validate_raises_not_implemented(self, logger):
+        with pytest.raises(NotImplementedError):
+            BaseValidator(logger).validate([])
+
+
+class TestPhenopacketsValidator:
+    def test_validate_valid(self, logger, load_phenopacket_data):
+        valid, rejected = PhenopacketsValidator(logger).validate(load_phenopacket_data)
+        assert valid == load_phenopacket_data
+        assert rejected == []
+
+    def test_validate_rejects_invalid_records(self, logger, load_phenopacket_data):
+        data = copy.deepcopy(load_phenopacket_data)
+        del data[1]["subject"]
+        data[3]["subject"]["sex"] = "NOT_A_SEX"
+
+        valid, rejected = PhenopacketsValidator(logger).validate(data)
+        assert len(valid) == 4
+        assert [r.record["id"] for r in rejected] == [data[1]["id"], data[3]["id"]]
+        assert "'subject' is a required property" in rejected[0].reasons[0]
+        assert rejected[1].reasons[0].startswith("subject/sex:")
+
+    def test_validate_rejects_duplicate_ids(self, logger, load_phenopacket_data):
+        data = load_phenopacket_data + [load_phenopacket_data[0]]
+
+        valid, rejected = PhenopacketsValidator(logger).validate(data)
+        assert valid == load_phenopacket_data
+        assert len(rejected) == 1
+        assert "Duplicate id" in rejected[0].reasons[0]
+
+    def test_validate_all_invalid(self, logger):
+        valid, rejected = PhenopacketsValidator(logger).validate([{"id": ""}])
+        assert valid is None
+        assert len(rejected) == 1
+
+    def test_validate_not_a_list(self, logger):
+        valid, rejected = PhenopacketsValidator(logger).validate("BAD_DATA")
+        assert valid is None
+        assert rejected[0].record == "BAD_DATA"
+
+
+class TestExperimentsValidator:
+    def test_validate_valid(self, logger, load_experiment_data):
+        valid, rejected = ExperimentsValidator(logger).validate(load_experiment_data)
+        assert valid == load_experiment_data
+        assert rejected == []
+
+    def test_validate_rejects_invalid_experiments(self, logger, load_experiment_data):
+        data = copy.deepcopy(load_experiment_data)
+        del data["experiments"][0]["experiment_type"]
+
+        valid, rejected = ExperimentsValidator(logger).validate(data)
+        assert len(valid["experiments"]) == len(data["experiments"]) - 1
+        assert valid["resources"] == data["resources"]
+        assert rejected[0].record == data["experiments"][0]
+
+    def test_validate_rejects_experiments_of_invalid_resource(
+        self, logger, load_experiment_data
+    ):
+        data = copy.deepcopy(load_experiment_data)
+        # Referred to by the molecule ontology terms of some experiments
+        del data["resources"][1]["namespace_prefix"]
+
+        valid, rejected = ExperimentsValidator(logger).validate(data)
+        assert valid["resources"] == data["resources"][:1]
+        assert len(valid["experiments"]) == len(data["experiments"]) - 2
+        assert rejected[0].record == data["resources"][1]
+        assert rejected[0].kind == "resource"
+        assert [r.kind for r in rejected[1:]] == ["experiment", "experiment"]
+        assert all(
+            r.record["molecule_ontology"][0]["id"].startswith("EFO:")
+            for r in rejected[1:]
+        )
+        assert "rejected resource(s) ['EFO']" in rejected[1].reasons[0]
+
+    def test_validate_resources_only(self, logger, load_experiment_data):
+        data = {"experiments": [], "resources": load_experiment_data["resources"]}
+        valid, rejected = ExperimentsValidator(logger).validate(data)
+        assert valid == data
+        assert rejected == []
+
+    def test_validate_missing_experiments(self, logger):
+        valid, rejected = ExperimentsValidator(logger).validate({"resources": []})
+        assert valid is None
+        assert len(rejected) == 1
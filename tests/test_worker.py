@@ -0,0 +1,448 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from pydantic import ValidationError
+from sqlmodel import Session, create_engine
+from fastapi.testclient import TestClient
+
+from bento_etl.config import Config, get_config
+from bento_etl.db import JobStatusDatabase
+from bento_etl.models import Job, JobStatus, JobStatusType
+from bento_etl.routers.jobs import enqueue_job
+from bento_etl.worker import JobWorker
+from tests.conftest import app
+
+
+def queued_job(dataset_id: str, path: str = "synthetic_phenopackets_v2.jsonl"):
+    return {
+        "extractor": {"path": path},
+        "transformer": {"type": "None"},
+        "loader": {"dataset_id": dataset_id, "batch_size": 10, "data_type": "print"},
+    }
+
+
+@pytest.fixture
+def queue_config(config: Config) -> Config:
+    return config.model_copy(
+        update={
+            "job_queue_enabled": True,
+            "local_extract_dir": "tests/data",
+            "worker_concurrency": 2,
+            "job_max_concurrency_per_target": 2,
+        }
+    )
+
+
+@pytest.fixture
+def make_worker(
+    logger, queue_config, job_status_database, dead_letter_store, profile_store
+):
+    def make(worker_id: str, **config) -> JobWorker:
+        return JobWorker(
+            logger,
+            queue_config.model_copy(update=config),
+            job_status_database,
+            dead_letter_store,
+            profile_store,
+            worker_id,
+        )
+
+    return make
+
+
+@pytest_asyncio.fixture
+async def runs(monkeypatch):
+    # Claimed jobs stay running until the end of the test, unless cancelled
+    runs = []
+    done = asyncio.Event()
+
+    async def mock_run_pipeline(job_id, *args, **kwargs):
+        runs.append(job_id)
+        await done.wait()
+
+    monkeypatch.setattr("bento_etl.worker.run_pipeline", mock_run_pipeline)
+    yield runs
+    done.set()
+
+
+def enqueue(db: JobStatusDatabase, dataset_id: str):
+    return db.create_status(queued_job(dataset_id), dataset_id).id
+
+
+class TestClaims:
+    @pytest.mark.asyncio
+    async def test_fair_between_datasets(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        busy = [enqueue(job_status_database, "busy") for _ in range(3)]
+        quiet = enqueue(job_status_database, "quiet")
+        # Not queued, run by the API process
+        job_status_database.create_status(queued_job("busy"))
+
+        worker = make_worker("worker-1", worker_concurrency=3)
+        # The quiet dataset does not wait behind the busy one
+        assert worker.claim() == [busy[0], quiet, busy[1]]
+        await asyncio.sleep(0)
+        assert runs == [busy[0], quiet, busy[1]]
+
+        status = job_status_database.get_status(quiet)
+        assert status.worker_id == "worker-1"
+        assert status.attempts == 1
+        assert status.lease_expires_at > datetime.now()
+
+    @pytest.mark.asyncio
+    async def test_limit_per_dataset(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        for _ in range(3):
+            enqueue(job_status_database, "busy")
+
+        first = make_worker("worker-1", job_max_concurrency_per_target=1)
+        second = make_worker("worker-2", job_max_concurrency_per_target=1)
+        # The limit is shared by all the workers
+        assert len(first.claim()) == 1
+        assert second.claim() == []
+
+    @pytest.mark.asyncio
+    async def test_limit_per_dataset_of_multi_dataset_jobs(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        both = job_status_database.create_status(queued_job("a"), "a,b").id
+        enqueue(job_status_database, "b")
+        other = enqueue(job_status_database, "c")
+
+        worker = make_worker("worker-1", job_max_concurrency_per_target=1)
+        # The job loading into "a" and "b" holds the only slot of "b"
+        assert worker.claim() == [both, other]
+
+    @pytest.mark.asyncio
+    async def test_jobs_claimed_once(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_ids = {enqueue(job_status_database, f"dataset-{i}") for i in range(3)}
+        first = make_worker("worker-1")
+        second = make_worker("worker-2")
+
+        claimed = first.claim() + second.claim() + first.claim()
+        assert sorted(claimed) == sorted(job_ids)
+        assert len(first.running) == 2
+        assert len(second.running) == 1
+
+    def test_concurrent_claims_across_connections(self, tmp_path, logger, config):
+        # Workers in different processes, each with its own connections to the same SQLite file
+        url = f"sqlite:///{tmp_path / 'queue.db'}"
+        databases = [
+            JobStatusDatabase(logger, config, create_engine(url)) for _ in range(4)
+        ]
+        databases[0].setup()
+        job_ids = {enqueue(databases[0], f"dataset-{i % 5}") for i in range(40)}
+
+        claims: dict[int, list] = {index: [] for index in range(len(databases))}
+
+        def claim_all(index: int):
+            while job := databases[index].claim_job(f"worker-{index}", 60, 100):
+                claims[index].append(job.id)
+
+        threads = [
+            threading.Thread(target=claim_all, args=(index,))
+            for index in range(len(databases))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [
+            job_id for worker_claims in claims.values() for job_id in worker_claims
+        ]
+        assert len(claimed) == len(set(claimed))
+        assert set(claimed) == job_ids
+        for db in databases:
+            db.engine.dispose()
+
+
+class TestLeases:
+    @pytest.mark.asyncio
+    async def test_expired_lease_is_claimed_again(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_id = enqueue(job_status_database, "dataset")
+        # The first worker stops sending heartbeats
+        crashed = make_worker("worker-1", worker_lease_seconds=0.01)
+        assert crashed.claim() == [job_id]
+        await asyncio.sleep(0.02)
+
+        recovering = make_worker("worker-2")
+        assert recovering.claim() == [job_id]
+        assert job_status_database.get_status(job_id).attempts == 2
+
+        # The first worker is back, its copy of the job is cancelled
+        crashed.heartbeat()
+        await asyncio.sleep(0.01)
+        assert crashed.running == []
+        assert recovering.running == [job_id]
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_renews_leases(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_id = enqueue(job_status_database, "dataset")
+        worker = make_worker("worker-1")
+        worker.claim()
+        lease = job_status_database.get_status(job_id).lease_expires_at
+
+        worker.heartbeat()
+        assert job_status_database.get_status(job_id).lease_expires_at > lease
+        assert make_worker("worker-2").claim() == []
+
+    @pytest.mark.asyncio
+    async def test_leases_renewed_while_loop_is_busy(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_id = enqueue(job_status_database, "dataset")
+        worker = make_worker(
+            "worker-1", worker_lease_seconds=0.2, worker_poll_interval=0.02
+        )
+        worker.start()
+        await asyncio.sleep(0.05)
+        assert worker.running == [job_id]
+
+        # A job's synchronous work keeps the event loop busy for longer than a lease
+        time.sleep(0.5)
+        assert make_worker("worker-2").claim() == []
+        await worker.stop()
+
+    @pytest.mark.asyncio
+    async def test_abandoned_job_fails(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_id = enqueue(job_status_database, "dataset")
+        for index in range(2):
+            worker = make_worker(
+                f"worker-{index}", worker_lease_seconds=0.01, worker_max_attempts=2
+            )
+            assert worker.claim() == [job_id]
+            await asyncio.sleep(0.02)
+
+        assert make_worker("worker-3", worker_max_attempts=2).claim() == []
+        status = job_status_database.get_status(job_id)
+        assert status.status == JobStatusType.ERROR
+        assert "abandoned after 2 attempts" in status.error_message
+
+    @pytest.mark.asyncio
+    async def test_stop_releases_jobs(
+        self, make_worker, job_status_database: JobStatusDatabase, runs: list
+    ):
+        job_id = enqueue(job_status_database, "dataset")
+        worker = make_worker("worker-1")
+        worker.start()
+        await asyncio.sleep(0.01)
+        assert worker.running == [job_id]
+
+        await worker.stop()
+        status = job_status_database.get_status(job_id)
+        assert status.worker_id is None
+        assert status.lease_expires_at is None
+        # Claimed right away by another worker
+        assert make_worker("worker-2").claim() == [job_id]
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_queued_jobs(make_worker, job_status_database):
+    job_ids = [enqueue(job_status_database, f"dataset-{i}") for i in range(3)]
+    worker = make_worker("worker-1", worker_poll_interval=0.01)
+    worker.start()
+    for _ in range(500):
+        if all(
+            job_status_database.get_status(job_id).status == JobStatusType.SUCCESS
+            for job_id in job_ids
+        ):
+            break
+        await asyncio.sleep(0.01)
+    await worker.stop()
+
+    for job_id in job_ids:
+        status = job_status_database.get_status(job_id)
+        assert status.status == JobStatusType.SUCCESS
+        assert status.progress["completed_batches"] == 1
+
+
+def test_submissions_are_queued(
+    test_client: TestClient, job_status_database, queue_config, mock_authz
+):
+    app.dependency_overrides[get_config] = lambda: queue_config
+    response = test_client.post("/jobs", json=queued_job("dataset"))
+    assert response.status_code == 200
+
+    bulk = test_client.post(
+        "/jobs/bulk", json=[queued_job("dataset"), queued_job("other")]
+    )
+    assert bulk.status_code == 200
+
+    statuses = job_status_database.get_all_status()
+    assert len(statuses) == 3
+    assert sorted(status.queue_key for status in statuses) == [
+        "dataset",
+        "dataset",
+        "other",
+    ]
+    # Left to the workers
+    assert all(status.status == JobStatusType.SUBMITTED for status in statuses)
+    assert all(status.worker_id is None for status in statuses)
+
+
+class TestShardedJobs:
+    def test_only_files_are_sharded(self):
+        with pytest.raises(ValidationError):
+            Job.model_validate({**queued_job("dataset"), "shards": 0})
+        with pytest.raises(ValidationError):
+            Job.model_validate(
+                {
+                    **queued_job("dataset"),
+                    "extractor": {"extract_url": "http://source.local/data"},
+                    "shards": 2,
+                }
+            )
+        with pytest.raises(ValidationError):
+            Job.model_validate(
+                {
+                    **queued_job("dataset"),
+                    "extractor": {"prefix": "data/", "incremental": True},
+                    "shards": 2,
+                }
+            )
+
+    def test_requires_job_queue(self, test_client: TestClient, config, mock_authz):
+        app.dependency_overrides[get_config] = lambda: config.model_copy(
+            update={"local_extract_dir": "tests/data"}
+        )
+        response = test_client.post(
+            "/jobs", json={**queued_job("dataset"), "shards": 2}
+        )
+        assert response.status_code == 400
+
+    def test_bulk_submissions_are_queued_at_once(
+        self,
+        monkeypatch,
+        test_client: TestClient,
+        job_status_database,
+        queue_config,
+        mock_authz,
+    ):
+        def no_extractor(*args):
+            raise AssertionError("Extractors are created by the workers")
+
+        monkeypatch.setattr("bento_etl.routers.jobs.get_extractor", no_extractor)
+        app.dependency_overrides[get_config] = lambda: queue_config
+        response = test_client.post(
+            "/jobs/bulk",
+            json=[{**queued_job("dataset"), "shards": 2}, queued_job("other")],
+        )
+        assert response.status_code == 200
+
+        sharded_id, other_id = map(uuid.UUID, response.json()["job_ids"])
+        assert [
+            shard.queue_key for shard in job_status_database.get_shards(sharded_id)
+        ] == ["dataset", "dataset"]
+        assert job_status_database.get_status(sharded_id).queue_key is None
+        assert job_status_database.get_status(other_id).queue_key == "other"
+        assert len(job_status_database.get_all_status()) == 4
+
+    @pytest.mark.asyncio
+    async def test_shards_run_in_parallel(self, make_worker, job_status_database):
+        job = Job.model_validate({**queued_job("dataset"), "shards": 3})
+        job_id = enqueue_job(job, job_status_database)
+        shards = job_status_database.get_shards(job_id)
+        assert [shard.job_data["extractor"]["shard"] for shard in shards] == [
+            {"index": index, "count": 3} for index in range(3)
+        ]
+        assert {shard.queue_key for shard in shards} == {"dataset"}
+
+        workers = [
+            make_worker(f"worker-{i}", worker_poll_interval=0.01, worker_concurrency=1)
+            for i in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in range(500):
+            if job_status_database.get_status(job_id).status == JobStatusType.SUCCESS:
+                break
+            await asyncio.sleep(0.01)
+        for worker in workers:
+            await worker.stop()
+
+        status = job_status_database.get_status(job_id)
+        assert status.status == JobStatusType.SUCCESS
+        assert status.progress["shards"] == {"success": 3}
+        assert status.progress["completed_batches"] == 3
+        # The shards ran on different workers, two at a time at most for the dataset
+        assert (
+            len({shard.worker_id for shard in job_status_database.get_shards(job_id)})
+            > 1
+        )
+
+    def test_shard_progress_is_merged_on_read(self, job_status_database):
+        job = Job.model_validate({**queued_job("dataset"), "shards": 2})
+        job_id = enqueue_job(job, job_status_database)
+        first, second = job_status_database.get_shards(job_id)
+
+        job_status_database.update_status(first.id, JobStatusType.LOADING)
+        job_status_database.update_progress(first.id, {"completed_batches": 2})
+        job_status_database.update_progress(second.id, {"completed_batches": 1})
+        # Running shards are not merged into the stored status of their job
+        with Session(job_status_database.engine) as session:
+            assert session.get(JobStatus, job_id).progress is None
+        status = job_status_database.get_status(job_id)
+        assert status.status == JobStatusType.LOADING
+        assert status.progress["completed_batches"] == 3
+        (listed,) = [
+            job for job in job_status_database.get_all_status() if job.id == job_id
+        ]
+        assert listed.progress == status.progress
+
+        # Finished shards are
+        job_status_database.update_status(first.id, JobStatusType.SUCCESS)
+        job_status_database.update_status(second.id, JobStatusType.SUCCESS)
+        with Session(job_status_database.engine) as session:
+            stored = session.get(JobStatus, job_id)
+            assert stored.status == JobStatusType.SUCCESS
+            assert stored.progress["completed_batches"] == 3
+
+    def test_failed_shards_are_retried(
+        self, test_client: TestClient, job_status_database, queue_config, mock_authz
+    ):
+        app.dependency_overrides[get_config] = lambda: queue_config
+        job = Job.model_validate({**queued_job("dataset"), "shards": 3})
+        job_id = enqueue_job(job, job_status_database)
+        first, second, third = job_status_database.get_shards(job_id)
+
+        job_status_database.update_status(first.id, JobStatusType.SUCCESS)
+        job_status_database.update_status(second.id, JobStatusType.LOADING)
+        assert job_status_database.get_status(job_id).status == JobStatusType.LOADING
+
+        job_status_database.update_status(
+            third.id, JobStatusType.ERROR, "Katsu is down"
+        )
+        job_status_database.update_status(second.id, JobStatusType.SUCCESS)
+        status = job_status_database.get_status(job_id)
+        assert status.status == JobStatusType.ERROR
+        assert status.error_message == "1 of 3 shards failed, shard 2: Katsu is down"
+
+        response = test_client.post(f"/jobs/{job_id}/shards/retry")
+        assert response.status_code == 200
+        assert response.json()["job_ids"] == [str(third.id)]
+        # Only the failed shard runs again
+        assert job_status_database.get_status(job_id).status == JobStatusType.SUBMITTED
+        shards = test_client.get(f"/jobs/{job_id}/shards").json()
+        assert [shard["status"] for shard in shards] == [
+            "success",
+            "success",
+            "submitted",
+        ]
+
+        assert test_client.post(f"/jobs/{job_id}/shards/retry").status_code == 400